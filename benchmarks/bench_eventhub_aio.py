@@ -0,0 +1,88 @@
+"""
+Compare publishing to several Event Hub topics with a threaded Eventhub
+client for each topic against AsyncEventhub clients on one event loop, using
+the in-process fake services.
+
+    python benchmarks/bench_eventhub_aio.py
+
+"""
+import time
+import asyncio
+import threading
+
+import predix.testing
+
+
+TOPICS = 8
+MESSAGES = 500
+
+
+def bench_threads():
+    """
+    Returns messages acknowledged per second and the threads running.
+    """
+    import predix.data.eventhub.client
+    from predix.data.eventhub.publisher import PublisherConfig
+
+    with predix.testing.FakePredix():
+        clients = [predix.data.eventhub.client.Eventhub(
+            publish_config=PublisherConfig(topic='topic%s' % (i),
+                async_auto_send=True, async_auto_send_interval_millis=10))
+            for i in range(TOPICS)]
+
+        start = time.time()
+        futures = []
+        for i in range(MESSAGES):
+            for client in clients:
+                futures.append(client.publisher.publish(str(i), b'x' * 256))
+        for future in futures:
+            future.result(60)
+        elapsed = time.time() - start
+        threads = threading.active_count()
+
+        for client in clients:
+            client.shutdown()
+
+    return (len(futures) / elapsed, threads)
+
+
+def bench_asyncio():
+    """
+    Returns messages acknowledged per second and the threads running.
+    """
+    import predix.data.eventhub.aio
+    from predix.data.eventhub.publisher import PublisherConfig
+
+    async def run():
+        clients = [predix.data.eventhub.aio.AsyncEventhub(
+            publish_config=PublisherConfig(topic='topic%s' % (i)))
+            for i in range(TOPICS)]
+
+        start = time.time()
+        futures = []
+        for i in range(MESSAGES):
+            for client in clients:
+                futures.append(client.publisher.publish(str(i), b'x' * 256))
+        await asyncio.gather(*futures)
+        elapsed = time.time() - start
+        threads = threading.active_count()
+
+        for client in clients:
+            await client.close()
+
+        return (len(futures) / elapsed, threads)
+
+    with predix.testing.FakePredix():
+        return asyncio.new_event_loop().run_until_complete(run())
+
+
+def main():
+    print("%-10s %14s %10s" % ('client', 'messages/sec', 'threads'))
+    for (name, bench) in [('threads', bench_threads),
+            ('asyncio', bench_asyncio)]:
+        (rate, threads) = bench()
+        print("%-10s %14.0f %10d" % (name, rate, threads))
+
+
+if __name__ == '__main__':
+    main()
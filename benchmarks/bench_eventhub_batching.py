@@ -0,0 +1,66 @@
+"""
+Compare auto sending Event Hub messages in batches of a fixed size with
+batches sized to the ack latency, against the in-process fake services with
+a round trip added to each publish request.
+
+    python benchmarks/bench_eventhub_batching.py
+
+"""
+import time
+
+import predix.testing
+
+
+MESSAGES = 2000
+LATENCY = 0.02
+
+
+def bench_batching(**kwargs):
+    """
+    Returns messages published per second, until every message has been
+    acknowledged, and the mean messages per request.
+    """
+    import predix.data.eventhub.client
+    from predix.data.eventhub.publisher import PublisherConfig
+
+    with predix.testing.FakePredix(latency=LATENCY):
+        config = PublisherConfig(async_auto_send=True,
+                async_auto_send_interval_millis=50, **kwargs)
+        eventhub = predix.data.eventhub.client.Eventhub(publish_config=config)
+        body = b'x' * 256
+
+        requests = []
+        send = eventhub.publisher._publish_queue_grpc
+
+        def count(messages):
+            requests.append(len(messages))
+            send(messages)
+
+        eventhub.publisher._publish_queue_grpc = count
+
+        start = time.time()
+        futures = [eventhub.publisher.publish(str(i), body)
+                for i in range(MESSAGES)]
+        for future in futures:
+            future.result(60)
+        elapsed = time.time() - start
+
+        eventhub.shutdown()
+
+    return (MESSAGES / elapsed, float(sum(requests)) / len(requests))
+
+
+def main():
+    print("%-24s %14s %14s" % ('batching', 'messages/sec', 'per request'))
+    for (name, kwargs) in [
+            ('fixed 10', {'async_auto_send_amount': 10}),
+            ('fixed 100', {'async_auto_send_amount': 100}),
+            ('adaptive up to 1000', {'async_auto_send_amount': 1000,
+                'async_auto_send_adaptive': True}),
+            ]:
+        (rate, size) = bench_batching(**kwargs)
+        print("%-24s %14.0f %14.1f" % (name, rate, size))
+
+
+if __name__ == '__main__':
+    main()
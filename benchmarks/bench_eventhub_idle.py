@@ -0,0 +1,80 @@
+"""
+Measure the CPU used by an idle Event Hub publisher and subscriber, and how
+quickly the subscriber wakes when a message is published, against the
+in-process fake services.
+
+    python benchmarks/bench_eventhub_idle.py
+
+"""
+import os
+import time
+import threading
+
+import predix.testing
+
+
+IDLE = 5
+
+
+def get_cpu():
+    """
+    Returns seconds of CPU used by every thread of the process.
+    """
+    times = os.times()
+    return times[0] + times[1]
+
+
+def consume(generator, received):
+    for item in generator:
+        received.append(time.time())
+
+
+def main():
+    import predix.data.eventhub.client
+    from predix.data.eventhub.publisher import PublisherConfig
+    from predix.data.eventhub.subscriber import SubscribeConfig
+
+    with predix.testing.FakePredix():
+        eventhub = predix.data.eventhub.client.Eventhub(
+                publish_config=PublisherConfig(async_auto_send=True,
+                    async_auto_send_amount=1),
+                subscribe_config=SubscribeConfig())
+
+        acks = []
+        messages = []
+        for (generator, received) in [
+                (eventhub.publisher.ack_generator(), acks),
+                (eventhub.subscriber.subscribe(), messages)]:
+            thread = threading.Thread(target=consume,
+                    args=(generator, received))
+            thread.daemon = True
+            thread.start()
+
+        # Let the streams open before measuring
+        time.sleep(1)
+        start = get_cpu()
+        time.sleep(IDLE)
+        idle = (get_cpu() - start) / IDLE * 100
+
+        latencies = []
+        for i in range(20):
+            count = len(messages)
+            sent = time.time()
+            eventhub.publisher.add_message(str(i), b'x')
+            while len(messages) == count and time.time() - sent < 5:
+                time.sleep(0.0005)
+            if len(messages) > count:
+                latencies.append((messages[-1] - sent) * 1000)
+
+        eventhub.shutdown()
+
+    latencies.sort()
+    print("%-28s %10.1f" % ('idle cpu %', idle))
+    if latencies:
+        print("%-28s %10.1f" % ('publish to receive ms p50',
+            latencies[len(latencies) // 2]))
+        print("%-28s %10.1f" % ('publish to receive ms max', latencies[-1]))
+
+
+if __name__ == '__main__':
+    main()
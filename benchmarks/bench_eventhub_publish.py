@@ -0,0 +1,51 @@
+"""
+Measure Event Hub publish throughput over gRPC against the in-process fake
+services, for publish types and batch sizes.
+
+    python benchmarks/bench_eventhub_publish.py
+
+"""
+import time
+
+import predix.testing
+
+
+def bench_publish(messages=1000, batch=100, publish_type='ASYNC'):
+    """
+    Returns messages published per second, until the service has all of
+    them, in batches of the given size.
+    """
+    import predix.data.eventhub.client
+    from predix.data.eventhub.publisher import PublisherConfig
+
+    with predix.testing.FakePredix() as fake:
+        config = PublisherConfig(publish_type=publish_type)
+        eventhub = predix.data.eventhub.client.Eventhub(publish_config=config)
+        body = b'x' * 256
+
+        start = time.time()
+        for i in range(0, messages, batch):
+            for j in range(i, i + batch):
+                eventhub.publisher.add_message(str(j), body)
+            eventhub.publisher.publish_queue()
+
+        topic = fake.ZONE_ID + '_topic'
+        while len(fake.eventhub.get(topic, [])) < messages:
+            time.sleep(0.001)
+        elapsed = time.time() - start
+
+        eventhub.shutdown()
+
+    return messages / elapsed
+
+
+def main():
+    print("%-8s %8s %14s" % ('type', 'batch', 'messages/sec'))
+    for publish_type in ['ASYNC', 'SYNC']:
+        for batch in [10, 100]:
+            print("%-8s %8s %14.0f" % (publish_type, batch,
+                bench_publish(batch=batch, publish_type=publish_type)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""
+Compare taking messages one at a time from the front of a list, as the Event
+Hub publisher used to, with the BoundedQueue that replaced it, as the backlog
+grows.
+
+    python benchmarks/bench_eventhub_queue.py
+
+"""
+import time
+
+from predix.data.eventhub.buffer import BoundedQueue
+
+
+SIZES = [1000, 10000, 100000]
+
+
+def bench_list(size):
+    queue = []
+    start = time.time()
+    for i in range(size):
+        queue.append(i)
+    while queue:
+        queue.pop(0)
+    return time.time() - start
+
+
+def bench_bounded(size):
+    queue = BoundedQueue(capacity=size)
+    start = time.time()
+    for i in range(size):
+        queue.put(i)
+    while len(queue):
+        queue.get()
+    return time.time() - start
+
+
+def main():
+    print("%-10s %14s %14s" % ('messages', 'list ms', 'bounded ms'))
+    for size in SIZES:
+        print("%-10d %14.1f %14.1f" % (size, bench_list(size) * 1000,
+            bench_bounded(size) * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Measure the per-request overhead of building the headers of a service call,
+which checks the expiry of the token every time.  Compares the current
+Service._get_headers() with parsing the expiry and building the headers for
+every request as was done before.
+
+    python benchmarks/bench_service_headers.py
+
+"""
+import time
+import datetime
+import collections
+
+# The dateutil release pinned in requirements.txt still looks for the
+# abstract base classes where Python 3.10 removed them from.
+try:
+    import collections.abc
+    for name in ['Callable', 'Mapping', 'MutableMapping', 'Sequence']:
+        if not hasattr(collections, name):
+            setattr(collections, name, getattr(collections.abc, name))
+except ImportError:
+    pass
+
+import dateutil.parser
+
+import predix.testing
+import predix.service
+
+
+def get_service(fake):
+    """
+    A Service authenticated with a token from the fake UAA that won't
+    expire during the run.
+    """
+    service = predix.service.Service(fake.ZONE_ID)
+    service.uaa.get_token()
+    return service
+
+
+def get_headers_uncached(service):
+    """
+    Headers as they were built before the expiry and headers were cached.
+    """
+    expires = dateutil.parser.parse(service.uaa.client['expires'])
+    if expires < datetime.datetime.now():
+        raise ValueError("Token expired during benchmark.")
+
+    return {
+        'Accept': 'application/json',
+        'Content-Type': 'application/json',
+        'Predix-Zone-Id': service.zone,
+        'Authorization': 'Bearer ' + service.uaa.client['access_token'],
+    }
+
+
+def bench(get_headers, requests=100000):
+    """
+    Returns microseconds per call of get_headers().
+    """
+    start = time.time()
+    for i in range(requests):
+        get_headers()
+    return (time.time() - start) / requests * 1000000
+
+
+def main():
+    with predix.testing.FakePredix() as fake:
+        service = get_service(fake)
+
+        print("%10s %12s" % ('headers', 'usec/request'))
+        print("%10s %12.2f" % ('before',
+            bench(lambda: get_headers_uncached(service))))
+        print("%10s %12.2f" % ('after', bench(service._get_headers)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""
+Measure Time Series ingest throughput against the in-process fake services
+for the ways of sending: one message at a time, pipelined, and pooled.
+Each message round trip is given a latency to approximate the network.
+
+    python benchmarks/bench_timeseries_ingest.py
+
+"""
+import time
+
+import predix.testing
+import predix.data.timeseries
+
+
+LATENCY = 0.005
+
+
+def bench_ingest(messages=200, points=100, **kwargs):
+    """
+    Returns datapoints ingested per second sending the given number of
+    messages each with points datapoints.
+    """
+    with predix.testing.FakePredix(latency=LATENCY):
+        ts = predix.data.timeseries.TimeSeries(**kwargs)
+        now = int(time.time() * 1000)
+
+        start = time.time()
+        for i in range(messages):
+            for j in range(points):
+                ts.queue('TAG%s' % (j % 10), j, quality=ts.GOOD,
+                        timestamp=now + i * points + j)
+            ts.send()
+        ts.flush()
+        elapsed = time.time() - start
+
+    return messages * points / elapsed
+
+
+def main():
+    print("%-28s %14s" % ('options', 'points/sec'))
+    for options in [{}, {'max_in_flight': 8}, {'pool_size': 4},
+            {'pool_size': 4, 'max_in_flight': 8}]:
+        name = ', '.join(['%s=%s' % item for item in sorted(options.items())])
+        print("%-28s %14.0f" % (name or 'default', bench_ingest(**options)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Measure Time Series query throughput against the in-process fake services,
+comparing a GET and POST, columnar arrays, streaming, and windowed queries.
+Each request is given a latency to approximate the network.
+
+    python benchmarks/bench_timeseries_query.py
+
+"""
+import time
+
+import predix.testing
+import predix.data.timeseries
+
+
+LATENCY = 0.01
+
+
+def seed(fake, tags=10, points=10000):
+    """
+    Store datapoints for the tags over the last hour.
+    """
+    now = int(time.time() * 1000)
+    step = 3600000 // points
+    for i in range(tags):
+        fake.timeseries['TAG%s' % (i)] = [[now - j * step, j, 3, {}]
+                for j in range(points)]
+
+
+def bench_query(fake, queries=20, **kwargs):
+    """
+    Returns datapoints queried per second fetching every tag in a query.
+    """
+    ts = predix.data.timeseries.TimeSeries()
+    tags = sorted(fake.timeseries.keys())
+
+    start = time.time()
+    count = 0
+    for i in range(queries):
+        results = ts.get_datapoints(tags, start='1h-ago', **kwargs)
+        if kwargs.get('as_arrays'):
+            count += sum([len(column['values']) for column in results])
+        else:
+            count += sum([len(result['values']) for tag in results['tags']
+                for result in tag['results']])
+    elapsed = time.time() - start
+
+    return count / elapsed
+
+
+def main():
+    with predix.testing.FakePredix(latency=LATENCY) as fake:
+        seed(fake)
+
+        print("%-28s %14s" % ('options', 'points/sec'))
+        for options in [{}, {'post': True}, {'as_arrays': True},
+                {'as_arrays': True, 'stream': True},
+                {'window': 600000, 'max_workers': 6}]:
+            name = ', '.join(['%s=%s' % item
+                for item in sorted(options.items())])
+            print("%-28s %14.0f" % (name or 'default',
+                bench_query(fake, **options)))
+
+
+if __name__ == '__main__':
+    main()
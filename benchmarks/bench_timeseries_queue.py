@@ -0,0 +1,55 @@
+"""
+Measure the cost of TimeSeries.queue() as the number of distinct tags in a
+batch grows.  The cost per datapoint should stay flat.
+
+    python benchmarks/bench_timeseries_queue.py
+
+"""
+import time
+
+import six
+if six.PY3:
+    from unittest.mock import patch
+else:
+    from mock import patch
+
+import predix.data.timeseries
+
+
+def get_timeseries():
+    """
+    A TimeSeries instance that never talks to the service.
+    """
+    with patch('predix.service.Service'):
+        return predix.data.timeseries.TimeSeries(
+                query_uri='https://query.example.com',
+                ingest_uri='wss://ingest.example.com',
+                query_zone_id='zone', ingest_zone_id='zone')
+
+
+def bench_queue(tags, points_per_tag=2):
+    """
+    Returns the microseconds spent per queue() call when spreading
+    datapoints over the given number of tags.
+    """
+    ts = get_timeseries()
+    names = ['TAG%s' % (i) for i in range(tags)]
+
+    start = time.time()
+    for i in range(points_per_tag):
+        for name in names:
+            ts.queue(name, i, quality=ts.GOOD, timestamp=1000 + i)
+    elapsed = time.time() - start
+
+    ts._queue.clear()
+    return elapsed / (tags * points_per_tag) * 1000000
+
+
+def main():
+    print("%10s %12s" % ('tags', 'usec/point'))
+    for tags in [10, 100, 1000, 10000, 100000]:
+        print("%10s %12.2f" % (tags, bench_queue(tags)))
+
+
+if __name__ == '__main__':
+    main()
@@ -55,7 +55,6 @@ class API(object):
         headers = self._get_headers()
 
         logging.debug("URI=GET " + str(uri))
-        logging.debug("HEADERS=" + str(headers))
 
         response = self.session.get(uri, headers=headers)
         if response.status_code == 200:
@@ -73,7 +72,6 @@ class API(object):
         headers = self._post_headers()
 
         logging.debug("URI=POST " + str(uri))
-        logging.debug("HEADERS=" + str(headers))
         logging.debug("BODY=" + str(data))
 
         response = self.session.post(uri, headers=headers,
@@ -95,7 +93,6 @@ class API(object):
         headers = self._get_headers()
 
         logging.debug("URI=PUT " + str(uri))
-        logging.debug("HEADERS=" + str(headers))
         logging.debug("BODY=" + str(data))
 
         response = self.session.put(uri, headers=headers,
@@ -120,7 +117,6 @@ class API(object):
             }
 
         logging.debug("URI=DELETE " + str(uri))
-        logging.debug("HEADERS=" + str(headers))
 
         response = self.session.delete(
             uri, headers=headers, params=params, data=json.dumps(data))
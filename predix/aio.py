@@ -0,0 +1,84 @@
+"""
+asyncio counterpart of predix.resilience.request() for clients built on
+aiohttp, which is required to use it.
+
+Requests are made with a session from predix.transport, so they reach the
+same services (or predix.testing) as every other client, and are retried,
+failed fast while a host is down, and measured in predix.metrics the same
+way.
+"""
+import io
+import asyncio
+
+import aiohttp
+import requests
+import requests.utils
+import requests.structures
+
+import predix.metrics
+import predix.resilience
+
+
+async def request(session, method, uri, retry=None, **kwargs):
+    """
+    Make a request with the aiohttp session, retrying according to the
+    retry policy and failing fast while the circuit of the host is open.
+
+    Returns a requests.Response with the body already read, whatever its
+    status once out of retries, and raises requests exceptions, see
+    predix.resilience.request().
+    """
+    attempts = predix.resilience.Attempts(method, uri, retry=retry)
+    while True:
+        attempts.before_request()
+
+        event = predix.metrics.registry.start_request(method, uri, **kwargs)
+        try:
+            response = await _send(session, method, uri, **kwargs)
+        except Exception as e:
+            predix.metrics.registry.finish_request(event, error=e)
+            delay = attempts.on_error(e)
+            if delay is None:
+                raise
+        else:
+            predix.metrics.registry.finish_request(event, response=response)
+            delay = attempts.on_response(response)
+            if delay is None:
+                return response
+
+        await asyncio.sleep(delay)
+
+
+async def _send(session, method, uri, **kwargs):
+    """
+    Make a single request, raising the requests exception that matches
+    any aiohttp failure so they are handled like those of other clients.
+    """
+    try:
+        async with session.request(method, uri, **kwargs) as response:
+            content = await response.read()
+    except asyncio.TimeoutError as e:
+        raise requests.exceptions.Timeout(e) from e
+    except aiohttp.ClientError as e:
+        raise requests.exceptions.ConnectionError(e) from e
+
+    return _to_response(uri, response.status, response.reason,
+            response.headers, content)
+
+
+def _to_response(uri, status, reason, headers, content):
+    """
+    Returns a requests.Response for a response that has been read.
+    """
+    response = requests.models.Response()
+    response.url = uri
+    response.status_code = status
+    response.reason = reason
+    response.headers = requests.structures.CaseInsensitiveDict(headers)
+    response.encoding = requests.utils.get_encoding_from_headers(
+            response.headers)
+
+    response._content = content
+    response._content_consumed = True
+    response.raw = io.BytesIO(content)
+    return response
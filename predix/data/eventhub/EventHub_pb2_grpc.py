@@ -1,7 +1,7 @@
 # Generated by the gRPC Python protocol compiler plugin. DO NOT EDIT!
 import grpc
 
-import EventHub_pb2 as EventHub__pb2
+from predix.data.eventhub import EventHub_pb2 as EventHub__pb2
 
 
 class PublisherStub(object):
@@ -1,7 +1,7 @@
 # Generated by the gRPC Python protocol compiler plugin. DO NOT EDIT!
 import grpc
 
-import Health_pb2 as Health__pb2
+from predix.data.eventhub import Health_pb2 as Health__pb2
 
 
 class HealthStub(object):
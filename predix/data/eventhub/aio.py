@@ -0,0 +1,589 @@
+"""
+asyncio client for the Event Hub service built on grpc.aio, which needs a
+grpcio release that includes it.
+
+Every stream is a coroutine on the event loop rather than a thread, so one
+loop can publish to and subscribe from many topics at once.
+"""
+import asyncio
+import logging
+import collections
+
+import six
+import grpc
+
+import predix.service
+import predix.transport
+import predix.data.eventhub.client
+from predix.data.eventhub import EventHub_pb2, EventHub_pb2_grpc
+from predix.data.eventhub import Health_pb2, Health_pb2_grpc
+from predix.data.eventhub.buffer import BoundedQueue
+from predix.data.eventhub.publisher import PublishError, get_publish_headers
+from predix.data.eventhub.subscriber import get_acks_request, get_subscribe_headers
+
+
+class AsyncEventhub(predix.data.eventhub.client.Eventhub):
+    """
+    Client library for working with the Event Hub service from asyncio.
+
+    Takes the same configs as Eventhub, publishing and subscribing over
+    grpc.aio streams opened on first use.  The channel is shared by the
+    publisher and subscriber, and there is no health checker thread, call
+    check_health() instead.
+
+    ::
+
+        async with AsyncEventhub(publish_config=PublisherConfig(),
+                subscribe_config=SubscribeConfig()) as eh:
+            ack = await eh.publisher.publish('1', b'hello')
+
+            async for message in eh.subscriber.receive():
+                print(message.body)
+
+    """
+    def __init__(self,
+                 publish_config=None,
+                 subscribe_config=None,
+                 ):
+        # Eventhub.__init__ opens a blocking channel and threads so is not used
+        self.zone_id = self._get_zone_id()
+        self.host = self._get_host()
+        self.service = predix.service.Service(self.zone_id)
+
+        self._channel = None
+        self.publisher = None
+        self.subscriber = None
+        if publish_config is not None:
+            self.publisher = AsyncPublisher(eventhub_client=self, config=publish_config)
+
+        if subscribe_config is not None:
+            self.subscriber = AsyncSubscriber(eventhub_client=self, config=subscribe_config)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    def _get_channel(self):
+        """
+        the grpc.aio channel shared by the publisher and subscriber, opened on first use
+        :return: grpc.aio.Channel
+        """
+        if self._channel is None:
+            target = self._get_host() + ":" + self._get_grpc_port()
+            self._channel = predix.transport.create_grpc_aio_channel(target, credentials=self._get_credentials())
+        return self._channel
+
+    async def check_health(self):
+        """
+        ask the service whether it is serving
+        :return: Health_pb2.HealthCheckResponse
+        """
+        stub = Health_pb2_grpc.HealthStub(channel=self._get_channel())
+        response = await stub.Check(Health_pb2.HealthCheckRequest(service='predix-event-hub.grpc.health'))
+        logging.debug('received health check: ' + str(response))
+        return response
+
+    async def close(self):
+        """
+        Publish anything waiting, close the streams and then the channel
+        :return: None
+        """
+        try:
+            if self.publisher is not None:
+                await self.publisher.close()
+
+            if self.subscriber is not None:
+                self.subscriber.close()
+        finally:
+            if self._channel is not None:
+                await self._channel.close()
+                self._channel = None
+
+    def shutdown(self):
+        """
+        close the streams without waiting, use close() from a coroutine instead
+        :return: None
+        """
+        if self.subscriber is not None:
+            self.subscriber.close()
+
+
+class AsyncPublisher(object):
+    """
+    Publishes over a single grpc.aio send stream.  Messages published
+    together are sent together as soon as the stream is free, in requests of
+    up to async_auto_send_amount messages and max_request_bytes, and each
+    publish() is an awaitable of the ack of its message.  Only GRPC is
+    supported, the retry and ack timeout settings of PublisherConfig apply.
+
+    At most queue_capacity messages wait to be sent, with queue_overflow
+    deciding what happens to a message published to a full queue.  As
+    publish() can't wait, BoundedQueue.BLOCK raises six.moves.queue.Full
+    from it like RAISE does, while send() waits for space.
+    """
+
+    def __init__(self, eventhub_client, config):
+        if not config.is_grpc():
+            raise ValueError("asyncio publisher only supports the GRPC protocol")
+
+        self.eventhub_client = eventhub_client
+        self.config = config
+
+        self._call = None
+        self._queue = collections.deque()
+        self._not_full = None
+        self._in_flight = {}
+        self._acks = None
+        self._ready = None
+        self._sender = None
+        self._receiver = None
+        self._active = True
+
+    def publish(self, id, body, tags=None):
+        """
+        queue a message to be sent on the stream
+        :param id: str message Id, unique among the messages not yet acknowledged
+        :param body: bytes the message body
+        :param tags: dict[string->string] tags to be associated with the message
+        :return: asyncio.Future resolving to the EventHub_pb2.Ack of the message once accepted, or raising
+            PublishError if it is rejected or never acknowledged
+        """
+        if not self._active:
+            raise ValueError("publisher is closed")
+        if id in self._in_flight:
+            raise ValueError("Message %s already in flight." % (id))
+
+        self._start()
+        dropped = None
+        if self._is_full():
+            if self.config.queue_overflow != BoundedQueue.DROP_OLDEST:
+                raise six.moves.queue.Full("queue is at capacity %s" % self.config.queue_capacity)
+            dropped = self._queue.popleft()
+
+        message = EventHub_pb2.Message(id=id, body=body, tags=tags or {}, zone_id=self.eventhub_client.zone_id)
+        future = asyncio.get_event_loop().create_future()
+        self._in_flight[id] = {
+            'message': message,
+            'future': future,
+            'attempts': 0,
+            'sent': None,
+            'timer': None,
+        }
+        self._queue.append(message)
+        self._ready.set()
+        if self._is_full():
+            self._not_full.clear()
+
+        if dropped is not None:
+            logging.warning('publish queue full, dropped message ' + dropped.id)
+            self._resolve(dropped.id, error=PublishError(
+                "Message %s dropped from the full publish queue." % dropped.id))
+        return future
+
+    async def send(self, messages):
+        """
+        publish each of the messages, yielding their acks as they arrive
+        :param messages: iterable or async iterable of EventHub_pb2.Message
+        :return: async iterator of EventHub_pb2.Ack, including those of messages the service rejected, raising
+            PublishError for a message never acknowledged
+        """
+        done = asyncio.Queue()
+
+        async def feed():
+            count = 0
+            async for message in _iterate(messages):
+                if self.config.queue_overflow == BoundedQueue.BLOCK:
+                    self._start()
+                    while self._is_full():
+                        await self._not_full.wait()
+                future = self.publish(message.id, message.body, dict(message.tags))
+                future.add_done_callback(done.put_nowait)
+                count += 1
+            return count
+
+        feeder = asyncio.ensure_future(feed())
+        received = 0
+        try:
+            while not feeder.done() or received < feeder.result():
+                if feeder.done():
+                    future = await done.get()
+                else:
+                    getter = asyncio.ensure_future(done.get())
+                    await asyncio.wait([getter, feeder], return_when=asyncio.FIRST_COMPLETED)
+                    if not getter.done():
+                        getter.cancel()
+                        continue
+                    future = getter.result()
+
+                received += 1
+                error = future.exception()
+                if error is None:
+                    yield future.result()
+                elif getattr(error, 'ack', None) is not None:
+                    yield error.ack
+                else:
+                    raise error
+        finally:
+            feeder.cancel()
+
+    async def acks(self):
+        """
+        async iterator of every ack as it arrives, like Publisher.ack_generator
+        :return: EventHub_pb2.Ack
+        """
+        self._start()
+        while self._active or not self._acks.empty():
+            ack = await self._acks.get()
+            if ack is None:
+                break
+            yield ack
+
+    async def flush(self):
+        """
+        wait until every message published so far has been acknowledged or failed
+        :return: None
+        """
+        futures = [entry['future'] for entry in self._in_flight.values()]
+        if futures:
+            await asyncio.wait(futures)
+
+    async def close(self):
+        """
+        wait on anything published and close the stream
+        :return: None
+        """
+        if not self._active:
+            return
+        try:
+            await self.flush()
+        finally:
+            self._active = False
+            for task in [self._sender, self._receiver]:
+                if task is not None:
+                    task.cancel()
+            if self._call is not None:
+                self._call.cancel()
+                self._call = None
+            if self._acks is not None:
+                self._acks.put_nowait(None)
+            self._fail_in_flight("Publisher closed before message %s was acknowledged.")
+
+    def _start(self):
+        """
+        start the task sending queued messages, on the running event loop
+        :return: None
+        """
+        if self._sender is not None:
+            return
+        self._ready = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self._not_full.set()
+        self._acks = asyncio.Queue()
+        self._sender = asyncio.ensure_future(self._send_queued())
+
+    def _get_call(self):
+        """
+        the send stream, opened along with a task reading its acks when there is none
+        :return: grpc.aio.StreamStreamCall
+        """
+        if self._call is None:
+            stub = EventHub_pb2_grpc.PublisherStub(channel=self.eventhub_client._get_channel())
+            metadata = tuple(get_publish_headers(self.eventhub_client, self.config).items())
+            self._call = stub.send(metadata=metadata)
+            self._receiver = asyncio.ensure_future(self._receive_acks(self._call))
+        return self._call
+
+    def _take_batch(self):
+        """
+        take queued messages up to async_auto_send_amount and max_request_bytes
+        :return: list of EventHub_pb2.Message
+        """
+        batch = []
+        total = 0
+        while self._queue and len(batch) < self.config.async_auto_send_amount:
+            size = self._queue[0].ByteSize()
+            if batch and total + size > self.config.max_request_bytes:
+                break
+            batch.append(self._queue.popleft())
+            total += size
+
+        if not self._is_full():
+            self._not_full.set()
+        return batch
+
+    def _is_full(self):
+        """
+        :return: whether queue_capacity messages are waiting to be sent
+        """
+        return len(self._queue) >= self.config.queue_capacity
+
+    async def _send_queued(self):
+        """
+        task writing queued messages to the stream, whatever was published while the last write was
+        in progress goes out together
+        :return: None
+        """
+        while self._active:
+            await self._ready.wait()
+            self._ready.clear()
+
+            while self._queue:
+                batch = self._take_batch()
+                request = EventHub_pb2.PublishRequest(messages=EventHub_pb2.Messages(msg=batch))
+                loop = asyncio.get_event_loop()
+                now = loop.time()
+                for message in batch:
+                    entry = self._in_flight.get(message.id)
+                    if entry is None:
+                        continue
+                    entry['sent'] = now
+                    if self._expects_nacks():
+                        entry['timer'] = loop.call_later(self.config.ack_timeout, self._on_ack_timeout,
+                                                         message.id)
+
+                try:
+                    await self._get_call().write(request)
+                except (grpc.RpcError, grpc.aio.UsageError) as e:
+                    logging.debug('publish stream failed: ' + str(e))
+                    self._call = None
+                    for message in batch:
+                        self._retry(message.id, PublishError("Message %s could not be sent: %s" % (
+                            message.id, e)))
+                    continue
+
+                # Without acks there is nothing more to learn about the messages
+                if not self._expects_nacks():
+                    for message in batch:
+                        self._resolve(message.id)
+
+    async def _receive_acks(self, call):
+        """
+        task resolving the future of each message as its ack arrives
+        :param call: the send stream
+        :return: None
+        """
+        try:
+            async for response in call:
+                for ack in response.ack:
+                    self._on_ack(ack)
+                    if self._acks.qsize() >= self.config.ack_queue_capacity:
+                        self._acks.get_nowait()
+                    self._acks.put_nowait(ack)
+        except grpc.RpcError as e:
+            if not self._active:
+                return
+            logging.debug('publish stream closed: ' + str(e))
+
+        # Acks of anything sent on this stream will never arrive
+        if self._call is call:
+            self._call = None
+        for (id, entry) in list(self._in_flight.items()):
+            if entry['sent'] is not None:
+                self._retry(id, PublishError("Stream closed before message %s was acknowledged." % (id)))
+
+    def _expects_acks(self):
+        """
+        :return: whether the service acks accepted messages
+        """
+        return self.config.is_sync() or self.config.async_enable_acks
+
+    def _expects_nacks(self):
+        """
+        :return: whether the service acks failed messages
+        """
+        return self._expects_acks() or self.config.async_enable_nacks_only
+
+    def _resolve(self, id, ack=None, error=None):
+        """
+        stop tracking the message and resolve its future
+        :return: None
+        """
+        entry = self._in_flight.pop(id, None)
+        if entry is None:
+            return
+        if entry['timer'] is not None:
+            entry['timer'].cancel()
+
+        if entry['future'].done():
+            return
+        if error is not None:
+            entry['future'].set_exception(error)
+        else:
+            entry['future'].set_result(ack)
+
+    def _retry(self, id, error):
+        """
+        queue the message to be sent again after backing off, or fail it with the error when out of retries
+        :return: None
+        """
+        entry = self._in_flight.get(id)
+        if entry is None:
+            return
+        if entry['timer'] is not None:
+            entry['timer'].cancel()
+
+        if entry['attempts'] >= self.config.max_retries or not self._active:
+            self._resolve(id, error=error)
+            return
+
+        delay = self.config.retry_backoff * (2 ** entry['attempts'])
+        entry['attempts'] += 1
+        entry['sent'] = None
+        entry['timer'] = asyncio.get_event_loop().call_later(delay, self._requeue, id)
+
+    def _requeue(self, id):
+        entry = self._in_flight.get(id)
+        if entry is None or not self._active:
+            return
+        entry['timer'] = None
+        logging.debug('retrying message ' + id)
+        self._queue.append(entry['message'])
+        self._ready.set()
+
+    def _on_ack(self, ack):
+        """
+        resolve the future of the message the ack refers to, or send it again if it FAILED
+        :param ack: EventHub_pb2.Ack
+        :return: None
+        """
+        if ack.id not in self._in_flight:
+            logging.debug('ack for unknown message ' + ack.id)
+            return
+
+        error = PublishError("Message %s failed with status %s: %s" % (
+            ack.id, EventHub_pb2.AckStatus.Name(ack.status_code), ack.desc), ack)
+        if ack.status_code == EventHub_pb2.ACCEPTED:
+            self._resolve(ack.id, ack=ack)
+        elif ack.status_code == EventHub_pb2.FAILED:
+            self._retry(ack.id, error)
+        else:
+            self._resolve(ack.id, error=error)
+
+    def _on_ack_timeout(self, id):
+        """
+        handle a message whose ack is overdue
+        :return: None
+        """
+        entry = self._in_flight.get(id)
+        if entry is None:
+            return
+        entry['timer'] = None
+
+        if self._expects_acks():
+            self._retry(id, PublishError("Message %s was never acknowledged." % (id)))
+        else:
+            # Only failures are acked so silence means the message was accepted
+            self._resolve(id)
+
+    def _fail_in_flight(self, reason):
+        for id in list(self._in_flight.keys()):
+            self._resolve(id, error=PublishError(reason % (id)))
+
+
+class AsyncSubscriber(object):
+    """
+    Subscribes over grpc.aio streams, each of receive(), receiveWithAcks() and
+    subscribe() is an async iterator over the messages of its own stream.
+    The acks and batching settings of SubscribeConfig are used for the
+    streams that need them whatever acks_enabled and batching_enabled are.
+    """
+
+    def __init__(self, eventhub_client, config):
+        self.eventhub_client = eventhub_client
+        self._config = config
+        self._calls = []
+        self._ack_call = None
+
+    def _open(self, call):
+        """
+        keep track of the stream so close() can end it
+        :param call: the grpc.aio call
+        :return: async iterator of its messages
+        """
+        self._calls.append(call)
+        return self._stream(call)
+
+    async def _stream(self, call):
+        """
+        yield the messages of the stream until it ends or is closed
+        :param call: the grpc.aio call
+        :return: async iterator of messages
+        """
+        try:
+            async for message in call:
+                yield message
+        except grpc.RpcError as e:
+            if e.code() != grpc.StatusCode.CANCELLED:
+                raise
+            logging.debug('subscribe stream closed')
+        finally:
+            if call in self._calls:
+                self._calls.remove(call)
+            call.cancel()
+
+    def _get_stub(self):
+        return EventHub_pb2_grpc.SubscriberStub(channel=self.eventhub_client._get_channel())
+
+    def receive(self):
+        """
+        async iterator of messages as they are published, without acks
+        :return: EventHub_pb2.Message
+        """
+        request = EventHub_pb2.SubscriptionRequest(subscriber=self._config.subscriber_name,
+                                                   zone_id=self.eventhub_client.zone_id,
+                                                   instance_id='predixpy-subscriber')
+        metadata = get_subscribe_headers(self.eventhub_client, self._config, acks=False, batching=False)
+        return self._open(self._get_stub().receive(request, metadata=metadata))
+
+    def receiveWithAcks(self):
+        """
+        async iterator of messages that are sent again unless acked with send_acks()
+        :return: EventHub_pb2.Message
+        """
+        metadata = get_subscribe_headers(self.eventhub_client, self._config, acks=True, batching=False)
+        self._ack_call = self._get_stub().receiveWithAcks(metadata=metadata)
+        return self._open(self._ack_call)
+
+    def subscribe(self):
+        """
+        async iterator of batches of batch_size messages, which are acked with send_acks() when
+        acks_enabled
+        :return: EventHub_pb2.SubscriptionMessage
+        """
+        metadata = get_subscribe_headers(self.eventhub_client, self._config, batching=True)
+        self._ack_call = self._get_stub().subscribe(metadata=metadata)
+        return self._open(self._ack_call)
+
+    async def send_acks(self, message):
+        """
+        ack a message from receiveWithAcks() or batch from subscribe()
+        :param message: EventHub_pb2.Message or EventHub_pb2.SubscriptionMessage
+        :return: None
+        """
+        if self._ack_call is None:
+            raise ValueError("acks can only be sent for receiveWithAcks() or subscribe()")
+        await self._ack_call.write(get_acks_request(message))
+
+    def close(self):
+        """
+        end every open stream, their iterators stop
+        :return: None
+        """
+        for call in list(self._calls):
+            call.cancel()
+        self._calls = []
+        self._ack_call = None
+
+
+async def _iterate(items):
+    """
+    async iterator over an iterable or async iterable
+    """
+    if hasattr(items, '__aiter__'):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
@@ -0,0 +1,238 @@
+import threading
+import time
+import collections
+
+import six
+
+
+class BoundedQueue(object):
+    """
+    Thread safe FIFO queue backed by a deque so that adding and taking
+    messages is O(1) however far behind the consumer is.  Memory stays
+    bounded by the capacity, with the overflow policy deciding what happens
+    to a message added to a full queue:
+
+    - BLOCK waits for space, raising six.moves.queue.Full after the timeout
+    - DROP_OLDEST discards the oldest message to make room
+    - RAISE raises six.moves.queue.Full straight away
+
+    :param capacity: the most messages held at once
+
+    :param overflow: one of BLOCK, DROP_OLDEST or RAISE
+
+    :param timeout: seconds put() waits for space when blocking, or None to
+        wait until there is space
+
+    :param get_size: callable returning the size of an item, such as its
+        serialized bytes, kept as a running total in total_size
+
+    """
+    BLOCK = 'block'
+    DROP_OLDEST = 'drop_oldest'
+    RAISE = 'raise'
+
+    def __init__(self, capacity=100000, overflow=BLOCK, timeout=None,
+            get_size=None):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        if overflow not in [self.BLOCK, self.DROP_OLDEST, self.RAISE]:
+            raise ValueError("unknown overflow policy %s" % overflow)
+
+        self.capacity = capacity
+        self.overflow = overflow
+        self.timeout = timeout
+        self.dropped = 0
+        self.get_size = get_size
+        self.total_size = 0
+
+        self._items = collections.deque()
+        self._closed = False
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, item, timeout=None):
+        """
+        Add the item to the end of the queue, applying the overflow policy
+        when full.
+        :param item: the message to add
+        :param timeout: seconds to wait for space when blocking, defaults to
+            the timeout of the queue
+        :return: the item dropped to make room, or None
+        """
+        if timeout is None:
+            timeout = self.timeout
+
+        dropped = None
+        with self._lock:
+            if len(self._items) >= self.capacity:
+                if self.overflow == self.RAISE:
+                    raise six.moves.queue.Full("queue is at capacity %s" % self.capacity)
+
+                if self.overflow == self.DROP_OLDEST:
+                    dropped = self._items.popleft()
+                    self.dropped += 1
+                    self._remove_size([dropped])
+                else:
+                    self._wait(self._not_full, lambda: len(self._items) < self.capacity or self._closed, timeout)
+                    if len(self._items) >= self.capacity:
+                        raise six.moves.queue.Full("queue is at capacity %s" % self.capacity)
+
+            self._items.append(item)
+            if self.get_size is not None:
+                self.total_size += self.get_size(item)
+            self._not_empty.notify()
+        return dropped
+
+    def get(self, timeout=None):
+        """
+        Take the item at the front of the queue, blocking until there is one.
+        :param timeout: seconds to wait, raising six.moves.queue.Empty after
+        :return: the item
+        """
+        with self._lock:
+            self._wait(self._not_empty, lambda: self._items or self._closed, timeout)
+            if not self._items:
+                raise six.moves.queue.Empty()
+
+            item = self._items.popleft()
+            self._remove_size([item])
+            self._not_full.notify()
+        return item
+
+    def drain(self, max_items=None, max_size=None):
+        """
+        Take up to max_items from the front of the queue without blocking.
+        :param max_items: the most to take, or None for everything queued
+        :param max_size: the most the sizes of the items taken can add up
+            to, though the first item is always taken, needs get_size
+        :return: list of the items in order
+        """
+        with self._lock:
+            if max_size is not None:
+                items = []
+                total = 0
+                while self._items and (max_items is None or len(items) < max_items):
+                    size = self.get_size(self._items[0])
+                    if items and total + size > max_size:
+                        break
+                    items.append(self._items.popleft())
+                    total += size
+            elif max_items is None or max_items >= len(self._items):
+                items = list(self._items)
+                self._items.clear()
+            else:
+                items = [self._items.popleft() for i in range(max_items)]
+
+            self._remove_size(items)
+            if items:
+                self._not_full.notify_all()
+        return items
+
+    def items(self):
+        """
+        :return: list of the items queued, without taking them
+        """
+        with self._lock:
+            return list(self._items)
+
+    def close(self):
+        """
+        Wake anything waiting on the queue, gets return what is left and
+        then raise six.moves.queue.Empty, blocked puts raise
+        six.moves.queue.Full
+        :return: None
+        """
+        with self._lock:
+            self._closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+
+    def _remove_size(self, items):
+        """
+        Take the sizes of items leaving the queue off the total, the lock
+        must be held.
+        """
+        if self.get_size is None:
+            return
+        if not self._items:
+            self.total_size = 0
+            return
+        for item in items:
+            self.total_size -= self.get_size(item)
+
+    def _wait(self, condition, predicate, timeout):
+        """
+        Wait on the condition, which must be held, until the predicate is
+        true or the timeout passes.
+        """
+        if timeout is None:
+            while not predicate():
+                condition.wait()
+            return
+
+        deadline = time.time() + timeout
+        while not predicate():
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return
+            condition.wait(remaining)
+
+
+class AdaptiveBatchSize(object):
+    """
+    Sizes batches to the messages that arrive during one ack round trip, so
+    about one request is in flight at a time: batches grow when acks are slow
+    or messages arrive quickly and shrink so messages don't wait when acks
+    are fast.
+
+    :param maximum: the largest batch
+
+    :param minimum: the smallest batch
+
+    :param smoothing: weight of each new observation in the moving averages
+        of the ack latency and arrival rate
+
+    """
+    def __init__(self, maximum, minimum=1, smoothing=0.2):
+        if minimum < 1 or maximum < minimum:
+            raise ValueError("batch sizes must be at least 1 with minimum <= maximum")
+
+        self.maximum = maximum
+        self.minimum = minimum
+        self.smoothing = smoothing
+
+        # Until there is something to go on batches are as large as allowed
+        self.size = maximum
+        self.latency = None
+        self.rate = None
+
+    def _average(self, average, value):
+        if average is None:
+            return value
+        return average + self.smoothing * (value - average)
+
+    def observe_latency(self, seconds):
+        """
+        Record the seconds between sending a message and its ack.
+        """
+        self.latency = self._average(self.latency, seconds)
+        self._update()
+
+    def observe_arrivals(self, count, seconds):
+        """
+        Record count messages arriving over the seconds.
+        """
+        if seconds <= 0:
+            return
+        self.rate = self._average(self.rate, count / float(seconds))
+        self._update()
+
+    def _update(self):
+        if self.latency is None or self.rate is None:
+            return
+        size = int(round(self.rate * self.latency))
+        self.size = min(max(size, self.minimum), self.maximum)
@@ -5,11 +5,14 @@ import threading
 import time
 
 import grpc
+import six
 
 import predix.config
 import predix.service
+import predix.transport
 from predix.data.eventhub import Health_pb2_grpc
 from predix.data.eventhub import Health_pb2
+from predix.data.eventhub.buffer import BoundedQueue
 from predix.data.eventhub.publisher import PublisherConfig, Publisher
 from predix.data.eventhub.subscriber import Subscriber
 
@@ -30,11 +33,17 @@ class Eventhub(object):
                  publish_config=None,
                  subscribe_config=None,
                  ):
+        self.zone_id = self._get_zone_id()
+        self.host = self._get_host()
+        self.service = predix.service.Service(self.zone_id)
+
         # initialize the publisher and subscriber
         # only build shared grpc channel if required
         self._ws = None
         self._channel = None
         self._run_health_checker = True
+        self.publisher = None
+        self.subscriber = None
         if publish_config is not None:
             # make the channel
             if publish_config.protocol == PublisherConfig.Protocol.GRPC:
@@ -58,6 +67,12 @@ class Eventhub(object):
         if self.subscriber is not None:
             self.subscriber.shutdown()
 
+    def _get_zone_id(self):
+        if 'VCAP_SERVICES' in os.environ:
+            services = json.loads(os.getenv('VCAP_SERVICES'))
+            return services['predix-event-hub'][0]['credentials']['publish']['zone-http-header-value']
+        return self.get_service_env_value('zone_id')
+
     def _get_host(self):
         if 'VCAP_SERVICES' in os.environ:
             services = json.loads(os.getenv('VCAP_SERVICES'))
@@ -78,7 +93,7 @@ class Eventhub(object):
         :param key: the base of the key to use
         :return: the env if it exists
         """
-        service_key = predix.config.get_env_key(self, key)
+        service_key = predix.config.get_env_key(Eventhub, key)
         value = os.environ[service_key]
         if not value:
             raise ValueError("%s env unset" % key)
@@ -92,15 +107,19 @@ class Eventhub(object):
         host = self._get_host()
         port = self._get_grpc_port()
 
+        self._channel = predix.transport.create_grpc_channel(host + ":" + port, credentials=self._get_credentials())
+        self._init_health_checker()
+
+    def _get_credentials(self):
+        """
+        the channel credentials, trusting the certificates in TLS_PEM_FILE when set
+        :return: grpc.ChannelCredentials
+        """
         if 'TLS_PEM_FILE' in os.environ:
             with open(os.environ['TLS_PEM_FILE'], mode='rb') as f:  # b is important -> binary
                 file_content = f.read()
-            credentials = grpc.ssl_channel_credentials(root_certificates=file_content)
-        else:
-            credentials = grpc.ssl_channel_credentials()
-
-        self._channel = grpc.secure_channel(host + ":" + port, credentials=credentials)
-        self._init_health_checker()
+            return grpc.ssl_channel_credentials(root_certificates=file_content)
+        return grpc.ssl_channel_credentials()
 
     def _init_health_checker(self):
         """
@@ -129,23 +148,28 @@ class Eventhub(object):
         Class for managing GRPC calls by turing the generators grpc uses into function calls
         This allows the sdk to man in the middle the messages
         """
-        def __init__(self, stub_call, on_msg_callback, metadata, tx_stream=True, initial_message=None):
+        # seconds blocked waiting on a message before checking for shutdown
+        POLL_INTERVAL = 1
+
+        def __init__(self, stub_call, on_msg_callback, metadata, tx_stream=True, initial_message=None,
+                     queue_capacity=1000):
             """
             :param stub_call: the call on the grpc stub to build the generator on
             :param on_msg_callback: the callback to pass any received functions on
             :param metadata: metadata to attach to the stub call
+            :param queue_capacity: the most messages waiting to be sent before send_message blocks
             """
             self._tx_stream = tx_stream
             self._stub_call = stub_call
             self._on_msg_callback = on_msg_callback
             self._metadata = metadata
             self._initial_message = initial_message
+            self._grpc_tx_queue = BoundedQueue(queue_capacity, BoundedQueue.BLOCK)
+            self._run_generator = True
+            self._call = None
             self._grpc_rx_thread = threading.Thread(target=self._grpc_rx_receiver)
             self._grpc_rx_thread.daemon = True
             self._grpc_rx_thread.start()
-            self._grpc_tx_queue = []
-            self._run_generator = True
-            time.sleep(1)
 
         def send_message(self, tx_message):
             """
@@ -153,7 +177,7 @@ class Eventhub(object):
             :param tx_message:
             :return: None
             """
-            self._grpc_tx_queue.append(tx_message)
+            self._grpc_tx_queue.put(tx_message)
 
         def _grpc_rx_receiver(self):
             """
@@ -164,12 +188,18 @@ class Eventhub(object):
             if self._tx_stream:
                 if self._initial_message is not None:
                     self.send_message(self._initial_message)
-                msgs = self._stub_call(request_iterator=self._grpc_tx_generator(), metadata=self._metadata)
+                self._call = self._stub_call(request_iterator=self._grpc_tx_generator(), metadata=self._metadata)
             else:
-                msgs = self._stub_call(self._initial_message, metadata=self._metadata)
+                self._call = self._stub_call(self._initial_message, metadata=self._metadata)
 
-            for m in msgs:
-                self._on_msg_callback(m)
+            try:
+                for m in self._call:
+                    self._on_msg_callback(m)
+            except grpc.RpcError as e:
+                # cancelled by stop_generator
+                if self._run_generator:
+                    raise
+                logging.debug('grpc rx stream closed: ' + str(e.code()))
 
         def stop_generator(self):
             """
@@ -178,15 +208,21 @@ class Eventhub(object):
             """
             logging.debug('stopping generator')
             self._run_generator = False
+            self._grpc_tx_queue.close()
+            if self._call is not None:
+                self._call.cancel()
 
         def _grpc_tx_generator(self):
             """
             the generator taking and messages added to the grpc_tx_queue
-            and yield them to grpc
+            and yield them to grpc, blocking while there are none
             :return: grpc messages
             """
             while self._run_generator:
-                while len(self._grpc_tx_queue) != 0:
-                    yield self._grpc_tx_queue.pop(0)
+                try:
+                    message = self._grpc_tx_queue.get(timeout=self.POLL_INTERVAL)
+                except six.moves.queue.Empty:
+                    continue
+                yield message
             return
 
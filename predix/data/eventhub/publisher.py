@@ -1,12 +1,57 @@
 import json
+import heapq
 import logging
 import threading
 import websocket
+import six
+import concurrent.futures
 
 import time
 
 from predix.data.eventhub import EventHub_pb2, EventHub_pb2_grpc
-from predix.data.eventhub.client import Eventhub
+from predix.data.eventhub.buffer import AdaptiveBatchSize, BoundedQueue
+import predix.data.eventhub.client
+
+
+class PublishError(Exception):
+    """
+    Raised by the future of a message the service did not accept or acknowledge.
+    """
+    def __init__(self, message, ack=None):
+        self.ack = ack
+        super(PublishError, self).__init__(message)
+
+
+def get_publish_headers(eventhub_client, config):
+    """
+    generate the headers for the connection to event hub service based on the provided config
+    :param eventhub_client: the Eventhub client publishing
+    :param config: PublisherConfig
+    :return: {} headers
+    """
+    headers = {
+        'predix-zone-id': eventhub_client.zone_id
+    }
+    token = eventhub_client.service._get_bearer_token()
+    if config.is_grpc():
+        headers['authorization'] = token[(token.index(' ') + 1):]
+    else:
+        headers['authorization'] = token
+
+    if config.topic == '':
+        headers['topic'] = eventhub_client.zone_id + '_topic'
+    else:
+        headers['topic'] = config.topic
+
+    if config.publish_type == config.Type.SYNC:
+        headers['sync-acks'] = 'true'
+    else:
+        headers['sync-acks'] = 'false'
+        headers['send-acks-interval'] = str(config.async_cache_ack_interval_millis)
+        headers['acks'] = str(config.async_enable_acks).lower()
+        headers['nacks'] = str(config.async_enable_nacks_only).lower()
+        headers['cache-acks'] = str(config.async_cache_acks_and_nacks).lower()
+    return headers
 
 
 class PublisherConfig:
@@ -47,7 +92,16 @@ class PublisherConfig:
                  async_acknowledgement_options=AcknowledgementOptions.ACKS_AND_NACKS,
                  async_auto_send=False,
                  async_auto_send_amount=100,
-                 async_auto_send_interval_millis=10000):
+                 async_auto_send_interval_millis=10000,
+                 async_auto_send_adaptive=False,
+                 max_request_bytes=1000000,
+                 queue_capacity=100000,
+                 queue_overflow=BoundedQueue.RAISE,
+                 ack_queue_capacity=100000,
+                 ack_queue_overflow=BoundedQueue.DROP_OLDEST,
+                 ack_timeout=30,
+                 max_retries=3,
+                 retry_backoff=0.5):
         """
 
         :param topic: str the topic to publish to
@@ -59,7 +113,21 @@ class PublisherConfig:
         :param async_acknowledgement_options: what acks should be received
         :param async_auto_send: should the skd auto send messages
         :param async_auto_send_amount: after how many messages should messages be automatically sent
-        :param async_auto_send_interval_millis: what is the max period between messages
+        :param async_auto_send_interval_millis: the longest a message waits in the queue before being sent
+        :param async_auto_send_adaptive: should the amount automatically sent at once adapt to the ack latency,
+            up to async_auto_send_amount, so that slow acks lead to fewer larger requests
+        :param max_request_bytes: the most bytes of messages sent in one request, keep this under the
+            request size limit of the service
+        :param queue_capacity: the most messages waiting to be published
+        :param queue_overflow: what add_message does when the queue is full, BoundedQueue.BLOCK until there is
+            space, BoundedQueue.DROP_OLDEST message, or BoundedQueue.RAISE six.moves.queue.Full
+        :param ack_queue_capacity: the most acks waiting to be read from the ack_generator
+        :param ack_queue_overflow: what to do with an ack when the ack queue is full, see queue_overflow
+        :param ack_timeout: seconds to wait for the ack of a message before sending it again, with NACKS_ONLY
+            a message not NACKed by then is taken as accepted
+        :param max_retries: how many times a message is sent again after a FAILED or missing ack before its
+            future fails
+        :param retry_backoff: seconds to wait before the first retry, doubled for each retry after that
         """
 
         self.topic = topic
@@ -73,18 +141,31 @@ class PublisherConfig:
             self.async_enable_acks = True
             self.async_enable_nacks_only = False
         elif async_acknowledgement_options == self.AcknowledgementOptions.NACKS_ONLY:
-            self.enable_acks = False
-            self.enable_nacks_only = True
+            self.async_enable_acks = False
+            self.async_enable_nacks_only = True
         elif async_acknowledgement_options == self.AcknowledgementOptions.NONE:
             self.async_enable_acks = False
             self.async_enable_nacks_only = False
         self.async_auto_send = async_auto_send
         self.async_auto_send_amount = async_auto_send_amount
         self.async_auto_send_interval_millis = async_auto_send_interval_millis
+        self.async_auto_send_adaptive = async_auto_send_adaptive
+        self.max_request_bytes = max_request_bytes
 
         # sync config options
         self.sync_timeout = sync_timeout
 
+        # queue bounds
+        self.queue_capacity = queue_capacity
+        self.queue_overflow = queue_overflow
+        self.ack_queue_capacity = ack_queue_capacity
+        self.ack_queue_overflow = ack_queue_overflow
+
+        # ack tracking
+        self.ack_timeout = ack_timeout
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
     def is_grpc(self):
         return self.protocol == self.Protocol.GRPC
 
@@ -103,11 +184,35 @@ class Publisher:
     Publisher Object for both grpc and web socket
     """
 
+    # seconds blocked waiting on acks or messages before checking for shutdown
+    POLL_INTERVAL = 1
+
     def __init__(self, eventhub_client, config, channel=None):
         self.eventhub_client = eventhub_client
         self._channel = channel
         self.config = config
         self._ws = None
+
+        # Operational, ready before any acks can arrive
+        self._rx_queue = BoundedQueue(config.ack_queue_capacity, config.ack_queue_overflow)
+        self._in_flight = {}
+        self._in_flight_due = []
+        self._in_flight_lock = threading.Condition()
+        self._tx_queue = BoundedQueue(config.queue_capacity, config.queue_overflow,
+                                      get_size=self._get_message_size)
+        self._tx_queue_lock = threading.Condition()
+        # Only one request at a time goes down the stream or web socket
+        self._send_lock = threading.Lock()
+        self._tx_queue_started = None
+        self._tx_queue_added = 0
+        self._batch_size = None
+        if config.async_auto_send_adaptive:
+            self._batch_size = AdaptiveBatchSize(config.async_auto_send_amount)
+        self.callback = None
+        self.last_send_time = 0
+        self._run_ack_generator = True
+        self._active = True
+
         if config.is_wss():
             self._init_publisher_ws()
         else:
@@ -115,20 +220,16 @@ class Publisher:
                 raise ValueError("must provide channel if using grpc to publish")
             self._init_grpc_publisher()
 
-        # Operational
-        self._rx_queue = []
-        self._tx_queue = []
-        self._tx_queue_lock = threading.Lock()
-        self.callback = None
-        self.last_send_time = 0
-        self._run_ack_generator = True
-        self._active = True
-
         if config.async_auto_send:
             t = threading.Thread(target=self._auto_send)
             t.daemon = True
             t.start()
 
+        if self._expects_nacks():
+            t = threading.Thread(target=self._watch_in_flight)
+            t.daemon = True
+            t.start()
+
     def __del__(self):
         """
         Destructor to make sure an open web socket connection is closed.
@@ -142,7 +243,7 @@ class Publisher:
             else:
                 logging.debug("stopping generators")
                 self.grpc_manager.stop_generator()
-                self._run_ack_generator = False
+                self._stop_ack_generator()
 
     """
     ####################################################################################
@@ -165,51 +266,54 @@ class Publisher:
             else:
                 logging.debug("stopping generators")
                 self.grpc_manager.stop_generator()
-                self._run_ack_generator = False
+                self._stop_ack_generator()
         self._active = False
+        self._tx_queue.close()
+        with self._tx_queue_lock:
+            self._tx_queue_lock.notify_all()
+
+        with self._in_flight_lock:
+            pending = list(self._in_flight.values())
+            self._in_flight = {}
+            self._in_flight_due = []
+            self._in_flight_lock.notify_all()
+        for entry in pending:
+            entry['future'].set_exception(PublishError(
+                "Publisher shut down before message %s was acknowledged." % entry['message'].id))
 
     def add_message(self, id, body, tags=False):
         """
-        add messages to the rx_queue
-        :param id: str message Id
+        add messages to the tx_queue
+        :param id: str message Id, unique among the messages not yet acknowledged
         :param body: str the message body
         :param tags: dict[string->string] tags to be associated with the message
         :return: self
         """
-        if not tags:
-            tags = {}
-        try:
-            self._tx_queue_lock.acquire()
-            self._tx_queue.append(
-                EventHub_pb2.Message(id=id, body=body, tags=tags, zone_id=self.eventhub_client.zone_id))
-        finally:
-            self._tx_queue_lock.release()
+        self._queue_message(id, body, tags)
         return self
 
+    def publish(self, id, body, tags=False):
+        """
+        add a message to the tx_queue, to be sent by publish_queue or auto send
+        :param id: str message Id, unique among the messages not yet acknowledged
+        :param body: str the message body
+        :param tags: dict[string->string] tags to be associated with the message
+        :return: concurrent.futures.Future resolving to the EventHub_pb2.Ack of the message once accepted, or
+            raising PublishError if it is rejected or never acknowledged
+        """
+        return self._queue_message(id, body, tags)
+
     def publish_queue(self):
         """
         Publish all messages that have been added to the queue for configured protocol
-        :return: None
+        :return: the acks of the messages published when sync, otherwise None
         """
-        self.last_send_time = time.time()
-        try:
-            self._tx_queue_lock.acquire()
-            start_length = len(self._rx_queue)
-            publish_amount = len(self._tx_queue)
-            if self.config.protocol == PublisherConfig.Protocol.GRPC:
-                self._publish_queue_grpc()
-            else:
-                self._publish_queue_wss()
-            self._tx_queue = []
-        finally:
-            self._tx_queue_lock.release()
+        futures = self._publish()
 
         if self.config.publish_type == self.config.Type.SYNC:
-            start_time = time.time()
-            while time.time() - start_time < self.config.sync_timeout and \
-                                    len(self._rx_queue) - start_length < publish_amount:
-                pass
-            return self._rx_queue
+            concurrent.futures.wait(futures, timeout=self.config.sync_timeout)
+            acks = [self._get_ack(future) for future in futures if future.done()]
+            return [ack for ack in acks if ack is not None]
 
     def ack_generator(self):
         """
@@ -220,65 +324,347 @@ class Publisher:
             logging.warning('cant use generator on a sync publisher')
             return
         while self._run_ack_generator:
-            while len(self._rx_queue) != 0:
-                logging.debug('yielding to client')
-                yield self._rx_queue.pop(0)
+            try:
+                ack = self._rx_queue.get(timeout=self.POLL_INTERVAL)
+            except six.moves.queue.Empty:
+                continue
+            logging.debug('yielding to client')
+            yield ack
         return
 
+    def _stop_ack_generator(self):
+        """
+        stop the ack generator, waking it if it is waiting on acks
+        :return: None
+        """
+        self._run_ack_generator = False
+        self._rx_queue.close()
+
+    def _get_ack(self, future):
+        """
+        Returns the ack a future resolved with, including the ack of a message the service rejected
+        :param future: concurrent.futures.Future of a message
+        :return: EventHub_pb2.Ack or None
+        """
+        error = future.exception()
+        if error is None:
+            return future.result()
+        return getattr(error, 'ack', None)
+
     """
     ####################################################################################
     Internal
     ####################################################################################
     """
 
+    def _queue_message(self, id, body, tags):
+        """
+        add a message to the tx_queue and start tracking it until it is acknowledged
+        :return: concurrent.futures.Future of the message
+        """
+        if not tags:
+            tags = {}
+        message = EventHub_pb2.Message(id=id, body=body, tags=tags, zone_id=self.eventhub_client.zone_id)
+        future = concurrent.futures.Future()
+
+        with self._in_flight_lock:
+            if id in self._in_flight:
+                raise ValueError("Message %s already in flight." % (id))
+            self._in_flight[id] = {
+                'message': message,
+                'future': future,
+                'attempts': 0,
+                'sent': None,
+                'due': None,
+                'retry': False,
+            }
+
+        try:
+            dropped = self._tx_queue.put(message)
+        except six.moves.queue.Full:
+            with self._in_flight_lock:
+                del self._in_flight[id]
+            raise
+
+        with self._tx_queue_lock:
+            self._tx_queue_added += 1
+            if self._tx_queue_started is None:
+                self._tx_queue_started = time.time()
+            if len(self._tx_queue) == 1 or self._is_send_due():
+                self._tx_queue_lock.notify_all()
+
+        if dropped is not None:
+            logging.warning('publish queue full, dropped message ' + dropped.id)
+            self._resolve(dropped.id, error=PublishError(
+                "Message %s dropped from the full publish queue." % dropped.id))
+        return future
+
+    def _get_message_size(self, message):
+        """
+        :param message: EventHub_pb2.Message
+        :return: the bytes the message adds to a serialized request, including its field tag and length
+        """
+        size = message.ByteSize()
+        length = 1
+        while size >> (7 * length):
+            length += 1
+        return size + 1 + length
+
+    def _get_batch_amount(self):
+        """
+        :return: how many messages auto send waits for before sending
+        """
+        if self._batch_size is not None:
+            return self._batch_size.size
+        return self.config.async_auto_send_amount
+
+    def _get_linger_remaining(self):
+        """
+        seconds until the oldest queued message has waited long enough. Callers are expected to hold the
+        tx_queue_lock.
+        """
+        linger = self.config.async_auto_send_interval_millis / 1000.0
+        if self._tx_queue_started is None:
+            return linger
+        return linger - (time.time() - self._tx_queue_started)
+
+    def _is_send_due(self):
+        """
+        whether the queue has reached one of the auto send thresholds. Callers are expected to hold the
+        tx_queue_lock.
+        """
+        if len(self._tx_queue) == 0:
+            return False
+        if len(self._tx_queue) >= self._get_batch_amount():
+            return True
+        if self._tx_queue.total_size >= self.config.max_request_bytes:
+            return True
+        return self._get_linger_remaining() <= 0
+
+    def _publish(self, max_messages=None):
+        """
+        send everything in the tx queue, in requests of no more than max_messages and max_request_bytes
+        :param max_messages: the most messages in one request, or None for no limit
+        :return: list of the futures of the messages sent
+        """
+        batches = []
+        try:
+            self._tx_queue_lock.acquire()
+            now = time.time()
+            if self._batch_size is not None and self.last_send_time:
+                self._batch_size.observe_arrivals(self._tx_queue_added, now - self.last_send_time)
+            self.last_send_time = now
+            self._tx_queue_added = 0
+            self._tx_queue_started = None
+
+            while True:
+                messages = self._tx_queue.drain(max_messages, max_size=self.config.max_request_bytes)
+                if not messages:
+                    break
+                batches.append(messages)
+        finally:
+            self._tx_queue_lock.release()
+
+        # Sent once the queue is released so publishing is never blocked on the network
+        futures = []
+        for messages in batches:
+            futures.extend(self._send_messages(messages))
+        return futures
+
+    def _send_messages(self, messages):
+        """
+        send the messages for the configured protocol, starting the clock on their acks.
+        Callers must not hold the tx_queue_lock, the messages are resolved here without acks.
+        :param messages: list of EventHub_pb2.Message
+        :return: list of the futures of the messages
+        """
+        futures = []
+        now = time.time()
+        with self._in_flight_lock:
+            for message in messages:
+                entry = self._in_flight.get(message.id)
+                if entry is None:
+                    continue
+                futures.append(entry['future'])
+                entry['sent'] = now
+                if self._expects_nacks():
+                    self._schedule(message.id, entry, now + self.config.ack_timeout, retry=False)
+            self._in_flight_lock.notify_all()
+
+        if messages:
+            with self._send_lock:
+                if self.config.protocol == PublisherConfig.Protocol.GRPC:
+                    self._publish_queue_grpc(messages)
+                else:
+                    self._publish_queue_wss(messages)
+
+        # Without acks there is nothing more to learn about the messages
+        if not self._expects_nacks():
+            for message in messages:
+                self._resolve(message.id)
+        return futures
+
+    def _expects_acks(self):
+        """
+        :return: whether the service acks accepted messages
+        """
+        return self.config.is_sync() or self.config.async_enable_acks
+
+    def _expects_nacks(self):
+        """
+        :return: whether the service acks failed messages
+        """
+        return self._expects_acks() or self.config.async_enable_nacks_only
+
+    def _schedule(self, id, entry, due, retry):
+        """
+        set when the message is next looked at by the in flight watcher, either to send it again or
+        because its ack is overdue. Callers are expected to hold the in_flight_lock.
+        """
+        entry['due'] = due
+        entry['retry'] = retry
+        heapq.heappush(self._in_flight_due, (due, id))
+
+    def _schedule_retry(self, id, entry):
+        """
+        mark the message to be sent again after backing off. Callers are expected to hold the in_flight_lock.
+        """
+        delay = self.config.retry_backoff * (2 ** entry['attempts'])
+        entry['attempts'] += 1
+        self._schedule(id, entry, time.time() + delay, retry=True)
+        self._in_flight_lock.notify_all()
+
+    def _resolve(self, id, ack=None, error=None):
+        """
+        stop tracking the message and resolve its future
+        :param id: str message Id
+        :param ack: EventHub_pb2.Ack the future resolves to
+        :param error: exception the future raises instead
+        :return: None
+        """
+        with self._in_flight_lock:
+            entry = self._in_flight.pop(id, None)
+        if entry is None:
+            return
+
+        # Resolve outside the lock as callbacks run in this thread
+        if error is not None:
+            entry['future'].set_exception(error)
+        else:
+            entry['future'].set_result(ack)
+
+    def _on_ack(self, ack):
+        """
+        resolve the future of the message the ack refers to, or schedule it to be sent again if it FAILED
+        :param ack: EventHub_pb2.Ack
+        :return: None
+        """
+        with self._in_flight_lock:
+            entry = self._in_flight.get(ack.id)
+            if entry is None:
+                logging.debug('ack for unknown message ' + ack.id)
+                return
+
+            if ack.status_code == EventHub_pb2.FAILED and entry['attempts'] < self.config.max_retries:
+                logging.debug('retrying message ' + ack.id)
+                self._schedule_retry(ack.id, entry)
+                return
+
+            del self._in_flight[ack.id]
+
+        if ack.status_code == EventHub_pb2.ACCEPTED:
+            if self._batch_size is not None and entry['sent'] is not None:
+                self._batch_size.observe_latency(time.time() - entry['sent'])
+            entry['future'].set_result(ack)
+        else:
+            entry['future'].set_exception(PublishError("Message %s failed with status %s: %s" % (
+                ack.id, EventHub_pb2.AckStatus.Name(ack.status_code), ack.desc), ack))
+
+    def _watch_in_flight(self):
+        """
+        blocking function sending messages again when their retry is due and handling messages whose ack is
+        overdue, waking only when the next one is due
+        :return: None
+        """
+        while self._active:
+            due = []
+            overdue = []
+            with self._in_flight_lock:
+                now = time.time()
+                while self._in_flight_due and self._in_flight_due[0][0] <= now:
+                    (when, id) = heapq.heappop(self._in_flight_due)
+                    entry = self._in_flight.get(id)
+                    # Stale when the message was resolved or rescheduled since
+                    if entry is None or entry['due'] != when:
+                        continue
+
+                    entry['due'] = None
+                    if entry['retry']:
+                        due.append(entry['message'])
+                    elif self._expects_acks() and entry['attempts'] < self.config.max_retries:
+                        self._schedule_retry(id, entry)
+                    else:
+                        overdue.append(id)
+
+                if not due and not overdue:
+                    wait = self.POLL_INTERVAL
+                    if self._in_flight_due:
+                        wait = min(wait, self._in_flight_due[0][0] - now)
+                    self._in_flight_lock.wait(max(wait, 0.001))
+                    continue
+
+            for id in overdue:
+                if self._expects_acks():
+                    self._resolve(id, error=PublishError("Message %s was never acknowledged." % (id)))
+                else:
+                    # Only failures are acked so silence means the message was accepted
+                    self._resolve(id)
+
+            if due:
+                self._send_messages(due)
+
     def _auto_send(self):
         """
         auto send blocking function, when the interval or the message size has been reached, publish
         :return:
         """
-        while True:
-            if time.time() - self.last_send_time > self.config.async_auto_send_interval_millis or \
-                            len(self._tx_queue) >= self.config.async_auto_send_amount:
-                self.publish_queue()
+        while self._active:
+            with self._tx_queue_lock:
+                if len(self._tx_queue) == 0:
+                    self._tx_queue_lock.wait(self.POLL_INTERVAL)
+                    continue
+
+                if not self._is_send_due():
+                    self._tx_queue_lock.wait(min(max(self._get_linger_remaining(), 0.001), self.POLL_INTERVAL))
+                    continue
+            self._publish(self._get_batch_amount())
 
     def _generate_publish_headers(self):
         """
         generate the headers for the connection to event hub service based on the provided config
         :return: {} headers
         """
-        headers = {
-            'predix-zone-id': self.eventhub_client.zone_id
-        }
-        token = self.eventhub_client.service._get_bearer_token()
-        if self.config.is_grpc():
-            headers['authorization'] = token[(token.index(' ') + 1):]
-        else:
-            headers['authorization'] = token
-
-        if self.config.topic == '':
-            headers['topic'] = self.eventhub_client.zone_id + '_topic'
-        else:
-            headers['topic'] = self.config.topic
-
-        if self.config.publish_type == self.config.Type.SYNC:
-            headers['sync-acks'] = 'true'
-        else:
-            headers['sync-acks'] = 'false'
-            headers['send-acks-interval'] = str(self.config.async_cache_ack_interval_millis)
-            headers['acks'] = str(self.config.async_enable_acks).lower()
-            headers['nacks'] = str(self.config.async_enable_nacks_only).lower()
-            headers['cache-acks'] = str(self.config.async_cache_acks_and_nacks).lower()
-        return headers
+        return get_publish_headers(self.eventhub_client, self.config)
 
     def _publisher_callback(self, publish_ack):
         """
         publisher callback that grpc and web socket can pass messages to
-        address the received message onto the queue
-        :param publish_ack: EventHub_pb2.Ack the ack received from either wss or grpc
+        resolve the futures of the messages acked and add the acks onto the queue
+        :param publish_ack: EventHub_pb2.PublishResponse from grpc or EventHub_pb2.Ack from wss
         :return: None
         """
         logging.debug("ack received: " + str(publish_ack).replace('\n', ' '))
-        self._rx_queue.append(publish_ack)
+        if isinstance(publish_ack, EventHub_pb2.PublishResponse):
+            acks = publish_ack.ack
+        else:
+            acks = [publish_ack]
+
+        for ack in acks:
+            self._on_ack(ack)
+            if self.config.is_async():
+                dropped = self._rx_queue.put(ack)
+                if dropped is not None:
+                    logging.debug('ack queue full, dropped oldest ack')
 
     """
     ####################################################################################
@@ -292,16 +678,17 @@ class Publisher:
         :return: None
         """
         self._stub = EventHub_pb2_grpc.PublisherStub(channel=self._channel)
-        self.grpc_manager = Eventhub.GrpcManager(stub_call=self._stub.send,
-                                                 on_msg_callback=self._publisher_callback,
-                                                 metadata=self._generate_publish_headers().items())
+        self.grpc_manager = predix.data.eventhub.client.Eventhub.GrpcManager(stub_call=self._stub.send,
+                                                                             on_msg_callback=self._publisher_callback,
+                                                                             metadata=self._generate_publish_headers().items())
 
-    def _publish_queue_grpc(self):
+    def _publish_queue_grpc(self, messages):
         """
-        send the messages in the tx queue to the GRPC manager
+        send the messages taken from the tx queue to the GRPC manager
+        :param messages: list of EventHub_pb2.Message
         :return: None
         """
-        messages = EventHub_pb2.Messages(msg=self._tx_queue)
+        messages = EventHub_pb2.Messages(msg=messages)
         publish_request = EventHub_pb2.PublishRequest(messages=messages)
         self.grpc_manager.send_message(publish_request)
 
@@ -311,14 +698,15 @@ class Publisher:
     ####################################################################################
     """
 
-    def _publish_queue_wss(self):
+    def _publish_queue_wss(self, messages):
         """
         send the messages down the web socket connection as a json object
+        :param messages: list of EventHub_pb2.Message
         :return: None
         """
 
         msg = []
-        for m in self._tx_queue:
+        for m in messages:
             msg.append({'id': m.id, 'body': m.body, 'zone_id': m.zone_id})
         self._ws.send(json.dumps(msg), opcode=websocket.ABNF.OPCODE_BINARY)
 
@@ -333,7 +721,6 @@ class Publisher:
         headers = self._generate_publish_headers()
 
         logging.debug("URL=" + str(url))
-        logging.debug("HEADERS=" + str(headers))
 
         websocket.enableTrace(False)
         self._ws = websocket.WebSocketApp(url,
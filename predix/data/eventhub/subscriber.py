@@ -1,5 +1,68 @@
+import logging
+
+import six
+
 from predix.data.eventhub import EventHub_pb2, EventHub_pb2_grpc
-from predix.data.eventhub.client import Eventhub
+from predix.data.eventhub.buffer import BoundedQueue
+import predix.data.eventhub.client
+
+
+def get_acks_request(message):
+    """
+    build the request acking a received message or batch of messages
+    :param message: EventHub_pb2.Message or EventHub_pb2.SubscriptionMessage
+    :return: EventHub_pb2.SubscriptionResponse or EventHub_pb2.SubscriptionAcks
+    """
+    if isinstance(message, EventHub_pb2.SubscriptionMessage):
+        acks = []
+        for m in message.messages.msg:
+            acks.append(EventHub_pb2.Ack(id=m.id, partition=m.partition, offset=m.offset))
+        return EventHub_pb2.SubscriptionAcks(ack=acks)
+
+    ack = EventHub_pb2.Ack(id=message.id, partition=message.partition, offset=message.offset)
+    return EventHub_pb2.SubscriptionResponse(ack=[ack])
+
+
+def get_subscribe_headers(eventhub_client, config, acks=None, batching=None):
+    """
+    generate the subscribe stub headers based on the supplied config
+    :param eventhub_client: the Eventhub client subscribing
+    :param config: SubscribeConfig
+    :param acks: whether the service should expect acks, defaults to config.acks_enabled
+    :param batching: whether messages should be delivered in batches, defaults to config.batching_enabled
+    :return: list of header tuples
+    """
+    if acks is None:
+        acks = config.acks_enabled
+    if batching is None:
+        batching = config.batching_enabled
+
+    headers = []
+    headers.append(('predix-zone-id', eventhub_client.zone_id))
+
+    token = eventhub_client.service._get_bearer_token()
+    headers.append(('subscribername', config.subscriber_name))
+    headers.append(('authorization', token[(token.index(' ') + 1):]))
+
+    if not config.topics:
+        headers.append(('topic', eventhub_client.zone_id + '_topic'))
+    else:
+        for topic in config.topics:
+            headers.append(('topic', topic))
+
+    headers.append(('offset-newest', str(config.recency == config.Recency.NEWEST).lower()))
+
+    headers.append(('acks', str(acks).lower()))
+    if acks:
+        headers.append(('max-retries', str(config.ack_max_retries)))
+        headers.append(('retry-interval', str(config.ack_retry_interval_seconds) + 's'))
+        headers.append(('duration-before-retry', str(config.ack_duration_before_retry_seconds) + 's'))
+
+    if batching:
+        headers.append(('batch-size', str(config.batch_size)))
+        headers.append(('batch-interval', str(config.batch_interval_millis) + 'ms'))
+
+    return headers
 
 
 class SubscribeConfig:
@@ -21,7 +84,9 @@ class SubscribeConfig:
                  ack_duration_before_retry_seconds=30,
                  ack_max_retries=10,
                  ack_retry_interval_seconds=30,
-                 topics=None):
+                 topics=None,
+                 queue_capacity=100000,
+                 queue_overflow=BoundedQueue.BLOCK):
         """
         Subscribe Config
         :param subscriber_name: The name of the subscriber
@@ -34,6 +99,9 @@ class SubscribeConfig:
         :param ack_retry_interval_seconds: after the initial retry, what should be the period of the message retry
         :param recency: What messages should be sent when connected, all messages in the queue or only new messages
         :param topics: What topics should be subscribed too
+        :param queue_capacity: the most received messages waiting to be read from subscribe
+        :param queue_overflow: what to do with a message received when the queue is full, BoundedQueue.BLOCK
+            stops reading from the service until there is space, BoundedQueue.DROP_OLDEST message
         """
         self.subscriber_name = subscriber_name
         self.batching_enabled = batching_enabled
@@ -44,10 +112,15 @@ class SubscribeConfig:
         self.ack_duration_before_retry_seconds = ack_duration_before_retry_seconds
         self.ack_max_retries = ack_max_retries
         self.ack_retry_interval_seconds = ack_retry_interval_seconds
+        self.queue_capacity = queue_capacity
+        self.queue_overflow = queue_overflow
         self.topics = topics if topics is not None else []
         if topics is not None:
             raise
 class Subscriber:
+    # seconds blocked waiting on messages before checking for shutdown
+    POLL_INTERVAL = 1
+
     def __init__(self, eventhub_client, config, channel):
         self.eventhub_client = eventhub_client
         self._config = config
@@ -65,15 +138,15 @@ class Subscriber:
             initial_message = EventHub_pb2.SubscriptionRequest(subscriber=self._config.subscriber_name,
                                                                zone_id=self.eventhub_client.zone_id,
                                                                instance_id='predixpy-subscriber')
-        self._rx_messages = []
+        self._rx_messages = BoundedQueue(self._config.queue_capacity, self._config.queue_overflow)
         self.active = True
         self.run_subscribe_generator = True
-        self.grpc_manager = Eventhub.GrpcManager(stub_call=stub_call,
-                                                 on_msg_callback=self._subscriber_callback,
-                                                 metadata=self._generate_subscribe_headers(),
-                                                 tx_stream=tx_stream,
-                                                 initial_message=initial_message
-                                                 )
+        self.grpc_manager = predix.data.eventhub.client.Eventhub.GrpcManager(stub_call=stub_call,
+                                                                             on_msg_callback=self._subscriber_callback,
+                                                                             metadata=self._generate_subscribe_headers(),
+                                                                             tx_stream=tx_stream,
+                                                                             initial_message=initial_message
+                                                                             )
 
     def __del__(self):
         self.grpc_manager.stop_generator()
@@ -85,6 +158,7 @@ class Subscriber:
             self.active = False
             self.grpc_manager.stop_generator()
             self.run_subscribe_generator = False
+            self._rx_messages.close()
 
     def _subscriber_callback(self, rx_message):
         """
@@ -92,7 +166,16 @@ class Subscriber:
         :param rx_message: SubscriptionMessage or Message
         :return: None
         """
-        self._rx_messages.append(rx_message)
+        try:
+            dropped = self._rx_messages.put(rx_message)
+        except six.moves.queue.Full:
+            # closed by shutdown while waiting for space
+            if self.active:
+                raise
+            return
+
+        if dropped is not None:
+            logging.warning('subscribe queue full, dropped oldest message')
 
     def subscribe(self):
         """
@@ -100,57 +183,27 @@ class Subscriber:
         :return: None
         """
         while self.run_subscribe_generator:
-            if len(self._rx_messages) != 0:
-                yield self._rx_messages.pop(0)
+            try:
+                message = self._rx_messages.get(timeout=self.POLL_INTERVAL)
+            except six.moves.queue.Empty:
+                continue
+            yield message
         return
 
     def send_acks(self, message):
         """
         send acks to the service
-        :param message: EventHub_pb2.Message
+        :param message: EventHub_pb2.Message or EventHub_pb2.SubscriptionMessage
         :return: None
         """
-        if isinstance(message, EventHub_pb2.Message):
-            ack = EventHub_pb2.Ack(partition=message.partition, offset=message.offset)
-            self.grpc_manager.send_message(EventHub_pb2.SubscriptionResponse(ack=ack))
-
-        elif isinstance(message, EventHub_pb2.SubscriptionMessage):
-            acks = []
-            for m in message.messages:
-                acks.append(EventHub_pb2.Ack(parition=m.partition, offset=m.offset))
-            self.grpc_manager.send_message(EventHub_pb2.SubscriptionAcks(ack=acks))
+        self.grpc_manager.send_message(get_acks_request(message))
 
     def _generate_subscribe_headers(self):
         """
         generate the subscribe stub headers based on the supplied config
-        :return: i
+        :return: list of header tuples
         """
-        headers =[]
-        headers.append(('predix-zone-id', self.eventhub_client.zone_id))
-
-        token = self.eventhub_client.service._get_bearer_token()
-        headers.append(('subscribername', self._config.subscriber_name))
-        headers.append(('authorization', token[(token.index(' ') + 1):]))
-
-        if self._config.topics is []:
-            headers.append(('topic', self.eventhub_client.zone_id + '_topic'))
-        else:
-            for topic in self._config.topics:
-                headers.append(('topic', topic))
-
-        headers.append(('offset-newest', str(self._config.recency == self._config.Recency.NEWEST).lower()))
-
-        headers.append(('acks', str(self._config.acks_enabled).lower()))
-        if self._config.acks_enabled:
-            headers.append(('max-retries', str(self._config.ack_max_retries)))
-            headers.append(('retry-interval', str(self._config.ack_retry_interval_seconds) + 's'))
-            headers.append(('duration-before-retry', str(self._config.ack_duration_before_retry_seconds) + 's'))
-
-        if self._config.batching_enabled:
-            headers.append(('batch-size', str(self._config.batch_size)))
-            headers.append(('batch-interval', str(self._config.batch_interval_millis) + 'ms'))
-
-        return headers
+        return get_subscribe_headers(self.eventhub_client, self._config)
 
 
 def __del__(self):
@@ -0,0 +1,1424 @@
+
+import os
+import re
+import time
+import json
+import logging
+import datetime
+import socket
+import itertools
+import threading
+import weakref
+import websocket
+import collections
+import concurrent.futures
+
+import predix.config
+import predix.service
+import predix.transport
+
+from predix.data.timeseries.coalesce import SingleFlight
+
+
+class TimeSeries(object):
+    """
+    Client library for working with the Time Series service.
+
+    :param query_uri: URI for Time Series endpoint to execute queries, can be
+        derived from environment PREDIX_TIMESERIES_QUERY_URI variable if not
+        passed.
+
+    :param ingest_uri: URI for Time Series endpoint to ingest data, can be
+        derived from environment PREDIX_TIMESERIES_INGEST_URI variable if not
+        passed.
+
+    :param query_zone_id: Predix-Zone-Id for Query Authorization, can be
+        derived from environment PREDIX_TIMESERIES_QUERY_ZONE_ID.
+
+    :param ingest_zone_id: Predix-Zone-Id for Ingest Authorization, can be
+        derived from environment PREDIX_TIMESERIES_INGEST_ZONE_ID.
+
+    :param read: Whether we expect to be able to query / read data.
+
+    :param write: Whether we expect to be able to ingest / write data.
+
+    :param auto_flush: Whether a background worker should own the websocket
+        and send queued datapoints on its own, making queue() a cheap
+        non-blocking append.  Use flush() or close() to drain it, and
+        always close() the client when done as anything still queued is lost
+        once it is garbage collected.  A message that fails to send is kept
+        and tried again, or left in the spool when there is one.
+
+    :param auto_flush_datapoints: With auto_flush, send once this many
+        datapoints are queued.
+
+    :param auto_flush_bytes: With auto_flush, send once the queued message
+        is estimated to be about this many bytes.
+
+    :param auto_flush_linger_millis: With auto_flush, the longest time a
+        queued datapoint will wait before being sent.
+
+    :param max_in_flight: How many ingest messages may be sent before their
+        acknowledgement is received.  When more than 1, send() returns a
+        future that resolves to the ack and failed messages are retried.
+
+    :param pool_size: How many ingest websockets to spread messages over so
+        that several threads can be sending at the same time.
+
+    :param pool_strategy: Either 'least_loaded' or 'round_robin' for how
+        messages are spread over the pool.
+
+    :param spool: Optional predix.data.timeseries.spool.IngestSpool to write
+        ingest messages to local disk before sending so that nothing is
+        lost while the service can't be reached.  Spooled messages are
+        replayed in order.
+
+    :param cache: Optional predix.data.timeseries.cache.QueryCache to keep
+        query results locally and only fetch time ranges not yet held.
+
+    :param coalesce: Whether identical get_datapoints() queries made from
+        several threads at the same time should share a single request.
+        The callers then share the same response, which should not be
+        modified.
+
+    Learn more about Predix Time Series:
+    https://www.predix.io/services/service.html?id=1177
+
+    """
+    # "Constants" for data quality values
+    BAD = 0
+    UNCERTAIN = 1
+    NA = 2
+    GOOD = 3
+
+    def __init__(self, read=True, write=True, query_uri=None, ingest_uri=None,
+            query_zone_id=None, ingest_zone_id=None, auto_flush=False,
+            auto_flush_datapoints=5000, auto_flush_bytes=512*1024,
+            auto_flush_linger_millis=1000, max_in_flight=1, pool_size=1,
+            pool_strategy='least_loaded', spool=None, cache=None,
+            coalesce=False, *args, **kwargs):
+        """
+        Time Series by default will grant the client both read
+        and write permissions.  Either can be disabled.
+        """
+        super(TimeSeries, self).__init__(*args, **kwargs)
+
+        # Not all clients can read and write, so look to arguments on whether
+        # to validate permissions during initialization.
+        if read:
+            self.query_uri = query_uri or self._get_query_uri()
+            self.query_zone_id = query_zone_id or self._get_query_zone_id()
+
+        if write:
+            self.ingest_uri = ingest_uri or self._get_ingest_uri()
+            self.ingest_zone_id = ingest_zone_id or self._get_ingest_zone_id()
+
+        self.zone_id = self.query_zone_id or self.ingest_zone_id
+        self.service = predix.service.Service(self.zone_id)
+
+        # Optionally keep query results around locally
+        self.cache = cache
+
+        # Optionally share identical queries that are in flight
+        self._single_flight = None
+        if coalesce:
+            self._single_flight = SingleFlight()
+
+        # Store a websocket connection once opened
+        self.ws = None
+
+        # Pipeline ingest messages rather than waiting on each ack and
+        # spread them over several connections
+        self.max_in_flight = max_in_flight
+        self.pool_size = pool_size
+        self.pool_strategy = pool_strategy
+        self._pipeline = None
+        self._message_ids = itertools.count(int(round(time.time() * 1000)))
+
+        # Optionally write ahead to disk until the service accepts messages
+        self.spool = spool
+        self.spool_retry_interval = 5
+        self._spool_lock = threading.Lock()
+        self._spool_retry = 0
+
+        # Store in-memory and forward any datapoints as a single transaction,
+        # indexed by tag name and attributes so queuing stays constant time
+        self._queue = collections.OrderedDict()
+        self._queue_lock = threading.Condition()
+        self._queue_datapoints = 0
+        self._queue_bytes = 0
+        self._queue_started = None
+
+        # Optionally let a background worker decide when to send
+        self.auto_flush = auto_flush
+        self.auto_flush_datapoints = auto_flush_datapoints
+        self.auto_flush_bytes = auto_flush_bytes
+        self.auto_flush_linger_millis = auto_flush_linger_millis
+        self._auto_flush_thread = None
+        self._auto_flush_sending = False
+        self._auto_flush_error = None
+        self._auto_flush_retry = 0
+        self._run_auto_flush = False
+        if auto_flush:
+            self._start_auto_flush()
+
+    def _get_query_uri(self):
+        """
+        Returns the URI endpoint for performing queries of a
+        Predix Time Series instance from environment inspection.
+        """
+        if 'VCAP_SERVICES' in os.environ:
+            services = json.loads(os.getenv('VCAP_SERVICES'))
+            predix_timeseries = services['predix-timeseries'][0]['credentials']
+            return predix_timeseries['query']['uri'].partition('/v1')[0]
+        else:
+            return predix.config.get_env_value(TimeSeries, 'query_uri')
+
+    def _get_query_zone_id(self):
+        """
+        Returns the ZoneId for performing queries of a Predix
+        Time Series instance from environment inspection.
+        """
+        if 'VCAP_SERVICES' in os.environ:
+            services = json.loads(os.getenv('VCAP_SERVICES'))
+            predix_timeseries = services['predix-timeseries'][0]['credentials']
+            return predix_timeseries['query']['zone-http-header-value']
+        else:
+            return predix.config.get_env_value(TimeSeries, 'query_zone_id')
+
+    def _get_ingest_uri(self):
+        """
+        Returns the URI endpoint for performing ingestion of data to
+        Predix Time Series instance from environment inspection.
+        """
+        if 'VCAP_SERVICES' in os.environ:
+            services = json.loads(os.getenv('VCAP_SERVICES'))
+            predix_timeseries = services['predix-timeseries'][0]['credentials']
+            return predix_timeseries['ingest']['uri']
+        else:
+            return predix.config.get_env_value(TimeSeries, 'ingest_uri')
+
+    def _get_ingest_zone_id(self):
+        """
+        Returns the ZoneId for ingesting data to a Predix
+        Time Series instance from environment inspection.
+        """
+        if 'VCAP_SERVICES' in os.environ:
+            services = json.loads(os.getenv('VCAP_SERVICES'))
+            predix_timeseries = services['predix-timeseries'][0]['credentials']
+            return predix_timeseries['ingest']['zone-http-header-value']
+        else:
+            return predix.config.get_env_value(TimeSeries, 'ingest_zone_id')
+
+    def __del__(self):
+        """
+        Destructor to make sure an open websocket connection is closed.
+        """
+        # No need to delete if not properly initialized
+        if not hasattr(self, '_queue'):
+            return
+
+        self._run_auto_flush = False
+
+        if len(self._queue) > 0:
+            logging.warning("%s buffered datapoints in queue lost." %
+                    (self._queue_datapoints))
+
+        if self.ws:
+            self.ws.close()
+
+    def authenticate_as_client(self, client_id, client_secret):
+        """
+        Will authenticate for the given client / secret.
+        """
+        self.service.uaa.authenticate(client_id, client_secret)
+
+    def _get_aggregations(self):
+        """
+        Returns all of the aggregations in time series.  There is no support
+        in the service for filtering or paginations.
+        """
+        url = self.query_uri + '/v1/aggregations'
+        return self.service._get(url)
+
+    def get_aggregations(self):
+        """
+        Returns all of the aggregations that can be used with the
+        Time Series Service.
+        """
+        return self._get_aggregations()['results']
+
+    def _get_tags(self):
+        """
+        Returns all of the tags in time series.  There is no support
+        in the service for filtering or paginations.
+        """
+        return self.service._get(self.query_uri + '/v1/tags')
+
+    def get_tags(self):
+        """
+        Returns a list of the tag names in the timeseries service
+        instance.
+        """
+        return self._get_tags()['results']
+
+    def _get_datapoints(self, params):
+        """
+        Will make a direct REST call with the given json body payload to
+        get datapoints.
+        """
+        url = self.query_uri + '/v1/datapoints'
+        return self.service._get(url, params=params)
+
+    def _post_datapoints(self, body):
+        url = self.query_uri + '/v1/datapoints'
+        return self.service._post(url, body)
+
+    def _stream_datapoints(self, params, post=False):
+        """
+        Make the query for datapoints returning the body of the response as
+        an iterable of chunks.
+        """
+        url = self.query_uri + '/v1/datapoints'
+        if post:
+            return self.service._stream(url, data=params)
+        else:
+            return self.service._stream(url,
+                    params={"query": json.dumps(params)})
+
+    def iter_datapoints(self, tags, post=False, chunk_size=10000, **kwargs):
+        """
+        Generator of the datapoints that match the given query in chunks as
+        the response is read, for results too large to hold in memory at
+        once.
+
+        Each chunk is a dictionary with the 'name' of the tag, the 'groups'
+        and 'attributes' of the result, and a list of up to chunk_size
+        [timestamp, value, quality] 'values'.
+
+        See spec for get_datapoints() for complete list of query options.
+        """
+        import predix.data.timeseries.stream
+
+        params = self._build_datapoints_query(tags, **kwargs)
+        events = predix.data.timeseries.stream.iter_events(
+                self._stream_datapoints(params, post=post),
+                chunk_size=chunk_size)
+        return predix.data.timeseries.stream.iter_values(events)
+
+    def get_values(self, *args, **kwargs):
+        """
+        Convenience method that for simple single tag queries will
+        return just the values to be iterated on.
+        """
+        if isinstance(args[0], list):
+            raise ValueError("Can only get_values() for a single tag.")
+
+        response = self.get_datapoints(*args, **kwargs)
+        for value in response['tags'][0]['results'][0]['values']:
+            yield [datetime.datetime.utcfromtimestamp(value[0]/1000),
+                   value[1],
+                   value[2]]
+
+    def is_good(self, quality):
+        """
+        Simple test if data quality is GOOD.
+        """
+        return quality == ts.GOOD
+
+    def is_bad(self, quality):
+        """
+        Simple test if data quality value is BAD.
+        """
+        return quality == ts.BAD
+
+    def get_datapoints(self, tags, start=None, end=None, order=None,
+            limit=None, qualities=None, attributes=None, measurement=None,
+            aggregations=None, post=False, sampling=None, as_arrays=False,
+            window=None, max_workers=4, stream=False):
+        """
+        Returns all of the datapoints that match the given query.
+
+            - tags: list or string identifying the name/tag (ie. "temp")
+            - start: data after this, absolute or relative (ie. '1w-ago' or
+              1494015972386)
+            - end: data before this value
+            - order: ascending (asc) or descending (desc)
+            - limit: only return a few values (ie. 25)
+            - qualities: data quality value (ie. [ts.GOOD, ts.UNCERTAIN])
+            - attributes: dictionary of key-values (ie. {'unit': 'mph'})
+            - measurement: tuple of operation and value (ie. ('gt', 30))
+            - aggregations: summary statistics on data results (ie. 'avg')
+            - post: POST query instead of GET (caching implication)
+            - sampling: interval the service computes each aggregation over
+              (ie. '1h' or milliseconds), otherwise a single value
+            - as_arrays: decode into NumPy arrays (see below)
+            - window: split the range into windows of this duration (ie.
+              '1d' or milliseconds) fetched in parallel, or 'auto' to size
+              windows from the number of datapoints in the range
+            - max_workers: how many windows to fetch at the same time
+            - stream: decode the response as it is read (with as_arrays)
+
+        A few additional observations:
+            - allow service to do most data validation
+            - order is applied before limit so resultset will differ
+
+        The returned results match what the service response is so you'll
+        need to unpack it as appropriate.  Oftentimes what you want for
+        a simple single tag query will be:
+
+            response['tags'][0]['results'][0]['values']
+
+        With as_arrays you will instead get a list with an entry for each
+        tag / result group holding contiguous int64 'timestamps', 'values'
+        (int64 or float64 when numeric), and int8 'qualities' arrays along
+        with the 'name', 'attributes', and 'groups' of the result.
+
+        With stream as well the arrays are built from chunks of the response
+        as it is read so that memory is bounded by the size of the arrays
+        rather than the response.  Streamed queries are not windowed or
+        cached.
+
+        """
+        params = self._build_datapoints_query(tags, start=start, end=end,
+                order=order, limit=limit, qualities=qualities,
+                attributes=attributes, measurement=measurement,
+                aggregations=aggregations, sampling=sampling)
+
+        if stream:
+            if not as_arrays:
+                raise ValueError("Streamed queries must be decoded as_arrays.")
+            if window:
+                raise ValueError("Streamed queries can not be windowed.")
+
+            import predix.data.timeseries.stream
+            import predix.data.timeseries.columnar
+            events = predix.data.timeseries.stream.iter_events(
+                    self._stream_datapoints(params, post=post))
+            return predix.data.timeseries.columnar.to_arrays_streamed(events)
+
+        def fetch(params):
+            if window:
+                return self._query_datapoints_windowed(params, window,
+                        max_workers=max_workers, post=post)
+            return self._query_datapoints(params, post=post)
+
+        def query():
+            if self.cache is not None and self.cache.is_cacheable(params):
+                return self.cache.get_datapoints(params, fetch)
+            return fetch(params)
+
+        if self._single_flight is not None:
+            key = json.dumps([params, post, window], sort_keys=True)
+            response = self._single_flight.do(key, query)
+        else:
+            response = query()
+
+        if as_arrays:
+            import predix.data.timeseries.columnar
+            return predix.data.timeseries.columnar.to_arrays(response)
+
+        return response
+
+    def tail(self, tags, interval=5, start=None, post=False, qualities=None,
+            attributes=None, measurement=None):
+        """
+        Generator of (name, timestamp, value, quality) for datapoints of the
+        given tag or tags as they arrive, polling every interval seconds.
+
+        Each tag keeps a high-water mark of the newest timestamp seen so a
+        poll only asks for datapoints from there, with any already seen at
+        the mark skipped.  All of the tags are polled in a single query.
+
+            - start: first datapoints to yield, absolute or relative (ie.
+              '1h-ago'), defaults to those arriving from now on
+
+        Datapoints ingested with a timestamp older than the mark of their
+        tag will not be seen.
+
+        ::
+
+            for (name, timestamp, value, quality) in ts.tail(['TEMP', 'RPM']):
+                print(name, value)
+
+        """
+        import predix.data.timeseries.query as planner
+
+        now = int(round(time.time() * 1000))
+        state = planner.Tail(tags, now, start=start)
+
+        while True:
+            began = time.time()
+            params = self._build_datapoints_query(state.tags,
+                    start=state.get_start(), order='asc',
+                    qualities=qualities, attributes=attributes,
+                    measurement=measurement)
+            response = self._query_datapoints(params, post=post)
+
+            for datapoint in state.get_new_datapoints(response):
+                yield datapoint
+
+            time.sleep(max(0, interval - (time.time() - began)))
+
+    def _build_datapoints_query(self, tags, start=None, end=None, order=None,
+            limit=None, qualities=None, attributes=None, measurement=None,
+            aggregations=None, sampling=None):
+        """
+        Returns the query for the given options in the form the service
+        expects, see get_datapoints() for details of each.
+        """
+        params = {}
+
+        # Documentation says start is required for GET but not POST, but
+        # seems to be required all the time, so using sensible default.
+        if not start:
+            start = '1w-ago'
+            logging.warning("Defaulting query for data with start date %s" % (start))
+
+        # Start date can be absolute or relative, only certain legal values
+        # but service will throw error if used improperly.  (ms, s, mi, h, d,
+        # w, mm, y).  Relative dates must end in -ago.
+        params['start'] = start
+
+        # Docs say when making POST with a start that end must also be
+        # specified, but this does not seem to be the case.
+        if end:
+            # MAINT: error when end < start which is handled by service
+            params['end'] = end
+
+        params['tags'] = []
+        if not isinstance(tags, list):
+            tags = [tags]
+
+        for tag in tags:
+            query = {}
+            query['name'] = tag
+
+            # Limit resultset with an integer value
+            if limit:
+                query['limit'] = int(limit)
+
+            # Order must be 'asc' or 'desc' but will get sensible error
+            # from service.
+            if order:
+                query['order'] = order
+
+            # Filters are complex and support filtering by
+            # quality, measurement, and attributes.
+            filters = {}
+
+            # Check for the quality of the datapoints
+            if qualities is not None:
+                if isinstance(qualities, int) or isinstance(qualities, str):
+                    qualities = [qualities]
+
+                # Timeseries expects quality to be a string, not integer,
+                # so coerce each into a string
+                for i, quality in enumerate(qualities):
+                    qualities[i] = str(quality)
+
+                filters['qualities'] = {"values": qualities}
+
+            # Check for attributes on the datapoints, expected to be
+            # a dictionary of key / value pairs that datapoints must match.
+            if attributes is not None:
+                if not isinstance(attributes, dict):
+                    raise ValueError("Attribute filters must be dictionary.")
+
+                filters['attributes'] = attributes
+
+            # Check for measurements that meets a given comparison operation
+            # such as ge, gt, eq, ne, le, lt
+            if measurement is not None:
+                filters['measurements'] = {
+                        'condition': measurement[0],
+                        'values': measurement[1]
+                        }
+
+            # If we found any filters add them to the query
+            if filters:
+                query['filters'] = filters
+
+            # Handle any additional aggregations of dataset
+            if aggregations is not None:
+                if not isinstance(aggregations, list):
+                    aggregations = [aggregations]
+
+                # Without an interval the service summarizes the range
+                if sampling is not None:
+                    import predix.data.timeseries.query as planner
+                    interval = planner.get_sampling(sampling)
+                else:
+                    interval = {'datapoints': 1}
+
+                query['aggregations'] = []
+                for aggregation in aggregations:
+                    query['aggregations'].append({
+                        'sampling': interval,
+                        'type': aggregation })
+
+            params['tags'].append(query)
+
+        return params
+
+    def _query_datapoints(self, params, post=False):
+        """
+        Make the query for datapoints as a POST or GET.
+        """
+        if post:
+            return self._post_datapoints(params)
+        else:
+            return self._get_datapoints({"query": json.dumps(params)})
+
+    def _query_datapoints_windowed(self, params, window, max_workers=4,
+            post=False):
+        """
+        Split the time range of the query into windows that are fetched
+        concurrently and stitched back together in order.
+        """
+        import predix.data.timeseries.query as planner
+
+        now = int(round(time.time() * 1000))
+        plan = planner.WindowedQuery(params, now, window)
+
+        # Count the datapoints in the range to pick a window size that
+        # keeps each query under the service maximum.
+        probe = plan.get_count_query()
+        if probe is not None:
+            plan.set_count(self._query_datapoints(probe, post=post))
+
+        def fetch(query):
+            return self._query_datapoints(query, post=post)
+
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            for batch in plan.get_batches(max_workers):
+                plan.add(pool.map(fetch, batch))
+        finally:
+            pool.shutdown(wait=True)
+
+        return plan.get_response()
+
+    def get_frame(self, *args, **kwargs):
+        """
+        Convenience method that returns the results of get_datapoints() as a
+        pandas DataFrame indexed by UTC timestamp with one column per tag
+        (or tag and result group).  Pass qualities_column=True to also get
+        a '.quality' column for each.
+
+        See spec for get_datapoints() for complete list of options.
+        """
+        import predix.data.timeseries.columnar
+
+        qualities = kwargs.pop('qualities_column', False)
+        kwargs['as_arrays'] = True
+        columns = self.get_datapoints(*args, **kwargs)
+        return predix.data.timeseries.columnar.to_frame(columns,
+                qualities=qualities)
+
+    def _get_latest(self, params):
+        """
+        Will directly pass the given params as parameters
+        to the GET endpoint.
+        """
+        uri = self.query_uri + '/v1/datapoints/latest'
+        return self.service._get(uri, params=params)
+
+    def _post_latest(self, body):
+        """
+        Will directly pass the given body object as the JSON
+        payload to a POST call.
+        """
+        uri = self.query_uri + '/v1/datapoints/latest'
+        return self.service._post(uri, body)
+
+    def get_latest(self, tags, post=False):
+        """
+        Similar to get_datapoints() but will only return the very
+        last datapoint ingested for the given tag or tags (if a list).
+
+        If given the optional post parameter will make the call as a POST
+        rather than a GET request.  The GET can have an advantage of url
+        based response caching and the POST has the advantage of a larger
+        and more complex query.
+        """
+        params = self._build_latest_query(tags)
+
+        def fetch(params):
+            if post:
+                return self._post_latest(params)
+            else:
+                return self._get_latest(params)
+
+        if self.cache is not None:
+            return self.cache.get_latest(params, fetch)
+
+        return fetch(params)
+
+    def get_latest_values(self, tags, max_tags=None, max_url_length=None,
+            max_workers=4):
+        """
+        Returns a dictionary of each tag to the (timestamp, value, quality)
+        of the very last datapoint ingested, or None when there is none.
+
+        Meant for thousands of tags, which are split into batches of at most
+        max_tags fetched concurrently by max_workers.  Each batch is a GET
+        unless its list of tags is longer than max_url_length in which case
+        it is a POST.
+
+        ::
+
+            latest = ts.get_latest_values(tags)
+            (timestamp, value, quality) = latest['TEMP']
+
+        """
+        import predix.data.timeseries.query as planner
+
+        latest = planner.LatestValues(tags, max_tags=max_tags,
+                max_length=max_url_length)
+
+        def fetch(query):
+            (params, post) = query
+            query = self._post_latest if post else self._get_latest
+            if self.cache is not None:
+                return self.cache.get_latest(params, query)
+            return query(params)
+
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            responses = list(pool.map(fetch, latest.get_queries()))
+        finally:
+            pool.shutdown(wait=True)
+
+        return latest.get_values(responses)
+
+    def _build_latest_query(self, tags):
+        """
+        Returns the query for latest datapoints of the given tags.
+        """
+        params = {}
+        if isinstance(tags, list):
+            params['tags'] = str.join(',', tags)
+        elif isinstance(tags, str):
+            params['tags'] = tags
+        else:
+            raise ValueError("Expect to get tags as a str or list")
+
+        return params
+
+    def _get_ingest_headers(self):
+        """
+        Headers for opening an ingest websocket connection.
+        """
+        return {
+            'Authorization': self.service._get_bearer_token(),
+            'Predix-Zone-Id': self.ingest_zone_id,
+            'Content-Type': 'application/json',
+        }
+
+    def _create_connection(self):
+        """
+        Create a new websocket connection with proper headers.
+        """
+        logging.debug("Initializing new websocket connection.")
+        headers = self._get_ingest_headers()
+        url = self.ingest_uri
+
+        logging.debug("URL=" + str(url))
+
+        return predix.transport.create_websocket(url, header=headers)
+
+    def _get_websocket(self, reuse=True):
+        """
+        Reuse existing connection or create a new connection.
+        """
+        # Check if still connected
+        if self.ws and reuse:
+            if self.ws.connected:
+                return self.ws
+
+            logging.debug("Stale connection, reconnecting.")
+
+        self.ws = self._create_connection()
+        return self.ws
+
+    def _send_to_timeseries(self, message):
+        """
+        Establish or reuse socket connection and send
+        the given message to the timeseries service.
+        """
+        logging.debug("MESSAGE=" + str(message))
+
+        if self.max_in_flight > 1 or self.pool_size > 1:
+            return self._get_pipeline().send(message)
+
+        # Only try again when the message could not be sent at all, once it
+        # has been sent the service may have accepted it.
+        payload = json.dumps(message)
+        try:
+            ws = self._get_websocket()
+            ws.send(payload)
+        except (websocket.WebSocketConnectionClosedException,
+                socket.error) as e:
+            logging.debug("Connection failed, will try again.")
+            logging.debug(e)
+
+            ws = self._get_websocket(reuse=False)
+            ws.send(payload)
+
+        result = ws.recv()
+        logging.debug("RESULT=" + str(result))
+        return result
+
+    def _get_pipeline(self):
+        """
+        Returns the pipeline used to keep several messages in flight, or
+        the pool of connections (and pipelines) to spread them over.
+        """
+        if self._pipeline is not None:
+            return self._pipeline
+
+        import predix.data.timeseries.pool
+        import predix.data.timeseries.pipeline
+
+        members = []
+        for i in range(max(self.pool_size, 1)):
+            if self.max_in_flight > 1:
+                members.append(predix.data.timeseries.pipeline.IngestPipeline(
+                    self._create_connection,
+                    max_in_flight=self.max_in_flight))
+            else:
+                members.append(predix.data.timeseries.pool.IngestConnection(
+                    self._create_connection))
+
+        with self._queue_lock:
+            if self._pipeline is None:
+                if len(members) == 1:
+                    self._pipeline = members[0]
+                else:
+                    self._pipeline = predix.data.timeseries.pool.IngestPool(
+                            members, strategy=self.pool_strategy)
+
+        return self._pipeline
+
+    def queue(self, name, value, quality=None, timestamp=None,
+            attributes=None):
+        """
+        To reduce network traffic, you can buffer datapoints and
+        then flush() anything in the queue.
+
+        :param name: the name / label / tag for sensor data
+
+        :param value: the sensor reading or value to record
+
+        :param quality: the quality value, use the constants BAD, GOOD, etc.
+            (optional and defaults to UNCERTAIN)
+
+        :param timestamp: the time the reading was recorded in epoch
+            milliseconds (optional and defaults to now)
+
+        :param attributes: dictionary for any key-value pairs to store with the
+            reading (optional)
+
+        """
+        # Get timestamp first in case delay opening websocket connection
+        # and it must have millisecond accuracy
+        if not timestamp:
+            timestamp = int(round(time.time() * 1000))
+        else:
+            # Coerce datetime objects to epoch
+            if isinstance(timestamp, datetime.datetime):
+                timestamp = int(round(int(timestamp.strftime('%s')) * 1000))
+
+        # Only specific quality values supported
+        if quality not in [self.BAD, self.GOOD, self.NA, self.UNCERTAIN]:
+            quality = self.UNCERTAIN
+
+        if attributes is not None:
+            self._validate_attributes(attributes)
+
+        # Rough size of the serialized [timestamp, value, quality] triple
+        # so that auto_flush can honour a byte limit without json encoding.
+        size = len(str(timestamp)) + len(str(value)) + 8
+
+        with self._queue_lock:
+            if not self._queue:
+                self._queue_started = time.time()
+
+            self._queue_datapoints += 1
+            self._queue_bytes += size
+            self._append_to_queue(name, [[timestamp, value, quality]],
+                    attributes)
+
+            if self.auto_flush and self._is_flush_due():
+                self._queue_lock.notify_all()
+
+    def queue_many(self, name, timestamps=None, values=None, qualities=None,
+            attributes=None):
+        """
+        Queue many datapoints at once from NumPy arrays or pandas objects
+        without paying the cost of a queue() call for each one.
+
+        :param name: the name / label / tag for the sensor data, or a pandas
+            DataFrame with a DatetimeIndex and one column per tag
+
+        :param timestamps: epoch milliseconds, datetime64 values or a
+            DatetimeIndex (optional when values is a pandas Series or name
+            is a DataFrame, in which case the index is used).  Naive
+            datetimes are treated as UTC.
+
+        :param values: the sensor readings or values to record, as a list,
+            array or pandas Series.  NaN values are skipped.
+
+        :param qualities: a single quality value or one per datapoint
+            (optional and defaults to UNCERTAIN)
+
+        :param attributes: dictionary for any key-value pairs to store with
+            every reading (optional)
+
+        ::
+
+            ts.queue_many('TEMP', [1494015972386, 1494015973386], [70.1, 70.3])
+            ts.queue_many(frame)
+            ts.send()
+
+        """
+        import numpy
+
+        # A frame holds one tag per column that all share the index
+        if hasattr(name, 'columns'):
+            for column in name.columns:
+                self.queue_many(str(column), timestamps=timestamps,
+                        values=name[column], qualities=qualities,
+                        attributes=attributes)
+            return
+
+        if timestamps is None:
+            if not hasattr(values, 'index'):
+                raise ValueError("Must provide timestamps for the values.")
+            timestamps = values.index
+
+        timestamps = self._to_epoch_millis(timestamps)
+        values = numpy.asarray(values)
+        if timestamps.shape != values.shape:
+            raise ValueError("Expect same number of timestamps and values.")
+
+        # Only specific quality values supported
+        if qualities is None:
+            qualities = numpy.full(values.shape, self.UNCERTAIN, dtype='int8')
+        else:
+            qualities = numpy.broadcast_to(numpy.asarray(qualities),
+                    values.shape)
+            valid = numpy.isin(qualities,
+                    [self.BAD, self.GOOD, self.NA, self.UNCERTAIN])
+            qualities = numpy.where(valid, qualities, self.UNCERTAIN)
+
+        # Frames with unaligned columns will have gaps the service can't take
+        if values.dtype.kind == 'f':
+            present = ~numpy.isnan(values)
+            if not present.all():
+                timestamps = timestamps[present]
+                values = values[present]
+                qualities = qualities[present]
+
+        if attributes is not None:
+            self._validate_attributes(attributes)
+
+        points = [list(point) for point in zip(timestamps.tolist(),
+            values.tolist(), qualities.tolist())]
+        if not points:
+            return
+
+        # Estimate size from the first point like queue() does for one
+        size = len(str(points[0][0])) + len(str(points[0][1])) + 8
+
+        # With auto_flush hand over in chunks so a large backfill turns into
+        # several messages rather than one the service would reject.
+        chunk = len(points)
+        if self.auto_flush:
+            chunk = max(int(self.auto_flush_datapoints), 1)
+
+        for start in range(0, len(points), chunk):
+            with self._queue_lock:
+                while self.auto_flush and self._run_auto_flush and \
+                        self._queue_datapoints >= self.auto_flush_datapoints:
+                    self._queue_lock.notify_all()
+                    self._queue_lock.wait()
+
+                if not self._queue:
+                    self._queue_started = time.time()
+
+                batch = points[start:start + chunk]
+                self._queue_datapoints += len(batch)
+                self._queue_bytes += size * len(batch)
+                self._append_to_queue(name, batch, attributes)
+
+                if self.auto_flush and self._is_flush_due():
+                    self._queue_lock.notify_all()
+
+    def _to_epoch_millis(self, timestamps):
+        """
+        Convert an array-like of timestamps into an int64 array of
+        epoch milliseconds in a single pass.
+        """
+        import numpy
+
+        # Timezone aware pandas values need to be normalized to UTC
+        tz = getattr(timestamps, 'tz', None)
+        if tz is None:
+            tz = getattr(getattr(timestamps, 'dt', None), 'tz', None)
+        if tz is not None:
+            import pandas
+            timestamps = pandas.DatetimeIndex(timestamps).tz_convert('UTC')
+            timestamps = timestamps.tz_localize(None)
+
+        timestamps = numpy.asarray(timestamps)
+        if timestamps.dtype.kind == 'O':
+            timestamps = timestamps.astype('datetime64[ms]')
+
+        if timestamps.dtype.kind == 'M':
+            return timestamps.astype('datetime64[ms]').astype('int64')
+
+        return timestamps.astype('int64')
+
+    def _append_to_queue(self, name, points, attributes):
+        """
+        Add datapoints for a tag to the in-memory queue.  Callers are
+        expected to hold the queue lock.
+        """
+        # Points with the same name but different attributes need to be
+        # kept apart so attributes are not lost.
+        key = name
+        if attributes:
+            key = (name, tuple(sorted((k, str(v))
+                for (k, v) in attributes.items())))
+
+        # Check if adding to queue of an existing tag and add second datapoint
+        datapoint = self._queue.get(key)
+        if datapoint is not None:
+            datapoint['datapoints'].extend(points)
+            return
+
+        # If adding new tag, initialize and set any attributes
+        datapoint = {
+            "name": name,
+            "datapoints": list(points)
+        }
+
+        # Attributes are extra details for a datapoint
+        if attributes is not None:
+            datapoint['attributes'] = attributes
+            self._queue_bytes += len(json.dumps(attributes))
+
+        self._queue_bytes += len(name) + 32
+        self._queue[key] = datapoint
+        logging.debug("QUEUE: " + str(len(self._queue)))
+
+    def _validate_attributes(self, attributes):
+        """
+        Attributes are extra details for a datapoint, validate that they
+        follow the rules of the service.
+        """
+        if not isinstance(attributes, dict):
+            raise ValueError("Attributes are expected to be a dictionary.")
+
+        # Validate rules for attribute keys to provide guidance.
+        invalid_value = ':;= '
+        has_invalid_value = re.compile(r'[%s]' % (invalid_value)).search
+        has_valid_key = re.compile(r'^[\w\.\/\-]+$').search
+
+        for (key, val) in list(attributes.items()):
+            # Values cannot be empty
+            if (val == '') or (val is None):
+                raise ValueError("Attribute (%s) must have a non-empty value." % (key))
+
+            # Values should be treated as a string for regex validation
+            val = str(val)
+
+            # Values cannot contain certain arbitrary characters
+            if bool(has_invalid_value(val)):
+                raise ValueError("Attribute (%s) cannot contain (%s)." %
+                        (key, invalid_value))
+
+            # Attributes have to be alphanumeric-ish
+            if not bool(has_valid_key):
+                raise ValueError("Key (%s) not alphanumeric-ish." % (key))
+
+    def _take_queue_message(self):
+        """
+        Empty the queue into a message ready to be sent to the service.
+        Callers are expected to hold the queue lock.
+        """
+        # Acks are matched up by messageId so each must be unique
+        msg = {
+            "messageId": next(self._message_ids),
+            "body": list(self._queue.values())
+        }
+
+        self._queue = collections.OrderedDict()
+        self._queue_datapoints = 0
+        self._queue_bytes = 0
+        self._queue_started = None
+
+        return msg
+
+    def _is_flush_due(self):
+        """
+        Whether anything queued has crossed one of the auto_flush
+        thresholds.  Callers are expected to hold the queue lock.
+        """
+        if not self._queue:
+            return False
+
+        # Back off for a while after a failed send
+        if time.time() < self._auto_flush_retry:
+            return False
+
+        if self._queue_datapoints >= self.auto_flush_datapoints:
+            return True
+
+        if self._queue_bytes >= self.auto_flush_bytes:
+            return True
+
+        return self._get_linger_remaining() <= 0
+
+    def _get_linger_remaining(self):
+        """
+        Seconds until the oldest queued datapoint has waited long enough.
+        """
+        if self._queue_started is None:
+            return self.auto_flush_linger_millis / 1000.0
+
+        waited = time.time() - self._queue_started
+        return self.auto_flush_linger_millis / 1000.0 - waited
+
+    def _start_auto_flush(self):
+        """
+        Start the background worker that sends queued datapoints.
+        """
+        # The worker only holds a weak reference so a client that is never
+        # closed can still be collected, which also stops the worker.
+        self._run_auto_flush = True
+        self._auto_flush_thread = threading.Thread(target=_auto_flush,
+                args=(weakref.ref(self),))
+        self._auto_flush_thread.daemon = True
+        self._auto_flush_thread.start()
+
+    def _auto_flush_once(self):
+        """
+        Wait a while for a threshold to be reached and then send everything
+        in the queue.  Returns False once the worker should stop.
+        """
+        with self._queue_lock:
+            if self._is_auto_flush_idle():
+                # Wake up now and then so the worker lets go of the client
+                timeout = max(self._get_linger_remaining(),
+                        self._auto_flush_retry - time.time(), 0.001)
+                self._queue_lock.wait(min(timeout, 1.0))
+                if self._is_auto_flush_idle():
+                    return True
+
+            if not self._queue:
+                if not self._run_auto_flush:
+                    return False
+                if not self._is_replay_due():
+                    return True
+                msg = None
+            else:
+                msg = self._take_queue_message()
+            self._auto_flush_sending = True
+
+        try:
+            if msg is None:
+                self.replay_spool()
+            else:
+                result = self._deliver(msg)
+                if isinstance(result, concurrent.futures.Future):
+                    result.add_done_callback(self._on_auto_flush_ack)
+        except Exception as e:
+            logging.error(e)
+            with self._queue_lock:
+                self._auto_flush_error = e
+                if msg is not None:
+                    self._on_auto_flush_failure(msg)
+        finally:
+            with self._queue_lock:
+                self._auto_flush_sending = False
+                self._queue_lock.notify_all()
+
+        return True
+
+    def _is_auto_flush_idle(self):
+        """
+        Whether the worker has nothing to do right now.  Callers are
+        expected to hold the queue lock.
+        """
+        return self._run_auto_flush and not self._is_flush_due() and \
+                not self._is_replay_due()
+
+    def _on_auto_flush_failure(self, message):
+        """
+        Keep a message the worker could not send so it is tried again.
+        Callers are expected to hold the queue lock.
+        """
+        datapoints = sum(len(datapoint['datapoints'])
+                for datapoint in message['body'])
+        logging.error("Failed to send %s tags to time series." %
+                (len(message['body'])))
+
+        # A spool already holds on to the message to replay it later
+        if self.spool is not None:
+            return
+
+        if not self._run_auto_flush:
+            logging.warning("%s buffered datapoints in queue lost." %
+                    (datapoints))
+            return
+
+        self._requeue_message(message)
+        self._auto_flush_retry = time.time() + self.spool_retry_interval
+
+    def _requeue_message(self, message):
+        """
+        Put the datapoints of a message that could not be sent back in
+        front of anything queued since.  Callers are expected to hold the
+        queue lock.
+        """
+        queued_bytes = self._queue_bytes
+        newer = list(self._queue.values())
+        self._queue = collections.OrderedDict()
+        for datapoint in message['body'] + newer:
+            self._append_to_queue(datapoint['name'], datapoint['datapoints'],
+                    datapoint.get('attributes'))
+
+        self._queue_datapoints += sum(len(datapoint['datapoints'])
+                for datapoint in message['body'])
+        self._queue_bytes = queued_bytes + len(json.dumps(message['body']))
+        self._queue_started = time.time()
+
+    def _is_replay_due(self):
+        """
+        Whether messages left in the spool after a failure should be tried
+        again.
+        """
+        if self.spool is None or time.time() < self._spool_retry:
+            return False
+
+        return self._spool_retry > 0 and \
+                self.spool.get_metrics()['messages'] > 0
+
+    def _deliver(self, message):
+        """
+        Send the message, by way of the spool when there is one.
+        """
+        if self.spool is None:
+            return self._send_to_timeseries(message)
+
+        self.spool.append(message)
+        return self.replay_spool()
+
+    def replay_spool(self):
+        """
+        Send any messages in the spool in order, stopping at the first one
+        the service does not accept so it can be replayed later.  Returns
+        the result of the last message accepted.
+        """
+        if self.spool is None:
+            return None
+
+        result = None
+        with self._spool_lock:
+            while True:
+                batch = self.spool.peek(max_messages=max(self.max_in_flight,
+                    1))
+                if not batch:
+                    self._spool_retry = 0
+                    return result
+
+                # Send the whole batch before waiting on any pipelined acks
+                sent = []
+                try:
+                    for (position, message) in batch:
+                        sent.append((position,
+                            self._send_to_timeseries(message)))
+                except Exception as e:
+                    logging.warning("Unable to send spooled message: %s" % e)
+
+                for (position, pending) in sent:
+                    try:
+                        if isinstance(pending, concurrent.futures.Future):
+                            pending = self._get_pipelined_ack(pending)
+                        self._check_ack(pending)
+                    except Exception as e:
+                        logging.warning("Spooled message not accepted: %s" %
+                                (e))
+                        self._spool_retry = time.time() + \
+                                self.spool_retry_interval
+                        return None
+
+                    self.spool.commit(position)
+                    result = pending
+
+                if len(sent) < len(batch):
+                    self._spool_retry = time.time() + \
+                            self.spool_retry_interval
+                    return None
+
+    def _get_pipelined_ack(self, future):
+        """
+        Returns the ack of a pipelined message, including one the service
+        rejected outright, raising only when it could be sent again.
+        """
+        try:
+            return future.result()
+        except Exception as e:
+            if getattr(e, 'ack', None) is None:
+                raise
+            return e.ack
+
+    def _check_ack(self, ack):
+        """
+        Raise for an ack the service may accept if sent again, messages it
+        rejects outright would never be accepted so are not kept.
+        """
+        if isinstance(ack, dict):
+            status = ack.get('statusCode')
+        else:
+            try:
+                status = json.loads(ack).get('statusCode')
+            except (TypeError, ValueError, AttributeError):
+                return
+
+        if status is None:
+            return
+
+        status = int(status)
+        if status == 429 or status >= 500:
+            raise IOError("Service responded with status %s." % (status))
+
+        if status >= 400:
+            logging.error("Service rejected message with status %s." %
+                    (status))
+
+    def _on_auto_flush_ack(self, future):
+        """
+        Keep any failure of a pipelined message for flush() to raise.
+        """
+        error = future.exception()
+        if error is not None:
+            logging.error(error)
+            with self._queue_lock:
+                self._auto_flush_error = error
+                self._queue_lock.notify_all()
+
+    def flush(self):
+        """
+        Send anything in the queue to the time series service.
+
+        With auto_flush this will block until the background worker has
+        sent everything queued so far and raise any error it ran into,
+        in which case what failed to send stays queued.
+        With max_in_flight it will also wait until every message sent has
+        been acknowledged.
+        """
+        if not self.auto_flush:
+            result = self.send()
+            if isinstance(result, concurrent.futures.Future):
+                self._pipeline.flush()
+                return result.result()
+            return result
+
+        with self._queue_lock:
+            # Linger and any back off are over once somebody asks for a flush
+            if self._queue:
+                self._queue_started = 0
+                self._auto_flush_retry = 0
+            self._queue_lock.notify_all()
+
+            while (self._queue or self._auto_flush_sending) and \
+                    self._auto_flush_error is None:
+                self._queue_lock.wait()
+
+        if self._pipeline is not None:
+            self._pipeline.flush()
+
+        with self._queue_lock:
+            error = self._auto_flush_error
+            self._auto_flush_error = None
+
+        if error is not None:
+            raise error
+
+    def close(self):
+        """
+        Drain the queue, stop any background worker and close the
+        websocket connection.
+        """
+        try:
+            if self._queue or self._auto_flush_sending:
+                self.flush()
+        finally:
+            if self._auto_flush_thread is not None:
+                with self._queue_lock:
+                    self._run_auto_flush = False
+                    self._queue_lock.notify_all()
+                self._auto_flush_thread.join()
+                self._auto_flush_thread = None
+
+            if self._pipeline is not None:
+                self._pipeline.close()
+                self._pipeline = None
+
+            if self.spool is not None:
+                self.spool.close()
+
+            if self.ws:
+                self.ws.close()
+                self.ws = None
+
+    def send(self, name=None, value=None, **kwargs):
+        """
+        Can accept a name/tag and value to be queued and then send anything in
+        the queue to the time series service.  Optional parameters include
+        setting quality, timestamp, or attributes.
+
+        See spec for queue() for complete list of options.
+
+        Example of sending a batch of values:
+
+            queue('temp', 70.1)
+            queue('humidity', 20.4)
+            send()
+
+        Example of sending one and flushing queue immediately
+
+            send('temp', 70.3)
+            send('temp', 70.4, quality=ts.GOOD, attributes={'unit': 'F'})
+
+        With max_in_flight a future is returned that resolves to the ack
+        from the service instead of waiting on it.
+
+        """
+        if name and value:
+            self.queue(name, value, **kwargs)
+
+        # The background worker owns the websocket so let it do the sending
+        if self.auto_flush:
+            return self.flush()
+
+        with self._queue_lock:
+            msg = self._take_queue_message()
+
+        return self._deliver(msg)
+
+
+def _auto_flush(ref):
+    """
+    Blocking function run by the auto_flush worker thread, only holding on
+    to the client while there is something to do.
+    """
+    while True:
+        ts = ref()
+        if ts is None or not ts._auto_flush_once():
+            return
+        del ts
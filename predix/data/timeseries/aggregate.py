@@ -0,0 +1,178 @@
+"""
+Client-side aggregation of the columns returned by get_datapoints() with
+as_arrays, as an alternative to service-side aggregations when the raw
+datapoints are already at hand.  NumPy is required.
+
+Each function takes a single column (a dictionary with 'timestamps',
+'values', and 'qualities' arrays) and returns a new column in the same form
+so they can be chained and passed on to columnar.to_frame().
+
+::
+
+    columns = ts.get_datapoints('TEMP', start='1d-ago', as_arrays=True)
+    hourly = [aggregate.resample(column, '1h', 'avg') for column in columns]
+
+"""
+import numpy
+
+import predix.data.timeseries.query as planner
+
+# Quality given to datapoints filled in between those ingested
+UNCERTAIN = 1
+
+AGGREGATIONS = ['avg', 'min', 'max', 'sum', 'count', 'first', 'last']
+
+
+def _get_column(column, timestamps, values, qualities):
+    return dict(column, timestamps=timestamps, values=values,
+            qualities=qualities)
+
+
+def _get_sorted(column):
+    """
+    Returns the timestamps, values, and qualities of a column in order of
+    timestamp with values as float64.
+    """
+    timestamps = numpy.asarray(column['timestamps'], dtype='int64')
+    try:
+        values = numpy.asarray(column['values'], dtype='float64')
+    except (TypeError, ValueError):
+        raise ValueError("Can only aggregate numeric values.")
+    qualities = numpy.asarray(column['qualities'], dtype='int8')
+
+    if len(timestamps) > 1 and (numpy.diff(timestamps) < 0).any():
+        order = numpy.argsort(timestamps, kind='mergesort')
+        return (timestamps[order], values[order], qualities[order])
+
+    return (timestamps, values, qualities)
+
+
+def resample(column, interval, how='avg', origin=0):
+    """
+    Returns a column with a datapoint for each interval that has any
+    datapoints, timestamped at the start of the interval.
+
+    :param interval: duration of each bucket as milliseconds or a string in
+        service units (ie. '15mi')
+
+    :param how: one of avg, min, max, sum, count, first, or last
+
+    :param origin: epoch milliseconds the buckets are aligned to
+
+    The quality of each datapoint is the lowest of those in the bucket.
+    """
+    if how not in AGGREGATIONS:
+        raise ValueError("Aggregation must be one of %s." %
+                (', '.join(AGGREGATIONS)))
+
+    interval = planner.parse_duration(interval)
+    (timestamps, values, qualities) = _get_sorted(column)
+    if len(timestamps) == 0:
+        return _get_column(column, timestamps, values, qualities)
+
+    buckets = (timestamps - origin) // interval
+    starts = numpy.flatnonzero(numpy.r_[True, buckets[1:] != buckets[:-1]])
+    ends = numpy.r_[starts[1:], len(timestamps)]
+    counts = ends - starts
+
+    if how == 'avg':
+        result = numpy.add.reduceat(values, starts) / counts
+    elif how == 'sum':
+        result = numpy.add.reduceat(values, starts)
+    elif how == 'min':
+        result = numpy.minimum.reduceat(values, starts)
+    elif how == 'max':
+        result = numpy.maximum.reduceat(values, starts)
+    elif how == 'count':
+        result = counts.astype('float64')
+    elif how == 'first':
+        result = values[starts]
+    else:
+        result = values[ends - 1]
+
+    return _get_column(column, buckets[starts] * interval + origin, result,
+            numpy.minimum.reduceat(qualities, starts))
+
+
+def downsample(column, threshold):
+    """
+    Returns a column of at most threshold datapoints chosen with the
+    Largest-Triangle-Three-Buckets algorithm, which keeps the visual shape
+    of the series for plotting.
+    """
+    (timestamps, values, qualities) = _get_sorted(column)
+    count = len(timestamps)
+    if threshold >= count or threshold < 3:
+        return _get_column(column, timestamps, values, qualities)
+
+    x = timestamps.astype('float64')
+    y = values
+
+    # Bucket i of the points between first and last starts at bounds[i]
+    every = (count - 2) / float(threshold - 2)
+    bounds = (numpy.arange(threshold - 1) * every).astype('int64') + 1
+    bounds[-1] = count - 1
+
+    # Average of each bucket along with the last point as its own bucket
+    lengths = numpy.diff(numpy.r_[bounds, count])
+    average_x = numpy.add.reduceat(x, bounds) / lengths
+    average_y = numpy.add.reduceat(y, bounds) / lengths
+
+    selected = numpy.empty(threshold, dtype='int64')
+    selected[0] = 0
+    selected[-1] = count - 1
+
+    a = 0
+    for i in range(threshold - 2):
+        start = bounds[i]
+        end = bounds[i + 1]
+        area = numpy.abs((x[a] - average_x[i + 1]) * (y[start:end] - y[a]) -
+                (x[a] - x[start:end]) * (average_y[i + 1] - y[a]))
+        a = start + int(numpy.argmax(area))
+        selected[i + 1] = a
+
+    return _get_column(column, timestamps[selected], values[selected],
+            qualities[selected])
+
+
+def fill_gaps(column, interval, method='linear'):
+    """
+    Returns a column with a datapoint at every interval from the first
+    timestamp to the last, such as after resample().
+
+    :param interval: spacing of the datapoints as milliseconds or a string
+        in service units (ie. '15mi')
+
+    :param method: 'linear' to interpolate between neighbours, 'previous' to
+        carry the last value forward, or 'nan' to leave gaps as NaN
+
+    Datapoints that were filled in are given an UNCERTAIN quality.
+    """
+    if method not in ['linear', 'previous', 'nan']:
+        raise ValueError("Fill method must be linear, previous, or nan.")
+
+    interval = planner.parse_duration(interval)
+    (timestamps, values, qualities) = _get_sorted(column)
+    if len(timestamps) == 0:
+        return _get_column(column, timestamps, values, qualities)
+
+    grid = numpy.arange(timestamps[0], timestamps[-1] + 1, interval,
+            dtype='int64')
+
+    # Where each point of the grid falls among the original timestamps
+    after = numpy.searchsorted(timestamps, grid, side='right')
+    previous = after - 1
+    present = timestamps[previous] == grid
+
+    if method == 'linear':
+        filled = numpy.interp(grid, timestamps, values)
+    elif method == 'previous':
+        filled = values[previous]
+    else:
+        filled = numpy.full(len(grid), numpy.nan)
+    filled[present] = values[previous[present]]
+
+    filled_qualities = numpy.full(len(grid), UNCERTAIN, dtype='int8')
+    filled_qualities[present] = qualities[previous[present]]
+
+    return _get_column(column, grid, filled, filled_qualities)
@@ -0,0 +1,409 @@
+"""
+asyncio client for the Time Series service built on aiohttp, which is
+required to use it.
+"""
+import json
+import time
+import asyncio
+import logging
+import datetime
+
+import aiohttp
+
+import predix.aio
+import predix.transport
+import predix.data.timeseries
+import predix.data.timeseries.query as planner
+
+
+class AsyncTimeSeries(object):
+    """
+    Client library for working with the Time Series service from asyncio.
+
+    The surface matches TimeSeries but any call that talks to the service
+    is a coroutine, using non-blocking HTTP and websocket transports.
+    Configuration, building queries and queuing datapoints are those of a
+    TimeSeries client it wraps, which never talks to the service itself.
+
+    The auto_flush, max_in_flight, pool, spool, cache and coalesce options
+    of TimeSeries are not supported, sends from asyncio are already
+    concurrent.
+
+    :param ack_timeout: seconds to wait on the acknowledgement of an
+        ingest message
+
+    See TimeSeries for the remaining parameters.
+
+    ::
+
+        async with AsyncTimeSeries() as ts:
+            ts.queue('TEMP', 70.1)
+            await ts.send()
+
+            res = await ts.get_datapoints('TEMP', start='1h-ago')
+
+    """
+    BAD = predix.data.timeseries.TimeSeries.BAD
+    UNCERTAIN = predix.data.timeseries.TimeSeries.UNCERTAIN
+    NA = predix.data.timeseries.TimeSeries.NA
+    GOOD = predix.data.timeseries.TimeSeries.GOOD
+
+    def __init__(self, read=True, write=True, query_uri=None, ingest_uri=None,
+            query_zone_id=None, ingest_zone_id=None, ack_timeout=30):
+        self._client = predix.data.timeseries.TimeSeries(read=read,
+                write=write, query_uri=query_uri, ingest_uri=ingest_uri,
+                query_zone_id=query_zone_id, ingest_zone_id=ingest_zone_id)
+
+        self.query_uri = getattr(self._client, 'query_uri', None)
+        self.ingest_uri = getattr(self._client, 'ingest_uri', None)
+        self.service = self._client.service
+        self.ack_timeout = ack_timeout
+
+        self.ws = None
+        self._session = None
+        self._ws_lock = None
+        self._receiver = None
+        self._acks = {}
+
+    def authenticate_as_client(self, client_id, client_secret):
+        """
+        Will authenticate for the given client / secret.
+        """
+        self._client.authenticate_as_client(client_id, client_secret)
+
+    def queue(self, *args, **kwargs):
+        """
+        Queue a datapoint to be sent by send(), see TimeSeries.queue().
+        """
+        self._client.queue(*args, **kwargs)
+
+    def queue_many(self, *args, **kwargs):
+        """
+        Queue many datapoints of a tag to be sent by send(), see
+        TimeSeries.queue_many().
+        """
+        self._client.queue_many(*args, **kwargs)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    def _get_session(self):
+        """
+        Returns the session of the current transport shared by queries and
+        ingest.
+        """
+        if self._session is None or self._session.closed:
+            self._session = predix.transport.create_aiohttp_session()
+        return self._session
+
+    async def _refresh_token(self):
+        """
+        Get a new token once it has expired on a worker thread, as that is
+        a blocking request to UAA, so building headers afterwards doesn't
+        block the event loop.
+        """
+        uaa = self.service.uaa
+        if uaa.authenticated and uaa.is_expired_token(uaa.client):
+            await asyncio.get_event_loop().run_in_executor(None,
+                    uaa.get_token)
+
+    async def _request(self, method, uri, params=None, body=None):
+        """
+        Make a request with the standard Predix service headers, retried
+        and measured like those of TimeSeries.
+        """
+        await self._refresh_token()
+        headers = self.service._get_headers()
+        data = json.dumps(body) if body is not None else None
+
+        logging.debug("URI=" + str(uri))
+        response = await predix.aio.request(self._get_session(), method, uri,
+                retry=self.service.retry, headers=headers, params=params,
+                data=data)
+        logging.debug("STATUS=" + str(response.status_code))
+        if response.status_code in [200, 204]:
+            try:
+                return response.json()
+            except ValueError:
+                return {}
+        else:
+            logging.error(response.content)
+            response.raise_for_status()
+
+    async def _get_aggregations(self):
+        return await self._request('GET', self.query_uri + '/v1/aggregations')
+
+    async def get_aggregations(self):
+        """
+        Returns all of the aggregations that can be used with the
+        Time Series Service.
+        """
+        return (await self._get_aggregations())['results']
+
+    async def _get_tags(self):
+        return await self._request('GET', self.query_uri + '/v1/tags')
+
+    async def get_tags(self):
+        """
+        Returns a list of the tag names in the timeseries service
+        instance.
+        """
+        return (await self._get_tags())['results']
+
+    async def _get_datapoints(self, params):
+        url = self.query_uri + '/v1/datapoints'
+        return await self._request('GET', url, params=params)
+
+    async def _post_datapoints(self, body):
+        url = self.query_uri + '/v1/datapoints'
+        return await self._request('POST', url, body=body)
+
+    async def _query_datapoints(self, params, post=False):
+        if post:
+            return await self._post_datapoints(params)
+        else:
+            return await self._get_datapoints({"query": json.dumps(params)})
+
+    async def get_datapoints(self, tags, start=None, end=None, order=None,
+            limit=None, qualities=None, attributes=None, measurement=None,
+            aggregations=None, post=False, sampling=None, as_arrays=False,
+            window=None, max_workers=4):
+        """
+        Returns all of the datapoints that match the given query.
+
+        See TimeSeries.get_datapoints() for details of each option.
+        """
+        params = self._client._build_datapoints_query(tags, start=start, end=end,
+                order=order, limit=limit, qualities=qualities,
+                attributes=attributes, measurement=measurement,
+                aggregations=aggregations, sampling=sampling)
+
+        if window:
+            response = await self._query_datapoints_windowed(params, window,
+                    max_workers=max_workers, post=post)
+        else:
+            response = await self._query_datapoints(params, post=post)
+
+        if as_arrays:
+            import predix.data.timeseries.columnar
+            return predix.data.timeseries.columnar.to_arrays(response)
+
+        return response
+
+    async def get_frame(self, *args, **kwargs):
+        """
+        Returns the results of get_datapoints() as a pandas DataFrame, see
+        TimeSeries.get_frame() for details.
+        """
+        import predix.data.timeseries.columnar
+
+        qualities = kwargs.pop('qualities_column', False)
+        kwargs['as_arrays'] = True
+        columns = await self.get_datapoints(*args, **kwargs)
+        return predix.data.timeseries.columnar.to_frame(columns,
+                qualities=qualities)
+
+    async def get_values(self, *args, **kwargs):
+        """
+        Asynchronous generator of the values of a single tag query, see
+        TimeSeries.get_values() for details.
+        """
+        if isinstance(args[0], list):
+            raise ValueError("Can only get_values() for a single tag.")
+
+        response = await self.get_datapoints(*args, **kwargs)
+        for value in response['tags'][0]['results'][0]['values']:
+            yield [datetime.datetime.utcfromtimestamp(
+                value[0]/1000), value[1], value[2]]
+
+    async def _query_datapoints_windowed(self, params, window, max_workers=4,
+            post=False):
+        """
+        Split the time range of the query into windows that are fetched
+        concurrently and stitched back together in order.
+        """
+        now = int(round(time.time() * 1000))
+        plan = planner.WindowedQuery(params, now, window)
+
+        probe = plan.get_count_query()
+        if probe is not None:
+            plan.set_count(await self._query_datapoints(probe, post=post))
+
+        semaphore = asyncio.Semaphore(max_workers)
+
+        async def fetch(query):
+            async with semaphore:
+                return await self._query_datapoints(query, post=post)
+
+        for batch in plan.get_batches(max_workers):
+            plan.add(await asyncio.gather(*[fetch(query)
+                for query in batch]))
+
+        return plan.get_response()
+
+    async def tail(self, tags, interval=5, start=None, post=False,
+            qualities=None, attributes=None, measurement=None):
+        """
+        Asynchronous generator of (name, timestamp, value, quality) for
+        datapoints of the given tags as they arrive, see TimeSeries.tail().
+        """
+        now = int(round(time.time() * 1000))
+        state = planner.Tail(tags, now, start=start)
+
+        while True:
+            began = time.time()
+            params = self._client._build_datapoints_query(state.tags,
+                    start=state.get_start(), order='asc',
+                    qualities=qualities, attributes=attributes,
+                    measurement=measurement)
+            response = await self._query_datapoints(params, post=post)
+
+            for datapoint in state.get_new_datapoints(response):
+                yield datapoint
+
+            await asyncio.sleep(max(0, interval - (time.time() - began)))
+
+    async def _get_latest(self, params):
+        uri = self.query_uri + '/v1/datapoints/latest'
+        return await self._request('GET', uri, params=params)
+
+    async def _post_latest(self, body):
+        uri = self.query_uri + '/v1/datapoints/latest'
+        return await self._request('POST', uri, body=body)
+
+    async def get_latest(self, tags, post=False):
+        """
+        Returns the very last datapoint ingested for the given tag or tags,
+        see TimeSeries.get_latest() for details.
+        """
+        params = self._client._build_latest_query(tags)
+        if post:
+            return await self._post_latest(params)
+        else:
+            return await self._get_latest(params)
+
+    async def get_latest_values(self, tags, max_tags=None,
+            max_url_length=None, max_workers=4):
+        """
+        Returns a dictionary of each tag to the (timestamp, value, quality)
+        of the very last datapoint ingested, or None when there is none,
+        see TimeSeries.get_latest_values().
+        """
+        latest = planner.LatestValues(tags, max_tags=max_tags,
+                max_length=max_url_length)
+        semaphore = asyncio.Semaphore(max_workers)
+
+        async def fetch(query):
+            (params, post) = query
+            async with semaphore:
+                if post:
+                    return await self._post_latest(params)
+                return await self._get_latest(params)
+
+        return latest.get_values(await asyncio.gather(*[fetch(query)
+            for query in latest.get_queries()]))
+
+    async def _get_websocket(self):
+        """
+        Reuse the existing ingest connection or create a new one along with
+        a task reading the acks.
+        """
+        if self._ws_lock is None:
+            self._ws_lock = asyncio.Lock()
+
+        async with self._ws_lock:
+            if self.ws is not None and not self.ws.closed:
+                return self.ws
+
+            logging.debug("Initializing new websocket connection.")
+            await self._refresh_token()
+            self.ws = await self._get_session().ws_connect(self.ingest_uri,
+                    headers=self._client._get_ingest_headers())
+            self._receiver = asyncio.ensure_future(
+                    self._receive_acks(self.ws))
+            return self.ws
+
+    async def _receive_acks(self, ws):
+        """
+        Resolve the pending send() of each message as its ack arrives.
+        """
+        async for frame in ws:
+            if frame.type != aiohttp.WSMsgType.TEXT:
+                continue
+
+            logging.debug("RESULT=" + str(frame.data))
+            try:
+                message_id = str(json.loads(frame.data).get('messageId'))
+            except (ValueError, AttributeError):
+                logging.warning("Unrecognized ack %s" % (frame.data))
+                continue
+
+            pending = self._acks.pop(message_id, None)
+            if pending is not None and not pending.done():
+                pending.set_result(frame.data)
+
+        # Nothing more will be acknowledged on this connection
+        for message_id in list(self._acks.keys()):
+            pending = self._acks.pop(message_id)
+            if not pending.done():
+                pending.set_exception(ConnectionError(
+                    "Connection closed before message %s was acknowledged."
+                    % (message_id)))
+
+    async def _send_to_timeseries(self, message):
+        """
+        Send the message and wait on its ack without blocking other sends.
+        """
+        ws = await self._get_websocket()
+
+        message_id = str(message['messageId'])
+        pending = asyncio.get_event_loop().create_future()
+        self._acks[message_id] = pending
+
+        try:
+            await ws.send_str(json.dumps(message))
+            return await asyncio.wait_for(pending, self.ack_timeout)
+        finally:
+            self._acks.pop(message_id, None)
+
+    async def send(self, name=None, value=None, **kwargs):
+        """
+        Queue the optional name and value and then send anything in the
+        queue to the time series service, see TimeSeries.send().
+        """
+        if name and value:
+            self.queue(name, value, **kwargs)
+
+        with self._client._queue_lock:
+            msg = self._client._take_queue_message()
+
+        return await self._send_to_timeseries(msg)
+
+    async def flush(self):
+        """
+        Send anything in the queue to the time series service.
+        """
+        return await self.send()
+
+    async def close(self):
+        """
+        Send anything queued and close the connections.
+        """
+        try:
+            if self._client._queue:
+                await self.flush()
+        finally:
+            if self.ws is not None:
+                await self.ws.close()
+                self.ws = None
+
+            if self._receiver is not None:
+                await self._receiver
+                self._receiver = None
+
+            if self._session is not None:
+                await self._session.close()
+                self._session = None
@@ -0,0 +1,454 @@
+"""
+Local cache of Time Series query results that remembers which absolute time
+ranges it holds for each tag so that only the missing ranges are fetched.
+"""
+import os
+import json
+import time
+import bisect
+import hashlib
+import logging
+import threading
+import collections
+
+import predix.data.timeseries.query as planner
+
+
+class QueryCache(object):
+    """
+    Cache for get_datapoints() and get_latest() results of a TimeSeries
+    client.
+
+    :param max_bytes: Approximate memory budget for cached datapoints,
+        least recently used tags are evicted beyond this.
+
+    :param path: Optional directory for an on-disk tier where tags evicted
+        from memory are kept.
+
+    :param max_disk_bytes: Budget for the on-disk tier, oldest files are
+        removed beyond this.
+
+    :param ttl: Seconds that the recent edge of a range (and any latest
+        values) are trusted before being fetched again.
+
+    :param recent_millis: Milliseconds before the time of a query that are
+        considered still changing as datapoints may arrive late.
+
+    ::
+
+        ts = app.get_timeseries(cache=QueryCache(path='~/.predix/ts-cache'))
+
+    """
+    # Rough in-memory cost of a single cached [timestamp, value, quality]
+    DATAPOINT_BYTES = 120
+
+    # Sampling units of a fixed length, calendar months and years are not
+    SAMPLING_UNITS = ('ms', 's', 'mi', 'h', 'd', 'w')
+
+    def __init__(self, max_bytes=64*1024*1024, path=None,
+            max_disk_bytes=1024*1024*1024, ttl=60, recent_millis=5*60*1000):
+        self.max_bytes = max_bytes
+        self.path = os.path.expanduser(path) if path else None
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl = ttl
+        self.recent_millis = recent_millis
+
+        self._entries = collections.OrderedDict()
+        self._bytes = 0
+        self._latest = {}
+        self._lock = threading.RLock()
+
+        if self.path and not os.path.exists(self.path):
+            os.makedirs(self.path)
+
+    def clear(self):
+        """
+        Remove everything held in memory and on disk.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._latest.clear()
+
+            if self.path:
+                for filename in os.listdir(self.path):
+                    if filename.endswith('.json'):
+                        os.remove(os.path.join(self.path, filename))
+
+    def is_cacheable(self, params):
+        """
+        Queries with a limit depend on the whole range so their results
+        can't be stitched from cached pieces, and neither can aggregations
+        that summarize the whole range or are sampled by calendar months or
+        years.  Other aggregations are fetched in whole sampling intervals.
+        """
+        for query in params.get('tags', []):
+            if 'limit' in query:
+                return False
+
+            samplings = []
+            for aggregation in query.get('aggregations', []):
+                sampling = aggregation.get('sampling', {})
+                if sampling.get('unit') not in self.SAMPLING_UNITS:
+                    return False
+                if sampling not in samplings:
+                    samplings.append(sampling)
+
+            if len(samplings) > 1:
+                return False
+
+        return True
+
+    def _get_interval(self, query):
+        """
+        Returns the milliseconds of the sampling interval of an aggregated
+        query, or None when the query is for raw datapoints.
+        """
+        for aggregation in query.get('aggregations', []):
+            sampling = aggregation['sampling']
+            return int(sampling['value']) * planner.UNITS[sampling['unit']]
+
+        return None
+
+    def _get_key(self, query, origin):
+        """
+        Each tag is cached separately for each set of filters, and for
+        aggregations each set of aggregations sampled on the same grid of
+        intervals from the origin of the query.
+        """
+        key = {'name': query['name'], 'filters': query.get('filters', {})}
+
+        interval = self._get_interval(query)
+        if interval:
+            key['aggregations'] = query['aggregations']
+            key['phase'] = origin % interval
+
+        return json.dumps(key, sort_keys=True)
+
+    def _align_gaps(self, gaps, origin, end, interval):
+        """
+        Returns the gaps widened to start on a sampling interval from the
+        origin so that every aggregated value covers a whole interval.  A
+        last interval cut short by the end of the query is always fetched.
+        """
+        partial = (end - origin + 1) % interval
+        if partial:
+            gaps = gaps + [(end - partial + 1, end)]
+
+        aligned = []
+        for (start, end) in gaps:
+            start = origin + (start - origin) // interval * interval
+            if aligned and start <= aligned[-1][1] + 1:
+                aligned[-1] = (aligned[-1][0], end)
+            else:
+                aligned.append((start, end))
+
+        return aligned
+
+    def get_datapoints(self, params, fetch):
+        """
+        Return the response for the datapoints query params, calling fetch
+        with a query for any time ranges that are not already cached.
+        """
+        now = int(round(time.time() * 1000))
+        start = planner.to_epoch_millis(params['start'], now)
+        end = planner.to_epoch_millis(params.get('end'), now) or now
+
+        # Tags missing the same ranges can be fetched together
+        missing = collections.OrderedDict()
+        with self._lock:
+            for query in params['tags']:
+                entry = self._get_entry(self._get_key(query, start))
+                self._expire_recent(entry, now)
+                gaps = self._get_gaps(entry, start, end)
+                interval = self._get_interval(query)
+                if interval:
+                    gaps = self._align_gaps(gaps, start, end, interval)
+                gaps = tuple(gaps)
+                if gaps:
+                    missing.setdefault(gaps, []).append(query)
+
+        for (gaps, queries) in missing.items():
+            tags = []
+            for query in queries:
+                query = dict(query)
+                query.pop('order', None)
+                tags.append(query)
+
+            for (gap_start, gap_end) in gaps:
+                logging.debug("CACHE MISS %s-%s for %s tags" % (gap_start,
+                    gap_end, len(tags)))
+                response = fetch(dict(params, start=gap_start, end=gap_end,
+                    tags=tags))
+                self._store(tags, response, gap_start, gap_end, now, start)
+
+        with self._lock:
+            response = {'start': start, 'end': end, 'tags': []}
+            for query in params['tags']:
+                entry = self._get_entry(self._get_key(query, start))
+                response['tags'].append(self._get_tag_response(query, entry,
+                    start, end))
+
+            self._evict()
+
+        return response
+
+    def get_latest(self, params, fetch):
+        """
+        Return the response for the latest datapoints query params, calling
+        fetch when not cached within the ttl.
+        """
+        key = json.dumps(params, sort_keys=True)
+        with self._lock:
+            cached = self._latest.get(key)
+            if cached and time.time() - cached[0] < self.ttl:
+                return cached[1]
+
+        response = fetch(params)
+        with self._lock:
+            # Only the most recently used latest values are worth keeping
+            for (other, value) in list(self._latest.items()):
+                if time.time() - value[0] >= self.ttl:
+                    del self._latest[other]
+            self._latest[key] = (time.time(), response)
+
+        return response
+
+    def _get_entry(self, key):
+        """
+        Returns the entry for a key from memory, the disk tier, or a new
+        empty entry.  Callers are expected to hold the lock.
+        """
+        if key in self._entries:
+            entry = self._entries.pop(key)
+            self._entries[key] = entry
+            return entry
+
+        entry = self._read_from_disk(key)
+        if entry is None:
+            entry = {'intervals': [], 'results': collections.OrderedDict(),
+                    'bytes': 0}
+
+        self._entries[key] = entry
+        self._bytes += entry['bytes']
+        return entry
+
+    def _expire_recent(self, entry, now):
+        """
+        The recent edge of a cached range may have had more datapoints
+        ingested since, so stop trusting it after the ttl.
+        """
+        intervals = []
+        for (start, end, fetched) in entry['intervals']:
+            stable = fetched - self.recent_millis
+            if end >= stable and now - fetched > self.ttl * 1000:
+                end = stable - 1
+            if end >= start:
+                intervals.append([start, end, fetched])
+        entry['intervals'] = intervals
+
+    def _get_gaps(self, entry, start, end):
+        """
+        Returns the (start, end) ranges not covered by the entry.
+        """
+        gaps = []
+        cursor = start
+        for (covered_start, covered_end, fetched) in entry['intervals']:
+            if covered_end < cursor:
+                continue
+            if covered_start > end:
+                break
+            if covered_start > cursor:
+                gaps.append((cursor, covered_start - 1))
+            cursor = max(cursor, covered_end + 1)
+
+        if cursor <= end:
+            gaps.append((cursor, end))
+
+        return gaps
+
+    def _remove_interval(self, entry, start, end):
+        """
+        Record that the entry no longer holds the given range.
+        """
+        intervals = []
+        for interval in entry['intervals']:
+            if interval[1] < start or interval[0] > end:
+                intervals.append(interval)
+                continue
+            if interval[0] < start:
+                intervals.append([interval[0], start - 1, interval[2]])
+            if interval[1] > end:
+                intervals.append([end + 1, interval[1], interval[2]])
+        entry['intervals'] = intervals
+
+    def _add_interval(self, entry, start, end, fetched):
+        """
+        Record that the entry now holds the given range.
+        """
+        # Anything overlapping was just replaced
+        self._remove_interval(entry, start, end)
+        intervals = entry['intervals'] + [[start, end, fetched]]
+        intervals.sort()
+
+        # Adjacent ranges can be combined once the earlier one is stable
+        merged = []
+        for interval in intervals:
+            if merged and merged[-1][1] + 1 == interval[0] and \
+                    merged[-1][1] < merged[-1][2] - self.recent_millis:
+                merged[-1] = [merged[-1][0], interval[1], interval[2]]
+            else:
+                merged.append(interval)
+
+        entry['intervals'] = merged
+
+    def _store(self, queries, response, start, end, fetched, origin):
+        """
+        Merge the datapoints of a response for the range into the cached
+        entries of each tag.  The origin is the start of the query the range
+        was fetched for.
+        """
+        names = {}
+        for tag in response.get('tags', []):
+            names[tag['name']] = tag
+
+        with self._lock:
+            for query in queries:
+                entry = self._get_entry(self._get_key(query, origin))
+                self._bytes -= entry['bytes']
+
+                # Whatever was cached for the range is out of date
+                for result in entry['results'].values():
+                    i = bisect.bisect_left(result['timestamps'], start)
+                    j = bisect.bisect_right(result['timestamps'], end)
+                    del result['timestamps'][i:j]
+                    del result['values'][i:j]
+
+                tag = names.get(query['name'], {})
+                for result in tag.get('results', []):
+                    key = json.dumps(result.get('groups', []), sort_keys=True)
+                    if key not in entry['results']:
+                        entry['results'][key] = {
+                            'groups': result.get('groups', []),
+                            'attributes': {},
+                            'timestamps': [],
+                            'values': [],
+                            }
+                    cached = entry['results'][key]
+
+                    for (name, values) in result.get('attributes', {}).items():
+                        seen = cached['attributes'].setdefault(name, [])
+                        for value in values:
+                            if value not in seen:
+                                seen.append(value)
+
+                    values = sorted(result.get('values', []),
+                            key=lambda value: value[0])
+                    i = bisect.bisect_left(cached['timestamps'], start)
+                    cached['timestamps'][i:i] = [value[0] for value in values]
+                    cached['values'][i:i] = values
+
+                self._add_interval(entry, start, end, fetched)
+
+                # A last aggregated value for part of an interval is served
+                # but not kept as covering the interval
+                interval = self._get_interval(query)
+                if interval:
+                    partial = (end - origin + 1) % interval
+                    if partial:
+                        self._remove_interval(entry, end - partial + 1,
+                                end - partial + interval)
+
+                count = 0
+                for result in entry['results'].values():
+                    count += len(result['values'])
+                entry['bytes'] = count * self.DATAPOINT_BYTES
+                self._bytes += entry['bytes']
+
+    def _get_tag_response(self, query, entry, start, end):
+        """
+        Returns the cached datapoints for the range in the form the
+        service would have.
+        """
+        tag = {'name': query['name'], 'results': [], 'stats': {'rawCount': 0}}
+        for result in entry['results'].values():
+            i = bisect.bisect_left(result['timestamps'], start)
+            j = bisect.bisect_right(result['timestamps'], end)
+            values = result['values'][i:j]
+            if query.get('order') == 'desc':
+                values.reverse()
+
+            tag['results'].append({
+                'groups': result['groups'],
+                'attributes': result['attributes'],
+                'values': values,
+                })
+            tag['stats']['rawCount'] += len(values)
+
+        return tag
+
+    def _evict(self):
+        """
+        Move least recently used entries out of memory until within
+        budget.  Callers are expected to hold the lock.
+        """
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            (key, entry) = self._entries.popitem(last=False)
+            self._bytes -= entry['bytes']
+            self._write_to_disk(key, entry)
+
+    def _get_disk_path(self, key):
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.path, digest + '.json')
+
+    def _read_from_disk(self, key):
+        """
+        Returns an entry from the on-disk tier if there is one.
+        """
+        if not self.path:
+            return None
+
+        path = self._get_disk_path(key)
+        if not os.path.exists(path):
+            return None
+
+        with open(path, 'r') as data:
+            stored = json.load(data)
+        os.remove(path)
+
+        # Stored alongside the key in case of a digest collision
+        if stored['key'] != key:
+            return None
+
+        entry = stored['entry']
+        entry['results'] = collections.OrderedDict(entry['results'])
+        return entry
+
+    def _write_to_disk(self, key, entry):
+        """
+        Keep an entry evicted from memory in the on-disk tier.
+        """
+        if not self.path:
+            return
+
+        with open(self._get_disk_path(key), 'w') as output:
+            output.write(json.dumps({'key': key, 'entry': {
+                'intervals': entry['intervals'],
+                'results': list(entry['results'].items()),
+                'bytes': entry['bytes'],
+                }}))
+
+        # Remove the oldest files once over budget
+        files = []
+        for filename in os.listdir(self.path):
+            if filename.endswith('.json'):
+                path = os.path.join(self.path, filename)
+                files.append((os.path.getmtime(path),
+                    os.path.getsize(path), path))
+
+        total = sum(size for (mtime, size, path) in files)
+        for (mtime, size, path) in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            os.remove(path)
+            total -= size
@@ -0,0 +1,49 @@
+"""
+Coalescing of identical requests made at the same time from many threads so
+that only one of them reaches the service.
+"""
+import threading
+import concurrent.futures
+
+
+class SingleFlight(object):
+    """
+    Run a call once for all of the callers asking for the same key while it
+    is in flight, every caller getting the same result or exception.
+
+    ::
+
+        flight = SingleFlight()
+        response = flight.do(key, lambda: fetch(params))
+
+    """
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, call):
+        """
+        Returns the result of call(), or of the call already in flight for
+        the same key.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = concurrent.futures.Future()
+                self._calls[key] = future
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = call()
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
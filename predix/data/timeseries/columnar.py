@@ -0,0 +1,146 @@
+"""
+Decode Time Series query responses into contiguous NumPy arrays rather than
+one Python list per datapoint.  NumPy is required and pandas is only needed
+for frames.
+"""
+import collections
+
+import numpy
+
+
+def decode_values(values):
+    """
+    Convert the [[timestamp, value, quality], ...] values of a query result
+    into int64 timestamps, values, and int8 qualities.
+
+    Values are int64 when every value is an integer and float64 when they
+    are all numbers.  Anything else (ie. strings, even numeric ones) is
+    kept as an object array.
+    """
+    if len(values) == 0:
+        return (numpy.empty(0, dtype='int64'),
+                numpy.empty(0, dtype='float64'),
+                numpy.empty(0, dtype='int8'))
+
+    rows = numpy.array(values, dtype=object)
+
+    # Let numpy infer the value type so strings are not parsed as numbers
+    # and large integers are not rounded through a float64.
+    column = numpy.array(rows[:, 1].tolist())
+    if column.dtype.kind in 'iu':
+        column = column.astype('int64')
+    elif column.dtype.kind == 'f':
+        column = column.astype('float64')
+    else:
+        column = rows[:, 1].copy()
+
+    return (rows[:, 0].astype('int64'), column, rows[:, 2].astype('int8'))
+
+
+def to_arrays(response):
+    """
+    Returns a list with one entry per tag and result group of a
+    get_datapoints() response.  Each entry is a dictionary with the name,
+    attributes, and groups of the result along with timestamps, values, and
+    qualities arrays.
+    """
+    columns = []
+    for tag in response.get('tags', []):
+        for result in tag.get('results', []):
+            (timestamps, values, qualities) = decode_values(
+                    result.get('values', []))
+            columns.append({
+                'name': tag['name'],
+                'attributes': result.get('attributes', {}),
+                'groups': result.get('groups', []),
+                'timestamps': timestamps,
+                'values': values,
+                'qualities': qualities,
+                })
+
+    return columns
+
+
+def to_arrays_streamed(events):
+    """
+    Returns the same columns as to_arrays() but from the (path, value)
+    events of predix.data.timeseries.stream.iter_events() so that each
+    chunk of datapoints is decoded into arrays as it is read and only the
+    arrays are kept.
+    """
+    names = {}
+    results = collections.OrderedDict()
+    for (path, value) in events:
+        if len(path) == 3 and path[2] == 'name':
+            names[path[1]] = value
+        elif len(path) == 5 and path[2] == 'results':
+            result = results.setdefault((path[1], path[3]),
+                    {'attributes': {}, 'groups': [], 'chunks': []})
+            if path[4] == 'values':
+                result['chunks'].append(decode_values(value))
+            elif path[4] in ['attributes', 'groups']:
+                result[path[4]] = value
+
+    columns = []
+    for ((tag, index), result) in results.items():
+        chunks = result['chunks'] or [decode_values([])]
+        columns.append({
+            'name': names.get(tag),
+            'attributes': result['attributes'],
+            'groups': result['groups'],
+            'timestamps': numpy.concatenate([chunk[0] for chunk in chunks]),
+            'values': numpy.concatenate([chunk[1] for chunk in chunks]),
+            'qualities': numpy.concatenate([chunk[2] for chunk in chunks]),
+            })
+
+    return columns
+
+
+def get_column_labels(columns):
+    """
+    Returns a label for each column, the tag name when a tag has a single
+    result or the tag name with the result index when grouped.
+    """
+    counts = {}
+    for column in columns:
+        counts[column['name']] = counts.get(column['name'], 0) + 1
+
+    labels = []
+    seen = {}
+    for column in columns:
+        name = column['name']
+        if counts[name] == 1:
+            labels.append(name)
+        else:
+            labels.append('%s.%s' % (name, seen.get(name, 0)))
+        seen[name] = seen.get(name, 0) + 1
+
+    return labels
+
+
+def to_frame(columns, qualities=False):
+    """
+    Returns a pandas DataFrame indexed by UTC timestamp with one column per
+    tag / result group from the output of to_arrays().
+
+    With qualities a second column suffixed with '.quality' is included for
+    each value column.
+    """
+    import pandas
+
+    series = []
+    for (label, column) in zip(get_column_labels(columns), columns):
+        index = pandas.to_datetime(column['timestamps'], unit='ms', utc=True)
+
+        # Outer join of columns requires a unique index
+        unique = ~index.duplicated(keep='last')
+        series.append(pandas.Series(column['values'][unique],
+            index=index[unique], name=label))
+        if qualities:
+            series.append(pandas.Series(column['qualities'][unique],
+                index=index[unique], name=label + '.quality'))
+
+    if not series:
+        return pandas.DataFrame(index=pandas.DatetimeIndex([], tz='UTC'))
+
+    return pandas.concat(series, axis=1).sort_index()
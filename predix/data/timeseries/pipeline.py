@@ -0,0 +1,289 @@
+"""
+Pipelined ingest over a Time Series websocket that keeps several messages in
+flight and matches acknowledgements to them by messageId.
+"""
+import json
+import time
+import socket
+import logging
+import threading
+import websocket
+import concurrent.futures
+
+
+class IngestError(Exception):
+    """
+    Raised for a message the service did not accept or acknowledge.
+    """
+    def __init__(self, message, ack=None):
+        self.ack = ack
+        super(IngestError, self).__init__(message)
+
+
+class IngestPipeline(object):
+    """
+    Send ingest messages without waiting for each acknowledgement.
+
+    :param connect: callable that returns a new websocket connection
+
+    :param max_in_flight: how many messages can be waiting on an ack before
+        send() blocks
+
+    :param ack_timeout: seconds to wait for an ack before sending again
+
+    :param max_retries: how many times a message is sent again after a
+        failed or missing ack before its future fails
+
+    :param backoff: seconds to wait before the first retry, doubled for
+        each retry after that
+
+    """
+    # Status codes in an ack worth trying again
+    RETRY_STATUS = [429, 500, 502, 503, 504]
+
+    def __init__(self, connect, max_in_flight=8, ack_timeout=30,
+            max_retries=3, backoff=0.5):
+        self.connect = connect
+        self.max_in_flight = max_in_flight
+        self.ack_timeout = ack_timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+        self._ws = None
+        self._ws_lock = threading.RLock()
+        self._in_flight = {}
+        self._lock = threading.Condition()
+        self._receiver = None
+        self._running = False
+
+    def send(self, message):
+        """
+        Send the message and return a future that resolves to the ack from
+        the service once it has been accepted.
+        """
+        message_id = str(message['messageId'])
+        payload = json.dumps(message)
+        future = concurrent.futures.Future()
+
+        with self._lock:
+            while len(self._in_flight) >= self.max_in_flight:
+                self._lock.wait()
+
+            if message_id in self._in_flight:
+                raise ValueError("Message %s already in flight." % (message_id))
+
+            self._in_flight[message_id] = {
+                'payload': payload,
+                'future': future,
+                'attempts': 0,
+                'sent': time.time(),
+                'retry': None,
+                }
+
+        try:
+            self._start()
+        except Exception as e:
+            # Nothing was sent so the message must not hold a place in flight
+            with self._lock:
+                del self._in_flight[message_id]
+                self._lock.notify_all()
+            future.set_exception(e)
+            raise
+
+        self._send(message_id, payload)
+        return future
+
+    def flush(self, timeout=None):
+        """
+        Block until every message sent has been acknowledged or failed.
+        """
+        with self._lock:
+            futures = [entry['future'] for entry in self._in_flight.values()]
+        concurrent.futures.wait(futures, timeout=timeout)
+
+    def close(self):
+        """
+        Wait on anything in flight and close the connection.
+        """
+        self.flush()
+
+        self._running = False
+        if self._receiver is not None:
+            self._receiver.join()
+            self._receiver = None
+
+        with self._ws_lock:
+            if self._ws is not None:
+                self._ws.close()
+                self._ws = None
+
+    def _start(self):
+        """
+        Start the thread that reads acks once there is something to ack.
+        """
+        with self._ws_lock:
+            if self._ws is None:
+                self._ws = self.connect()
+                self._ws.settimeout(1)
+
+            if self._receiver is None:
+                self._running = True
+                self._receiver = threading.Thread(target=self._receive_acks)
+                self._receiver.daemon = True
+                self._receiver.start()
+
+    def _send(self, message_id, payload):
+        """
+        Send the payload, reconnecting if the connection has gone stale.
+        """
+        ws = self._ws
+        try:
+            ws.send(payload)
+        except (websocket.WebSocketConnectionClosedException, socket.error,
+                AttributeError) as e:
+            logging.debug("Connection failed sending %s, reconnecting." %
+                    (message_id))
+            logging.debug(e)
+            try:
+                self._reconnect(ws)
+            except Exception as e:
+                # The message stays in flight for the receiver to send once
+                # it reconnects, raising as well would have it sent twice.
+                logging.warning("Unable to reconnect sending %s: %s" %
+                        (message_id, e))
+
+    def _reconnect(self, stale):
+        """
+        Open a new connection and send everything not yet acknowledged
+        since any acks would have been lost with the old connection.
+        """
+        with self._ws_lock:
+            if self._ws is not stale and self._ws is not None:
+                return
+
+            if stale is not None:
+                try:
+                    stale.close()
+                except Exception:
+                    pass
+
+            self._ws = self.connect()
+            self._ws.settimeout(1)
+
+            with self._lock:
+                pending = [(message_id, entry['payload'])
+                        for (message_id, entry) in self._in_flight.items()
+                        if entry['retry'] is None]
+                for (message_id, payload) in pending:
+                    self._in_flight[message_id]['sent'] = time.time()
+
+            for (message_id, payload) in pending:
+                self._ws.send(payload)
+
+    def _receive_acks(self):
+        """
+        Blocking function run by the receiver thread that reads acks and
+        resolves the future of the matching message.
+        """
+        while self._running or self._in_flight:
+            ws = self._ws
+            try:
+                frame = ws.recv()
+            except websocket.WebSocketTimeoutException:
+                frame = None
+            except (websocket.WebSocketConnectionClosedException,
+                    socket.error, AttributeError) as e:
+                if not self._running and not self._in_flight:
+                    return
+                logging.debug("Connection lost waiting on acks.")
+                logging.debug(e)
+                try:
+                    self._reconnect(ws)
+                except Exception as e:
+                    logging.error(e)
+                    time.sleep(self.backoff)
+                frame = None
+
+            if frame:
+                self._on_ack(frame)
+
+            self._check_retries()
+
+    def _on_ack(self, frame):
+        """
+        Resolve or schedule a retry for the message the ack refers to.
+        """
+        logging.debug("ACK=" + str(frame))
+        try:
+            ack = json.loads(frame)
+        except ValueError:
+            logging.warning("Unrecognized ack %s" % (frame))
+            return
+
+        message_id = str(ack.get('messageId'))
+        status = int(ack.get('statusCode', 0))
+
+        with self._lock:
+            entry = self._in_flight.get(message_id)
+            if entry is None:
+                logging.debug("Ack for unknown message %s" % (message_id))
+                return
+
+            if status in self.RETRY_STATUS and \
+                    entry['attempts'] < self.max_retries:
+                self._schedule_retry(entry)
+                return
+
+            del self._in_flight[message_id]
+            self._lock.notify_all()
+
+        # Resolve outside the lock as callbacks run in this thread
+        if 200 <= status < 300:
+            entry['future'].set_result(ack)
+            return
+
+        entry['future'].set_exception(IngestError(
+            "Message %s failed with status %s." % (message_id, status), ack))
+
+    def _schedule_retry(self, entry):
+        """
+        Mark the message to be sent again after backing off.  Callers are
+        expected to hold the lock.
+        """
+        delay = self.backoff * (2 ** entry['attempts'])
+        entry['attempts'] += 1
+        entry['retry'] = time.time() + delay
+
+    def _check_retries(self):
+        """
+        Send again any messages due for retry and handle any that were
+        never acknowledged.
+        """
+        now = time.time()
+        due = []
+        failed = []
+
+        with self._lock:
+            for (message_id, entry) in list(self._in_flight.items()):
+                if entry['retry'] is not None:
+                    if entry['retry'] <= now:
+                        entry['retry'] = None
+                        entry['sent'] = now
+                        due.append((message_id, entry['payload']))
+                elif now - entry['sent'] > self.ack_timeout:
+                    if entry['attempts'] < self.max_retries:
+                        self._schedule_retry(entry)
+                    else:
+                        del self._in_flight[message_id]
+                        failed.append((message_id, entry))
+
+            if failed:
+                self._lock.notify_all()
+
+        for (message_id, entry) in failed:
+            entry['future'].set_exception(IngestError(
+                "Message %s was never acknowledged." % (message_id)))
+
+        for (message_id, payload) in due:
+            logging.debug("Retrying message %s" % (message_id))
+            self._send(message_id, payload)
@@ -0,0 +1,170 @@
+"""
+A pool of Time Series ingest websockets that can be shared by many threads.
+"""
+import json
+import time
+import socket
+import logging
+import threading
+import websocket
+import concurrent.futures
+
+
+class IngestConnection(object):
+    """
+    A single ingest websocket that sends a message and waits on its ack,
+    health checked and replaced when it goes stale.
+
+    :param connect: callable that returns a new websocket connection
+
+    :param health_check_interval: seconds a connection can sit idle before
+        it is pinged ahead of being used again
+
+    """
+    def __init__(self, connect, health_check_interval=30):
+        self.connect = connect
+        self.health_check_interval = health_check_interval
+
+        self._ws = None
+        self._lock = threading.Lock()
+        self._last_used = 0
+
+    def _get_websocket(self):
+        """
+        Reuse the connection when healthy or create a new one.
+        """
+        if self._ws is not None and self._ws.connected:
+            if time.time() - self._last_used < self.health_check_interval:
+                return self._ws
+
+            try:
+                self._ws.ping()
+                return self._ws
+            except (websocket.WebSocketException, socket.error) as e:
+                logging.debug("Idle connection failed health check.")
+                logging.debug(e)
+
+        self._replace()
+        return self._ws
+
+    def _replace(self):
+        if self._ws is not None:
+            try:
+                self._ws.close()
+            except Exception:
+                pass
+
+        self._ws = self.connect()
+
+    def send(self, message):
+        """
+        Send the message and return the ack from the service.
+        """
+        payload = json.dumps(message)
+        with self._lock:
+            # Only try again when the message could not be sent at all
+            try:
+                ws = self._get_websocket()
+                ws.send(payload)
+            except (websocket.WebSocketConnectionClosedException,
+                    socket.error) as e:
+                logging.debug("Connection failed, will try again.")
+                logging.debug(e)
+                self._replace()
+                ws = self._ws
+                ws.send(payload)
+
+            result = ws.recv()
+            self._last_used = time.time()
+            return result
+
+    def flush(self, timeout=None):
+        pass
+
+    def close(self):
+        with self._lock:
+            if self._ws is not None:
+                self._ws.close()
+                self._ws = None
+
+
+class IngestPool(object):
+    """
+    Spread ingest messages over several connections.
+
+    :param members: IngestConnection or IngestPipeline instances to send
+        messages with
+
+    :param strategy: 'round_robin' to take turns or 'least_loaded' to pick
+        the member with the fewest messages outstanding
+
+    """
+    ROUND_ROBIN = 'round_robin'
+    LEAST_LOADED = 'least_loaded'
+
+    def __init__(self, members, strategy=LEAST_LOADED):
+        if strategy not in [self.ROUND_ROBIN, self.LEAST_LOADED]:
+            raise ValueError("Pool strategy must be round_robin or "
+                    "least_loaded.")
+
+        self.members = list(members)
+        self.strategy = strategy
+
+        self._load = [0] * len(self.members)
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def get_load(self):
+        """
+        Returns the number of messages outstanding on each member.
+        """
+        with self._lock:
+            return list(self._load)
+
+    def _choose(self):
+        """
+        Pick the member to send the next message with.
+        """
+        with self._lock:
+            if self.strategy == self.ROUND_ROBIN:
+                index = self._next
+                self._next = (self._next + 1) % len(self.members)
+            else:
+                index = self._load.index(min(self._load))
+
+            self._load[index] += 1
+            return index
+
+    def _release(self, index):
+        with self._lock:
+            self._load[index] -= 1
+
+    def send(self, message):
+        """
+        Send the message on one of the members, returning whatever that
+        member does (an ack or a future that resolves to one).
+        """
+        index = self._choose()
+        try:
+            result = self.members[index].send(message)
+        except Exception:
+            self._release(index)
+            raise
+
+        if isinstance(result, concurrent.futures.Future):
+            result.add_done_callback(lambda future: self._release(index))
+        else:
+            self._release(index)
+
+        return result
+
+    def flush(self, timeout=None):
+        """
+        Block until every member has nothing outstanding.
+        """
+        for member in self.members:
+            member.flush(timeout=timeout)
+
+    def close(self):
+        for member in self.members:
+            member.close()
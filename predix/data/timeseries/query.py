@@ -0,0 +1,473 @@
+"""
+Helpers for planning Time Series queries, such as resolving relative times
+and splitting a wide time range into windows that can be fetched separately.
+"""
+import re
+import json
+import datetime
+import collections
+
+import six
+
+# Maximum number of datapoints the service will return from a single query
+MAX_DATAPOINTS = 500000
+
+# Tags in a single latest datapoints query and the longest list of tags to
+# send as a GET before using a POST instead
+MAX_LATEST_TAGS = 500
+MAX_LATEST_URL_LENGTH = 2000
+
+# Milliseconds for each of the units the service understands (ms, s, mi, h,
+# d, w, mm, y) where months and years are approximate.
+UNITS = {
+    'ms': 1,
+    's': 1000,
+    'mi': 60 * 1000,
+    'h': 60 * 60 * 1000,
+    'd': 24 * 60 * 60 * 1000,
+    'w': 7 * 24 * 60 * 60 * 1000,
+    'mm': 30 * 24 * 60 * 60 * 1000,
+    'y': 365 * 24 * 60 * 60 * 1000,
+    }
+
+_duration = re.compile(r'^(\d+)(ms|s|mi|h|d|w|mm|y)$')
+
+
+def parse_duration(value):
+    """
+    Returns milliseconds for a duration given as an integer of milliseconds
+    or a string in service units such as '15mi' or '1d'.
+    """
+    if isinstance(value, datetime.timedelta):
+        return int(value.total_seconds() * 1000)
+
+    if isinstance(value, str):
+        match = _duration.match(value.strip())
+        if not match:
+            raise ValueError("Unrecognized duration (%s)." % (value))
+        return int(match.group(1)) * UNITS[match.group(2)]
+
+    return int(value)
+
+
+def get_sampling(interval):
+    """
+    Returns the sampling of a service-side aggregation for an interval
+    given as milliseconds, a timedelta, or a string in service units such
+    as '15mi', for which the service computes one value per interval.
+    """
+    if isinstance(interval, str):
+        match = _duration.match(interval.strip())
+        if not match:
+            raise ValueError("Unrecognized duration (%s)." % (interval))
+        return {'unit': match.group(2), 'value': match.group(1)}
+
+    return {'unit': 'ms', 'value': str(parse_duration(interval))}
+
+
+def to_epoch_millis(value, now):
+    """
+    Returns the absolute time in epoch milliseconds for a start or end
+    value that may be relative to now (ie. '1w-ago').  Naive datetimes are
+    treated as UTC.
+    """
+    if value is None:
+        return None
+
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is not None:
+            value = value.replace(tzinfo=None) - value.utcoffset()
+        epoch = datetime.datetime(1970, 1, 1)
+        return int((value - epoch).total_seconds() * 1000)
+
+    if isinstance(value, str):
+        value = value.strip()
+        if value.endswith('-ago'):
+            return now - parse_duration(value[:-len('-ago')])
+        if not value.isdigit():
+            raise ValueError("Unrecognized time (%s)." % (value))
+
+    return int(value)
+
+
+def split_range(start, end, window):
+    """
+    Returns a list of (start, end) windows in epoch milliseconds that cover
+    the inclusive range without overlapping.
+    """
+    if window <= 0:
+        raise ValueError("Window must be a positive duration.")
+
+    windows = []
+    while start <= end:
+        windows.append((start, min(start + window - 1, end)))
+        start += window
+
+    return windows
+
+
+def get_window_for_count(start, end, count, max_datapoints=MAX_DATAPOINTS):
+    """
+    Returns a window size for the range so that each window is expected to
+    hold no more than max_datapoints given the total count.
+    """
+    windows = max(1, -(-int(count) // int(max_datapoints)))
+    return max(1, -(-(end - start + 1) // windows))
+
+
+def get_range(params, now):
+    """
+    Returns the absolute (start, end) of a datapoints query, where no end
+    means now.
+    """
+    for query in params['tags']:
+        if 'aggregations' in query:
+            raise ValueError("Cannot split a query with aggregations.")
+
+    start = to_epoch_millis(params['start'], now)
+    end = to_epoch_millis(params.get('end'), now) or now
+    return (start, end)
+
+
+def get_windows(params, start, end, window):
+    """
+    Returns the windows to query in the order results should be returned,
+    latest first when results are descending.
+    """
+    windows = split_range(start, end, parse_duration(window))
+
+    order = params['tags'][0].get('order') if params['tags'] else None
+    if order == 'desc':
+        windows.reverse()
+
+    return windows
+
+
+def get_count_query(params, start, end):
+    """
+    Returns a query counting the datapoints of a query for the range, used
+    to estimate a window size.
+    """
+    probe = dict(params, start=start, end=end, tags=[])
+    for query in params['tags']:
+        query = dict(query)
+        query.pop('limit', None)
+        query.pop('order', None)
+        query['aggregations'] = [{
+            'sampling': {'datapoints': 1},
+            'type': 'count'}]
+        probe['tags'].append(query)
+
+    return probe
+
+
+def get_count(response):
+    """
+    Returns the total count from the response to a get_count_query().
+    """
+    count = 0
+    for tag in response.get('tags', []):
+        for result in tag.get('results', []):
+            for value in result.get('values', []):
+                count += value[1] or 0
+
+    return count
+
+
+def _get_result_key(result):
+    """
+    Results for a tag are grouped, so use the groups to match up the
+    results from separate windows.
+    """
+    return json.dumps(result.get('groups', []), sort_keys=True)
+
+
+def merge_responses(responses, limit=None):
+    """
+    Stitch the responses from queries of consecutive windows into a single
+    response in the same shape the service returns.  Responses are expected
+    to already be in the requested order.
+    """
+    merged = {'tags': []}
+    tags = {}
+    results = {}
+
+    for response in responses:
+        for tag in response.get('tags', []):
+            if tag['name'] not in tags:
+                tags[tag['name']] = {
+                    'name': tag['name'],
+                    'results': [],
+                    'stats': {'rawCount': 0},
+                    }
+                merged['tags'].append(tags[tag['name']])
+
+            into = tags[tag['name']]
+            into['stats']['rawCount'] += tag.get('stats', {}).get('rawCount', 0)
+
+            for result in tag.get('results', []):
+                key = (tag['name'], _get_result_key(result))
+                if key not in results:
+                    results[key] = {
+                        'groups': result.get('groups', []),
+                        'attributes': {},
+                        'values': [],
+                        }
+                    into['results'].append(results[key])
+
+                # Attributes are reported as lists of values seen
+                attributes = results[key]['attributes']
+                for (name, values) in result.get('attributes', {}).items():
+                    seen = attributes.setdefault(name, [])
+                    for value in values:
+                        if value not in seen:
+                            seen.append(value)
+
+                results[key]['values'].extend(result.get('values', []))
+
+    if limit:
+        for result in results.values():
+            del result['values'][int(limit):]
+
+    return merged
+
+
+def has_reached_limit(response, limit, names):
+    """
+    Whether every result for each of the tag names in a merged response
+    already holds limit values so that no further windows need to be
+    fetched.
+    """
+    if len(response.get('tags', [])) < len(set(names)):
+        return False
+
+    for tag in response['tags']:
+        if not tag['results']:
+            return False
+        for result in tag['results']:
+            if len(result['values']) < int(limit):
+                return False
+
+    return True
+
+
+def split_latest_tags(tags, max_tags=MAX_LATEST_TAGS,
+        max_length=MAX_LATEST_URL_LENGTH):
+    """
+    Returns a list of (tags, post) batches of at most max_tags each, where
+    post is True when the url encoded list of tags is too long for a GET.
+    """
+    batches = []
+    for i in range(0, len(tags), max_tags):
+        batch = tags[i:i + max_tags]
+        length = len(six.moves.urllib.parse.quote(','.join(batch)))
+        batches.append((batch, length > max_length))
+
+    return batches
+
+
+def get_latest_values(response):
+    """
+    Returns a dictionary of tag name to the (timestamp, value, quality) of
+    its most recent datapoint in a latest datapoints response, or None when
+    the tag has no datapoints.
+    """
+    latest = {}
+    for tag in response.get('tags', []):
+        newest = None
+        for result in tag.get('results', []):
+            for value in result.get('values', []):
+                if newest is None or value[0] > newest[0]:
+                    newest = value
+        latest[tag['name']] = tuple(newest) if newest else None
+
+    return latest
+
+
+def get_new_datapoints(response, marks, seen):
+    """
+    Returns a list of (name, timestamp, value, quality) in the response
+    that are newer than the high-water mark timestamp of each tag, in
+    order of timestamp.
+
+    The marks dictionary of tag names to timestamps and the seen dictionary
+    of tag names to the set of datapoints at the mark are updated so that
+    datapoints at the boundary of the next query are not repeated.
+    """
+    datapoints = []
+    for tag in response.get('tags', []):
+        name = tag['name']
+        mark = marks.get(name, 0)
+        at_mark = seen.setdefault(name, set())
+
+        newest = mark
+        found = []
+        for result in tag.get('results', []):
+            for value in result.get('values', []):
+                point = tuple(value)
+                if point[0] < mark or (point[0] == mark and point in at_mark):
+                    continue
+                found.append(point)
+                newest = max(newest, point[0])
+
+        if newest > mark:
+            at_mark.clear()
+        at_mark.update(point for point in found if point[0] == newest)
+        marks[name] = newest
+
+        datapoints.extend((name,) + point for point in found)
+
+    datapoints.sort(key=lambda datapoint: datapoint[1])
+    return datapoints
+
+
+class WindowedQuery(object):
+    """
+    A datapoints query split into windows over its time range, which are
+    fetched in batches and stitched back together in order.  The caller
+    does the fetching so blocking and asyncio clients share the rest.
+
+    ::
+
+        plan = WindowedQuery(params, now, window)
+        probe = plan.get_count_query()
+        if probe is not None:
+            plan.set_count(fetch(probe))
+        for batch in plan.get_batches(max_workers):
+            plan.add([fetch(query) for query in batch])
+        response = plan.get_response()
+
+    """
+    def __init__(self, params, now, window):
+        self.params = params
+        self.window = window
+        (self.start, self.end) = get_range(params, now)
+
+        self.names = [query['name'] for query in params['tags']]
+        self.limit = params['tags'][0].get('limit') if params['tags'] \
+                else None
+        self.responses = []
+
+    def get_count_query(self):
+        """
+        Returns the query counting the datapoints in the range when the
+        window is 'auto' and has to be sized from the count, else None.
+        """
+        if self.window != 'auto':
+            return None
+
+        return get_count_query(self.params, self.start, self.end)
+
+    def set_count(self, response):
+        """
+        Size the windows from the response of get_count_query().
+        """
+        self.window = get_window_for_count(self.start, self.end,
+                get_count(response))
+
+    def get_batches(self, max_workers):
+        """
+        Generator of lists of window queries to fetch concurrently, the
+        responses of each are expected to be given to add() before the
+        next.  Without a limit every window is needed in a single batch,
+        otherwise it stops once enough datapoints have been found for all
+        tags.
+        """
+        windows = get_windows(self.params, self.start, self.end,
+                self.window)
+        step = max_workers if self.limit else max(len(windows), 1)
+        for i in range(0, len(windows), step):
+            yield [dict(self.params, start=window[0], end=window[1])
+                    for window in windows[i:i + step]]
+
+            if self.limit and has_reached_limit(
+                    merge_responses(self.responses), self.limit, self.names):
+                return
+
+    def add(self, responses):
+        """
+        Keep the responses to a batch of window queries.
+        """
+        self.responses.extend(responses)
+
+    def get_response(self):
+        """
+        Returns the responses merged into one for the whole range.
+        """
+        response = merge_responses(self.responses, limit=self.limit)
+        response['start'] = self.start
+        response['end'] = self.end
+        return response
+
+
+class Tail(object):
+    """
+    High-water marks of the tags being tailed, so each poll only asks for
+    datapoints from the oldest mark on and those already seen are skipped,
+    see get_new_datapoints().
+    """
+    def __init__(self, tags, now, start=None):
+        if not isinstance(tags, list):
+            tags = [tags]
+
+        mark = to_epoch_millis(start, now) if start else now
+        self.tags = tags
+        self.marks = dict((tag, mark) for tag in tags)
+        self.seen = {}
+
+    def get_start(self):
+        """
+        Returns the start of the next poll.
+        """
+        return min(self.marks.values())
+
+    def get_new_datapoints(self, response):
+        """
+        Returns the (name, timestamp, value, quality) in the response of a
+        poll not yet seen, moving the marks on.
+        """
+        return get_new_datapoints(response, self.marks, self.seen)
+
+
+class LatestValues(object):
+    """
+    The latest values of many tags fetched as several queries of at most
+    max_tags, each a GET unless its tags would make the url longer than
+    max_length.
+    """
+    def __init__(self, tags, max_tags=None, max_length=None):
+        if isinstance(tags, str):
+            tags = [tags]
+
+        self.tags = list(collections.OrderedDict.fromkeys(tags))
+        self.max_tags = max_tags or MAX_LATEST_TAGS
+        self.max_length = max_length or MAX_LATEST_URL_LENGTH
+
+    def get_queries(self):
+        """
+        Returns a list of (params, post) for each query to make, where
+        params is the body when post is True and otherwise the url
+        parameters.
+        """
+        queries = []
+        for (names, post) in split_latest_tags(self.tags,
+                max_tags=self.max_tags, max_length=self.max_length):
+            if post:
+                queries.append(({'tags': [{'name': name}
+                    for name in names]}, True))
+            else:
+                queries.append(({'tags': ','.join(names)}, False))
+
+        return queries
+
+    def get_values(self, responses):
+        """
+        Returns a dictionary of each tag, in the order given, to the
+        (timestamp, value, quality) of its latest datapoint or None, from
+        the responses to get_queries().
+        """
+        latest = collections.OrderedDict.fromkeys(self.tags)
+        for response in responses:
+            latest.update(get_latest_values(response))
+
+        return latest
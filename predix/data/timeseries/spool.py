@@ -0,0 +1,305 @@
+"""
+Write-ahead spool for Time Series ingest messages that keeps them on local
+disk until the service has accepted them.
+"""
+import os
+import json
+import time
+import zlib
+import errno
+import struct
+import logging
+import threading
+import collections
+
+
+class IngestSpool(object):
+    """
+    A segmented log of ingest messages on disk that can be replayed in
+    order once the service can be reached.
+
+    Each message is framed as its length and crc32 followed by the zlib
+    compressed json of the message.
+
+    :param path: directory to keep the spool segments in
+
+    :param segment_bytes: size at which a new segment file is started
+
+    :param max_bytes: total size of all segments, the oldest segment is
+        dropped when over
+
+    :param fsync: 'always' to fsync after every message, 'interval' to fsync
+        at most every fsync_interval seconds, or 'never' to leave it to the
+        operating system
+
+    :param fsync_interval: seconds between fsync when using 'interval'
+
+    """
+    SUFFIX = '.spool'
+    HEADER = struct.Struct('>II')
+
+    def __init__(self, path, segment_bytes=16*1024*1024,
+            max_bytes=1024*1024*1024, fsync='interval', fsync_interval=1.0):
+        if fsync not in ['always', 'interval', 'never']:
+            raise ValueError("Spool fsync must be always, interval or never.")
+
+        self.path = os.path.expanduser(path)
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+
+        self._lock = threading.RLock()
+        self._segments = collections.OrderedDict()
+        self._writer = None
+        self._last_fsync = 0
+        self._dropped = 0
+
+        try:
+            os.makedirs(self.path)
+        except OSError as exc:
+            if exc.errno != errno.EEXIST:
+                raise
+
+        self._cursor = self._read_cursor()
+        self._scan()
+
+    def get_metrics(self):
+        """
+        Returns the depth of the spool: segments, bytes on disk, messages
+        waiting, and messages dropped due to the size cap.
+        """
+        with self._lock:
+            messages = 0
+            for (segment, info) in self._segments.items():
+                if segment == self._cursor[0]:
+                    messages += len([offset for offset in info['offsets']
+                        if offset >= self._cursor[1]])
+                elif segment > self._cursor[0]:
+                    messages += len(info['offsets'])
+
+            return {
+                'segments': len(self._segments),
+                'bytes': sum(info['bytes'] for info in self._segments.values()),
+                'messages': messages,
+                'dropped': self._dropped,
+                }
+
+    def append(self, message):
+        """
+        Append the ingest message to the end of the spool.
+        """
+        payload = zlib.compress(json.dumps(message).encode('utf-8'))
+        frame = self.HEADER.pack(len(payload),
+                zlib.crc32(payload) & 0xffffffff) + payload
+
+        with self._lock:
+            writer = self._get_writer(len(frame))
+            segment = next(reversed(self._segments))
+            info = self._segments[segment]
+
+            writer.write(frame)
+            writer.flush()
+            info['offsets'].append(info['bytes'])
+            info['bytes'] += len(frame)
+
+            if self.fsync == 'always' or (self.fsync == 'interval' and
+                    time.time() - self._last_fsync >= self.fsync_interval):
+                os.fsync(writer.fileno())
+                self._last_fsync = time.time()
+
+            self._evict()
+
+    def peek(self, max_messages=None):
+        """
+        Returns a list of (position, message) waiting to be replayed, in
+        order, without removing them.  Pass the position to commit() once
+        the message has been accepted.
+        """
+        messages = []
+        with self._lock:
+            for (segment, info) in list(self._segments.items()):
+                if segment < self._cursor[0]:
+                    continue
+
+                start = self._cursor[1] if segment == self._cursor[0] else 0
+                for (offset, end, payload) in self._read_frames(segment,
+                        start):
+                    message = json.loads(zlib.decompress(payload).decode(
+                        'utf-8'))
+                    messages.append(((segment, end), message))
+                    if max_messages and len(messages) >= max_messages:
+                        return messages
+
+        return messages
+
+    def commit(self, position):
+        """
+        Mark everything up to and including the message at the position
+        as delivered so that it will not be replayed.
+        """
+        with self._lock:
+            if tuple(position) <= tuple(self._cursor):
+                return
+
+            self._cursor = tuple(position)
+            self._write_cursor()
+
+            # Segments fully delivered are no longer needed
+            active = next(reversed(self._segments)) if self._segments else None
+            for segment in list(self._segments.keys()):
+                info = self._segments[segment]
+                done = segment < self._cursor[0] or (
+                        segment == self._cursor[0] and
+                        self._cursor[1] >= info['bytes'])
+                if done and segment != active:
+                    self._remove_segment(segment)
+
+    def close(self):
+        """
+        Make sure everything appended is on disk.
+        """
+        with self._lock:
+            if self._writer is not None:
+                self._writer.flush()
+                if self.fsync != 'never':
+                    os.fsync(self._writer.fileno())
+                self._writer.close()
+                self._writer = None
+
+    def _get_segment_path(self, segment):
+        return os.path.join(self.path, '%012d%s' % (segment, self.SUFFIX))
+
+    def _get_writer(self, size):
+        """
+        Returns the file to append to, starting a new segment when the
+        current one is full.
+        """
+        if self._segments:
+            segment = next(reversed(self._segments))
+            used = self._segments[segment]['bytes']
+            if self._writer is not None and (used == 0 or
+                    used + size <= self.segment_bytes):
+                return self._writer
+            if self._writer is None and used == 0:
+                self._writer = open(self._get_segment_path(segment), 'ab')
+                return self._writer
+            segment += 1
+        else:
+            segment = max(self._cursor[0], 1)
+
+        if self._writer is not None:
+            self._writer.flush()
+            if self.fsync != 'never':
+                os.fsync(self._writer.fileno())
+            self._writer.close()
+
+        self._segments[segment] = {'bytes': 0, 'offsets': []}
+        self._writer = open(self._get_segment_path(segment), 'ab')
+        return self._writer
+
+    def _read_frames(self, segment, start=0):
+        """
+        Yields (offset, end, payload) for each complete frame in a segment
+        from the start offset.  A torn or corrupt frame ends the segment.
+        """
+        with open(self._get_segment_path(segment), 'rb') as data:
+            data.seek(start)
+            offset = start
+            while True:
+                header = data.read(self.HEADER.size)
+                if len(header) < self.HEADER.size:
+                    return
+
+                (length, crc) = self.HEADER.unpack(header)
+                payload = data.read(length)
+                if len(payload) < length or \
+                        zlib.crc32(payload) & 0xffffffff != crc:
+                    logging.warning("Corrupt frame in spool segment %s at %s"
+                            % (segment, offset))
+                    return
+
+                end = offset + self.HEADER.size + length
+                yield (offset, end, payload)
+                offset = end
+
+    def _scan(self):
+        """
+        Index the segments already on disk from a previous run.
+        """
+        segments = []
+        for filename in os.listdir(self.path):
+            if filename.endswith(self.SUFFIX):
+                segments.append(int(filename[:-len(self.SUFFIX)]))
+
+        for segment in sorted(segments):
+            if segment < self._cursor[0]:
+                os.remove(self._get_segment_path(segment))
+                continue
+
+            offsets = []
+            end = 0
+            for (offset, end, payload) in self._read_frames(segment):
+                offsets.append(offset)
+
+            # Anything after the last good frame was a torn write
+            with open(self._get_segment_path(segment), 'ab') as data:
+                data.truncate(end)
+
+            self._segments[segment] = {'bytes': end, 'offsets': offsets}
+
+    def _evict(self):
+        """
+        Drop the oldest segments while over the size cap.  Callers are
+        expected to hold the lock.
+        """
+        total = sum(info['bytes'] for info in self._segments.values())
+        while total > self.max_bytes and len(self._segments) > 1:
+            segment = next(iter(self._segments))
+            info = self._segments[segment]
+
+            dropped = len(info['offsets'])
+            if segment == self._cursor[0]:
+                dropped = len([offset for offset in info['offsets']
+                    if offset >= self._cursor[1]])
+            self._dropped += dropped
+            logging.warning("Spool over %s bytes, dropped %s messages." %
+                    (self.max_bytes, dropped))
+
+            total -= info['bytes']
+            self._remove_segment(segment)
+
+            following = next(iter(self._segments))
+            if self._cursor[0] <= segment:
+                self._cursor = (following, 0)
+                self._write_cursor()
+
+    def _remove_segment(self, segment):
+        del self._segments[segment]
+        try:
+            os.remove(self._get_segment_path(segment))
+        except OSError as exc:
+            if exc.errno != errno.ENOENT:
+                raise
+
+    def _read_cursor(self):
+        """
+        The cursor is the segment and offset of the next message to replay.
+        """
+        path = os.path.join(self.path, 'cursor')
+        if not os.path.exists(path):
+            return (0, 0)
+
+        with open(path, 'r') as data:
+            cursor = json.load(data)
+        return (cursor['segment'], cursor['offset'])
+
+    def _write_cursor(self):
+        path = os.path.join(self.path, 'cursor')
+        with open(path + '.tmp', 'w') as output:
+            output.write(json.dumps({'segment': self._cursor[0],
+                'offset': self._cursor[1]}))
+            output.flush()
+            if self.fsync != 'never':
+                os.fsync(output.fileno())
+        os.rename(path + '.tmp', path)
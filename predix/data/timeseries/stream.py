@@ -0,0 +1,224 @@
+"""
+Incremental decoding of Time Series query responses so that the values of
+large results are handled in chunks as the body arrives rather than once the
+whole response has been read and parsed.
+"""
+import json
+import codecs
+
+# Containers of the response that are walked rather than decoded whole
+CONTAINERS = [
+    (),
+    ('tags',),
+    ('tags', '*'),
+    ('tags', '*', 'results'),
+    ('tags', '*', 'results', '*'),
+    ]
+
+# The datapoints that are decoded and handed out in chunks
+VALUES = ('tags', '*', 'results', '*', 'values')
+
+WHITESPACE = ' \t\n\r'
+
+
+class _Reader(object):
+    """
+    Buffer over an iterable of body chunks that decodes one JSON value or
+    token at a time, reading more of the body only as needed.
+    """
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._json = json.JSONDecoder()
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self):
+        """
+        Append more of the body to the buffer, returns False once there is
+        nothing left to read.
+        """
+        if self._eof:
+            return False
+
+        # Anything already consumed can be let go
+        self._buffer = self._buffer[self._pos:]
+        self._pos = 0
+
+        for chunk in self._chunks:
+            if isinstance(chunk, bytes):
+                chunk = self._decoder.decode(chunk)
+            if chunk:
+                self._buffer += chunk
+                return True
+
+        self._eof = True
+        tail = self._decoder.decode(b'', final=True)
+        self._buffer += tail
+        return bool(tail)
+
+    def peek(self):
+        """
+        Returns the next character that is not whitespace without consuming
+        it, or an empty string at the end of the body.
+        """
+        while True:
+            while self._pos < len(self._buffer) and \
+                    self._buffer[self._pos] in WHITESPACE:
+                self._pos += 1
+
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+
+            if not self._fill():
+                return ''
+
+    def expect(self, char):
+        """
+        Consume the next character which must be the one given.
+        """
+        found = self.peek()
+        if found != char:
+            raise ValueError("Expected '%s' but found '%s' in response." %
+                    (char, found))
+        self._pos += 1
+
+    def decode(self):
+        """
+        Consume and return the next complete JSON value.
+        """
+        self.peek()
+        while True:
+            try:
+                (value, end) = self._json.raw_decode(self._buffer, self._pos)
+            except ValueError:
+                if not self._fill():
+                    raise
+                continue
+
+            # A number at the end of the buffer may continue in the next chunk
+            if end == len(self._buffer) and self._fill():
+                continue
+
+            self._pos = end
+            return value
+
+
+def _get_pattern(path):
+    return tuple('*' if isinstance(key, int) else key for key in path)
+
+
+def _parse(reader, path, chunk_size):
+    """
+    Generator of (path, value) for the value at the path.
+    """
+    pattern = _get_pattern(path)
+    if pattern == VALUES and reader.peek() == '[':
+        for event in _parse_values(reader, path, chunk_size):
+            yield event
+    elif pattern in CONTAINERS and reader.peek() == '{':
+        reader.expect('{')
+        if reader.peek() == '}':
+            reader.expect('}')
+            return
+
+        while True:
+            key = reader.decode()
+            reader.expect(':')
+            for event in _parse(reader, path + (key,), chunk_size):
+                yield event
+
+            if reader.peek() != ',':
+                reader.expect('}')
+                return
+            reader.expect(',')
+    elif pattern in CONTAINERS and reader.peek() == '[':
+        reader.expect('[')
+        if reader.peek() == ']':
+            reader.expect(']')
+            return
+
+        index = 0
+        while True:
+            for event in _parse(reader, path + (index,), chunk_size):
+                yield event
+            index += 1
+
+            if reader.peek() != ',':
+                reader.expect(']')
+                return
+            reader.expect(',')
+    else:
+        yield (path, reader.decode())
+
+
+def _parse_values(reader, path, chunk_size):
+    """
+    Generator of (path, chunk) with lists of up to chunk_size datapoints.
+    """
+    reader.expect('[')
+    chunk = []
+    chunks = 0
+    if reader.peek() == ']':
+        reader.expect(']')
+    else:
+        while True:
+            chunk.append(reader.decode())
+            if len(chunk) >= chunk_size:
+                yield (path, chunk)
+                chunk = []
+                chunks += 1
+
+            if reader.peek() != ',':
+                reader.expect(']')
+                break
+            reader.expect(',')
+
+    # Results without datapoints still get a (empty) chunk
+    if chunk or not chunks:
+        yield (path, chunk)
+
+
+def iter_events(chunks, chunk_size=10000):
+    """
+    Generator of (path, value) pairs from the body of a get_datapoints()
+    response given as an iterable of bytes or text chunks.
+
+    The path is a tuple of keys and list indexes into the response such as
+    ('tags', 0, 'name') or ('tags', 0, 'results', 1, 'attributes') with the
+    value fully decoded.  The datapoints at ('tags', i, 'results', j,
+    'values') are instead given as a sequence of lists of up to chunk_size
+    [timestamp, value, quality] as they are read.
+    """
+    reader = _Reader(chunks)
+    for event in _parse(reader, (), chunk_size):
+        yield event
+
+    if reader.peek() != '':
+        raise ValueError("Unexpected data after end of response.")
+
+
+def iter_values(events):
+    """
+    Generator of a dictionary for each chunk of datapoints from
+    iter_events() holding the 'name' of the tag along with the 'groups'
+    and 'attributes' of the result seen so far and its chunk of 'values'.
+    """
+    names = {}
+    results = {}
+    for (path, value) in events:
+        if len(path) == 3 and path[2] == 'name':
+            names[path[1]] = value
+        elif len(path) == 5 and path[2] == 'results':
+            result = results.setdefault((path[1], path[3]),
+                    {'groups': [], 'attributes': {}})
+            if path[4] == 'values':
+                yield {
+                    'name': names.get(path[1]),
+                    'groups': result['groups'],
+                    'attributes': result['attributes'],
+                    'values': value,
+                    }
+            elif path[4] in ['groups', 'attributes']:
+                result[path[4]] = value
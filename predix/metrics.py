@@ -0,0 +1,490 @@
+"""
+Measurements of every request made to Predix services, to find which calls
+dominate latency.
+
+Every HTTP request records its latency in a histogram labelled by the
+service host, method, endpoint and status, along with the bytes sent and
+received.  Retries and token refreshes are counted too.  They can be read in
+the Prometheus text format or sent to StatsD as they happen.
+
+::
+
+    import predix.metrics
+
+    # Serve this from a /metrics endpoint for Prometheus to scrape
+    text = predix.metrics.to_prometheus()
+
+    # Or send each measurement to a StatsD daemon
+    predix.metrics.add_sink(predix.metrics.StatsdSink('localhost', 8125))
+
+    # Or watch requests as they are made
+    def after(event):
+        if event['elapsed'] > 1:
+            logging.warning("Slow request to %s" % (event['uri']))
+
+    predix.metrics.add_hook(after=after)
+
+"""
+import re
+import time
+import socket
+import logging
+import threading
+
+import six
+
+
+# Upper bounds in seconds of the latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Path segments that identify a particular item rather than an endpoint
+_IDENTIFIER = re.compile(r'^([0-9]+|[0-9a-fA-F-]{16,}|.*%.*)$')
+
+
+def get_endpoint(uri):
+    """
+    Returns the path of the uri with identifiers such as numbers, guids and
+    escaped values replaced, so requests to the same endpoint are grouped.
+    """
+    path = six.moves.urllib.parse.urlparse(uri).path
+    segments = []
+    for segment in path.split('/'):
+        if not segment:
+            continue
+        if _IDENTIFIER.match(segment):
+            segment = '{id}'
+        segments.append(segment)
+
+    return '/' + '/'.join(segments)
+
+
+def get_service(uri):
+    """
+    Returns the host of the uri that identifies the service.
+    """
+    return six.moves.urllib.parse.urlparse(uri).netloc.lower() or uri
+
+
+def _get_size(body):
+    """
+    Returns the length of a body given as bytes or text, otherwise 0.
+    """
+    if isinstance(body, (six.binary_type, six.text_type)):
+        return len(body)
+    return 0
+
+
+def _redact(kwargs):
+    """
+    Returns the request kwargs with the value of any Authorization header
+    hidden, so hooks never see credentials.
+    """
+    headers = kwargs.get('headers')
+    if not headers:
+        return kwargs
+
+    redacted = dict([(key, '<redacted>' if key.lower() == 'authorization'
+        else value) for (key, value) in headers.items()])
+    return dict(kwargs, headers=redacted)
+
+
+class Histogram(object):
+    """
+    Counts observations into buckets by upper bound, along with their sum.
+
+    :param buckets: sorted upper bounds of the buckets
+
+    """
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        index = len(self.buckets)
+        for (i, bound) in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def get_cumulative(self):
+        """
+        Returns (upper bound, observations at or below it) for each bucket,
+        ending with infinity.
+        """
+        total = 0
+        cumulative = []
+        for (bound, count) in zip(self.buckets + (float('inf'),),
+                self.counts):
+            total += count
+            cumulative.append((bound, total))
+        return cumulative
+
+
+class StatsdSink(object):
+    """
+    Sends each measurement to a StatsD daemon over UDP as it is recorded,
+    histograms as timers in milliseconds and counters as counts.
+
+    :param host: host of the StatsD daemon
+
+    :param port: port of the StatsD daemon
+
+    :param prefix: prepended to the name of every metric
+
+    """
+    def __init__(self, host='localhost', port=8125, prefix='predix'):
+        self.address = (host, port)
+        self.prefix = prefix
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def get_name(self, name, labels):
+        """
+        Returns the dotted StatsD name for a metric and its labels.
+        """
+        if name.startswith('predix_'):
+            name = name[len('predix_'):]
+
+        parts = [self.prefix, name]
+        for key in sorted(labels.keys()):
+            parts.append(re.sub(r'[^A-Za-z0-9_-]+', '_',
+                str(labels[key])).strip('_') or '_')
+        return '.'.join([part for part in parts if part])
+
+    def _send(self, line):
+        try:
+            self._socket.sendto(line.encode('utf-8'), self.address)
+        except socket.error as e:
+            logging.debug("STATSD=" + str(e))
+
+    def increment(self, name, value, labels):
+        self._send('%s:%s|c' % (self.get_name(name, labels), value))
+
+    def observe(self, name, value, labels):
+        self._send('%s:%.3f|ms' % (self.get_name(name, labels),
+            value * 1000))
+
+
+class MetricsRegistry(object):
+    """
+    Keeps counters and histograms by name and labels, and the hooks called
+    around each request.
+
+    :param buckets: upper bounds in seconds of the histogram buckets
+
+    """
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+        self._before = []
+        self._after = []
+        self._sinks = []
+        self._lock = threading.Lock()
+
+    def describe(self, name, text):
+        """
+        Set the help text exported with a metric.
+        """
+        self._help[name] = text
+
+    def increment(self, name, value=1, **labels):
+        """
+        Add the value to the counter of the name and labels.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+        for sink in self._sinks:
+            try:
+                sink.increment(name, value, labels)
+            except Exception as e:
+                logging.warning("Metrics sink failed: %s" % (e))
+
+    def observe(self, name, value, **labels):
+        """
+        Record the value in the histogram of the name and labels.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = Histogram(self.buckets)
+                self._histograms[key] = histogram
+            histogram.observe(value)
+
+        for sink in self._sinks:
+            try:
+                sink.observe(name, value, labels)
+            except Exception as e:
+                logging.warning("Metrics sink failed: %s" % (e))
+
+    def get_counter(self, name, **labels):
+        """
+        Returns the value of a counter, or the total over every label when
+        none are given.
+        """
+        with self._lock:
+            if labels:
+                key = (name, tuple(sorted(labels.items())))
+                return self._counters.get(key, 0)
+
+            return sum([value for (key, value) in self._counters.items()
+                if key[0] == name])
+
+    def get_histogram(self, name, **labels):
+        """
+        Returns the histogram for the name and labels, or None.
+        """
+        with self._lock:
+            return self._histograms.get((name, tuple(sorted(labels.items()))))
+
+    def add_hook(self, before=None, after=None):
+        """
+        Add callables given the event of each request, before it is made
+        and after it completes.  Returns a handle for remove_hook().
+
+        The event is a dict with the method, uri, service, endpoint, request
+        kwargs (with any Authorization header redacted), and the time it
+        started.  After the request it also has the
+        status (or 'error'), elapsed seconds, bytes_sent, bytes_received,
+        and the response or error.
+        """
+        with self._lock:
+            self._before = self._before + ([before] if before else [])
+            self._after = self._after + ([after] if after else [])
+        return (before, after)
+
+    def remove_hook(self, handle):
+        (before, after) = handle
+        with self._lock:
+            self._before = [hook for hook in self._before if hook != before]
+            self._after = [hook for hook in self._after if hook != after]
+
+    def add_sink(self, sink):
+        """
+        Add a sink, such as a StatsdSink, that is given every measurement
+        as it is recorded.
+        """
+        with self._lock:
+            self._sinks = self._sinks + [sink]
+        return sink
+
+    def remove_sink(self, sink):
+        with self._lock:
+            self._sinks = [s for s in self._sinks if s != sink]
+
+    def track(self, call, method, uri, **kwargs):
+        """
+        Make a request with call(method, uri, **kwargs) calling the hooks
+        and recording its latency and size.
+        """
+        event = self.start_request(method, uri, **kwargs)
+        try:
+            response = call(method, uri, **kwargs)
+        except Exception as e:
+            self.finish_request(event, error=e)
+            raise
+
+        self.finish_request(event, response=response)
+        return response
+
+    def start_request(self, method, uri, **kwargs):
+        """
+        Returns the event for a request about to be made, after calling the
+        before hooks.  Pass it to finish_request() once the request is done,
+        for callers such as asyncio clients that can't use track().
+        """
+        event = {
+            'method': method.upper(),
+            'uri': uri,
+            'service': get_service(uri),
+            'endpoint': get_endpoint(uri),
+            'kwargs': _redact(kwargs),
+            'started': time.time(),
+            }
+
+        self._call_hooks(self._before, event)
+        return event
+
+    def finish_request(self, event, response=None, error=None):
+        """
+        Record the latency and size of a request started with
+        start_request() along with its response or error.
+        """
+        if error is not None:
+            event.update({'status': 'error', 'error': error,
+                'response': None})
+        else:
+            event.update({'status': response.status_code, 'error': None,
+                'response': response})
+
+        event['elapsed'] = time.time() - event['started']
+        try:
+            self._record(event)
+        except Exception as e:
+            # Never hide the outcome of the request itself
+            logging.error(e)
+
+    def _call_hooks(self, hooks, event):
+        """
+        Call each hook with the event, logging rather than raising errors
+        so a broken hook can't fail the request.
+        """
+        for hook in hooks:
+            try:
+                hook(event)
+            except Exception as e:
+                logging.error(e)
+
+    def _record(self, event):
+        response = event['response']
+
+        event['bytes_sent'] = _get_size(event['kwargs'].get('data'))
+
+        # Reading the content of a streamed response would consume it
+        event['bytes_received'] = 0
+        if response is not None:
+            if event['kwargs'].get('stream'):
+                length = response.headers.get('Content-Length')
+                if isinstance(length, six.string_types) and length.isdigit():
+                    event['bytes_received'] = int(length)
+            else:
+                event['bytes_received'] = _get_size(response.content)
+
+        labels = {
+            'service': event['service'],
+            'method': event['method'],
+            'endpoint': event['endpoint'],
+            'status': str(event['status']),
+            }
+
+        self.observe('predix_request_seconds', event['elapsed'], **labels)
+        self.increment('predix_request_bytes_sent_total',
+                event['bytes_sent'], **labels)
+        self.increment('predix_request_bytes_received_total',
+                event['bytes_received'], **labels)
+
+        self._call_hooks(self._after, event)
+
+    def reset(self):
+        """
+        Clear every counter and histogram.
+        """
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def to_prometheus(self):
+        """
+        Returns every metric in the Prometheus text exposition format.
+        """
+        def format_labels(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ''
+            return '{%s}' % (','.join(['%s="%s"' % (key, str(value)
+                .replace('\\', '\\\\').replace('"', '\\"')
+                .replace('\n', '\\n')) for (key, value) in pairs]))
+
+        def format_value(value):
+            if value == float('inf'):
+                return '+Inf'
+            return repr(float(value)) if isinstance(value, float) \
+                    else str(value)
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted([(key, (histogram.get_cumulative(),
+                histogram.sum, histogram.count)) for (key, histogram)
+                in self._histograms.items()])
+
+        lines = []
+        described = set()
+
+        def describe(name, kind):
+            if name in described:
+                return
+            described.add(name)
+            if name in self._help:
+                lines.append('# HELP %s %s' % (name, self._help[name]))
+            lines.append('# TYPE %s %s' % (name, kind))
+
+        for ((name, labels), value) in counters:
+            describe(name, 'counter')
+            lines.append('%s%s %s' % (name, format_labels(labels),
+                format_value(value)))
+
+        for ((name, labels), (cumulative, total, count)) in histograms:
+            describe(name, 'histogram')
+            for (bound, value) in cumulative:
+                lines.append('%s_bucket%s %s' % (name,
+                    format_labels(labels, [('le', format_value(bound))]),
+                    value))
+            lines.append('%s_sum%s %s' % (name, format_labels(labels),
+                format_value(total)))
+            lines.append('%s_count%s %s' % (name, format_labels(labels),
+                count))
+
+        return '\n'.join(lines) + '\n'
+
+
+# The registry shared by every client in the process
+registry = MetricsRegistry()
+registry.describe('predix_request_seconds',
+        'Latency of requests to Predix services.')
+registry.describe('predix_request_bytes_sent_total',
+        'Bytes of request bodies sent to Predix services.')
+registry.describe('predix_request_bytes_received_total',
+        'Bytes of response bodies received from Predix services.')
+registry.describe('predix_retries_total',
+        'Requests made again after a failure.')
+registry.describe('predix_circuit_open_total',
+        'Requests failed without being made while a circuit was open.')
+registry.describe('predix_token_refreshes_total',
+        'Tokens requested from UAA.')
+
+
+def increment(name, value=1, **labels):
+    registry.increment(name, value, **labels)
+
+
+def observe(name, value, **labels):
+    registry.observe(name, value, **labels)
+
+
+def add_hook(before=None, after=None):
+    """
+    Add hooks called around every request, see MetricsRegistry.add_hook().
+    """
+    return registry.add_hook(before=before, after=after)
+
+
+def remove_hook(handle):
+    registry.remove_hook(handle)
+
+
+def add_sink(sink):
+    """
+    Send every measurement to the sink as it is recorded.
+    """
+    return registry.add_sink(sink)
+
+
+def remove_sink(sink):
+    registry.remove_sink(sink)
+
+
+def to_prometheus():
+    """
+    Returns every metric in the Prometheus text exposition format.
+    """
+    return registry.to_prometheus()
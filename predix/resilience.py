@@ -0,0 +1,344 @@
+"""
+Retrying failed requests to Predix services with backoff and failing fast
+with a circuit breaker for each host while a service is down.
+"""
+import time
+import random
+import logging
+import threading
+import email.utils
+
+import requests
+
+import predix.metrics
+import predix.transport
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """
+    Raised instead of making a request to a host that has been failing.
+    """
+    pass
+
+
+class RetryPolicy(object):
+    """
+    Decides whether and when a request that failed should be made again.
+
+    Requests using idempotent verbs (GET, PUT, DELETE, HEAD, OPTIONS) are
+    retried on connection errors, timeouts, and the retry statuses.  POST
+    and PATCH are only retried when the request could not have reached the
+    service (a failure to connect) or the service asked for it to be sent
+    again later (429 or 503).
+
+    :param max_retries: how many times a request is retried
+
+    :param backoff: seconds to wait before the first retry, doubled for each
+        retry after that
+
+    :param max_backoff: the longest to wait between retries
+
+    :param jitter: whether to wait a random time up to the backoff so that
+        many clients don't retry in step
+
+    :param statuses: response status codes worth retrying
+
+    :param max_retry_after: the longest Retry-After header from the service
+        that will be waited on, beyond this the response is returned
+
+    """
+    IDEMPOTENT = ['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE']
+
+    # Statuses meaning the request was not processed so is safe to resend
+    NOT_PROCESSED = [429, 503]
+
+    def __init__(self, max_retries=3, backoff=0.5, max_backoff=30,
+            jitter=True, statuses=(429, 500, 502, 503, 504),
+            max_retry_after=60):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.statuses = list(statuses)
+        self.max_retry_after = max_retry_after
+
+    def is_retryable_error(self, method, error):
+        """
+        Whether a request that raised the given error can be retried.
+        """
+        if isinstance(error, CircuitOpenError):
+            return False
+
+        if method.upper() in self.IDEMPOTENT:
+            return isinstance(error, (requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout))
+
+        # Otherwise only when the request was never sent
+        return isinstance(error, requests.exceptions.ConnectTimeout) or (
+                isinstance(error, requests.exceptions.ConnectionError) and
+                _is_connect_error(error))
+
+    def is_retryable_status(self, method, status):
+        """
+        Whether a request that got a response with the status can be
+        retried.
+        """
+        if status not in self.statuses:
+            return False
+
+        return method.upper() in self.IDEMPOTENT or \
+                status in self.NOT_PROCESSED
+
+    def get_delay(self, attempt, retry_after=None):
+        """
+        Returns seconds to wait before the given retry attempt (from 0),
+        using the Retry-After header of the response when there is one.
+        """
+        delay = get_retry_after(retry_after)
+        if delay is not None:
+            return delay
+
+        delay = min(self.max_backoff, self.backoff * (2 ** attempt))
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+
+def _is_connect_error(error):
+    """
+    Whether a requests ConnectionError happened while connecting, before
+    any of the request was sent.
+    """
+    reason = error.args[0] if error.args else None
+    reason = getattr(reason, 'reason', reason)
+    name = type(reason).__name__
+    return name in ['NewConnectionError', 'ConnectTimeoutError',
+            'NameResolutionError', 'ClientConnectorError']
+
+
+def get_retry_after(value):
+    """
+    Returns the seconds from a Retry-After header given as either seconds
+    or an HTTP date, or None when missing or not understood.
+    """
+    if not value:
+        return None
+
+    try:
+        return max(0, float(value))
+    except ValueError:
+        pass
+
+    parsed = email.utils.parsedate_tz(value)
+    if parsed is None:
+        return None
+    return max(0, email.utils.mktime_tz(parsed) - time.time())
+
+
+class CircuitBreaker(object):
+    """
+    Tracks failures of requests to a host, opening once there have been
+    failure_threshold in a row so that requests fail immediately.  After
+    reset_timeout seconds a single trial request is let through and the
+    circuit closes again if it succeeds.
+
+    :param failure_threshold: consecutive failures that open the circuit
+
+    :param reset_timeout: seconds the circuit stays open before a trial
+
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened = 0
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def before_request(self, host=None):
+        """
+        Raises CircuitOpenError when requests should not be made.
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+
+            if self.state == self.OPEN:
+                if time.time() - self._opened < self.reset_timeout:
+                    raise CircuitOpenError("Circuit open for %s after %s "
+                            "failures." % (host, self._failures))
+                self.state = self.HALF_OPEN
+                self._trial = False
+
+            # Only a single trial request while half open
+            if self._trial:
+                raise CircuitOpenError("Circuit half open for %s, waiting "
+                        "on trial request." % (host))
+            self._trial = True
+
+    def on_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+            self._trial = False
+
+    def on_abort(self):
+        """
+        Release the trial request after an error that says nothing about
+        the host, so the next request can be the trial instead.
+        """
+        with self._lock:
+            self._trial = False
+
+    def on_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial = False
+            if self.state == self.HALF_OPEN or \
+                    self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logging.warning("Circuit opened after %s failures." %
+                            (self._failures))
+                self.state = self.OPEN
+                self._opened = time.time()
+
+
+# Circuit breakers shared by every client in the process, one per host
+_breakers = {}
+_breaker_settings = {'failure_threshold': 5, 'reset_timeout': 30}
+_breakers_lock = threading.Lock()
+
+
+def configure_breakers(**settings):
+    """
+    Change the failure_threshold and reset_timeout of circuit breakers,
+    resetting any that already exist.
+    """
+    unknown = set(settings.keys()) - set(_breaker_settings.keys())
+    if unknown:
+        raise ValueError("Unknown circuit breaker settings %s." %
+                (', '.join(sorted(unknown))))
+
+    with _breakers_lock:
+        _breaker_settings.update(settings)
+        _breakers.clear()
+
+
+def get_breaker(uri):
+    """
+    Returns the circuit breaker for the host of the uri.
+    """
+    host = predix.transport.get_host(uri)
+    with _breakers_lock:
+        breaker = _breakers.get(host)
+        if breaker is None:
+            breaker = CircuitBreaker(**_breaker_settings)
+            _breakers[host] = breaker
+        return breaker
+
+
+class Attempts(object):
+    """
+    The attempts at a single request, deciding with the retry policy and
+    circuit breaker of the host whether and when to make it again.  Shared
+    by request() and its asyncio counterpart in predix.aio.
+    """
+    def __init__(self, method, uri, retry=None):
+        self.method = method
+        self.uri = uri
+        self.retry = retry or RetryPolicy()
+        self.breaker = get_breaker(uri)
+        self.host = predix.transport.get_host(uri)
+        self.attempt = 0
+
+    def before_request(self):
+        """
+        Raises CircuitOpenError when the request should not be made.
+        """
+        try:
+            self.breaker.before_request(self.host)
+        except CircuitOpenError:
+            predix.metrics.increment('predix_circuit_open_total',
+                    service=predix.metrics.get_service(self.uri))
+            raise
+
+    def on_error(self, error):
+        """
+        Returns seconds to wait before making the request again after it
+        raised the error, or None when the error should be raised.
+        """
+        if not isinstance(error, requests.exceptions.RequestException):
+            self.breaker.on_abort()
+            return None
+
+        self.breaker.on_failure()
+        if self.attempt >= self.retry.max_retries or \
+                not self.retry.is_retryable_error(self.method, error):
+            return None
+
+        logging.debug("RETRY=%s after %s" % (self.attempt + 1, error))
+        return self._next(self.retry.get_delay(self.attempt))
+
+    def on_response(self, response):
+        """
+        Returns seconds to wait before making the request again after the
+        response, or None when the response should be returned.
+        """
+        # Being told to slow down doesn't mean the service is down
+        if response.status_code >= 500:
+            self.breaker.on_failure()
+        else:
+            self.breaker.on_success()
+
+        if self.attempt >= self.retry.max_retries or \
+                not self.retry.is_retryable_status(self.method,
+                    response.status_code):
+            return None
+
+        delay = self.retry.get_delay(self.attempt,
+                response.headers.get('Retry-After'))
+        if delay > self.retry.max_retry_after:
+            return None
+
+        response.close()
+        logging.debug("RETRY=%s after %s" % (self.attempt + 1,
+            response.status_code))
+        return self._next(delay)
+
+    def _next(self, delay):
+        predix.metrics.increment('predix_retries_total',
+                service=predix.metrics.get_service(self.uri),
+                method=self.method.upper())
+        self.attempt += 1
+        return delay
+
+
+def request(method, uri, retry=None, **kwargs):
+    """
+    Make a request with the shared transport, retrying according to the
+    retry policy and failing fast while the circuit of the host is open.
+
+    Responses are returned whatever their status once out of retries, so
+    callers can still check the status.
+    """
+    attempts = Attempts(method, uri, retry=retry)
+    while True:
+        attempts.before_request()
+        try:
+            response = predix.transport.request(method, uri, **kwargs)
+        except Exception as e:
+            delay = attempts.on_error(e)
+            if delay is None:
+                raise
+        else:
+            delay = attempts.on_response(response)
+            if delay is None:
+                return response
+
+        time.sleep(delay)
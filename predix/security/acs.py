@@ -6,6 +6,7 @@ import logging
 
 import predix.config
 import predix.service
+import predix.transport
 
 
 class AccessControl(object):
@@ -272,7 +273,7 @@ class AccessControl(object):
         Tests whether or not the ACS service being monitored is alive.
         """
         target = self.uri + '/monitoring/heartbeat'
-        response = self.session.get(target)
+        response = predix.transport.request('GET', target)
         return response
 
     def is_alive(self):
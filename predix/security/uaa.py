@@ -1,15 +1,18 @@
 
 import os
 import json
+import time
 import errno
 import base64
 import logging
-import requests
+import calendar
 import datetime
 import dateutil.parser
 
 import predix.app
 import predix.config
+import predix.metrics
+import predix.transport
 
 
 class UserAccountAuthentication(object):
@@ -28,10 +31,12 @@ class UserAccountAuthentication(object):
         super(UserAccountAuthentication, self).__init__(*args, **kwargs)
 
         self.uri = uri or self._get_uaa_uri()
-        self.session = requests.Session()
         self.authenticated = False
         self.client = {}
 
+        # The last expires value parsed and its epoch seconds
+        self._expires = (None, 0)
+
     def _get_uaa_uri(self):
         """
         Returns the URI endpoint for an instance of a UAA
@@ -64,12 +69,13 @@ class UserAccountAuthentication(object):
         uri = self.uri + '/oauth/token'
 
         logging.debug("URI=" + str(uri))
-        logging.debug("HEADERS=" + str(headers))
         logging.debug("BODY=" + str(params))
 
-        response = requests.post(uri, headers=headers, params=params)
+        response = predix.transport.request('POST', uri,
+                headers=headers, params=params)
         if response.status_code == 200:
-            logging.debug("RESPONSE=" + str(response.json()))
+            predix.metrics.increment('predix_token_refreshes_total',
+                    service=predix.metrics.get_service(uri))
             return response.json()
         else:
             logging.warning("Failed to authenticate as %s" % (client))
@@ -89,12 +95,12 @@ class UserAccountAuthentication(object):
         uri = self.uri + '/oauth/token'
 
         logging.debug("URI=" + str(uri))
-        logging.debug("HEADERS=" + str(headers))
-        logging.debug("BODY=" + str(params))
 
-        response = requests.post(uri, headers=headers, params=params)
+        response = predix.transport.request('POST', uri,
+                headers=headers, params=params)
         if response.status_code == 200:
-            logging.debug("RESPONSE=" + str(response.json()))
+            predix.metrics.increment('predix_token_refreshes_total',
+                    service=predix.metrics.get_service(uri))
             return response.json()
         else:
             logging.warning("Failed to authenticate %s" % (user))
@@ -112,11 +118,38 @@ class UserAccountAuthentication(object):
         if 'expires' not in client:
             return True
 
-        expires = dateutil.parser.parse(client['expires'])
-        if expires < datetime.datetime.now():
-            return True
+        return self._get_expires_time(client['expires']) < time.time()
+
+    def _get_expires_time(self, expires):
+        """
+        Returns the epoch seconds of an expires timestamp, which is only
+        parsed when it differs from the last one since this is checked
+        before every request.
+        """
+        (cached, seconds) = self._expires
+        if expires == cached:
+            return seconds
+
+        parsed = None
+        for pattern in ['%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S']:
+            try:
+                parsed = datetime.datetime.strptime(expires, pattern)
+                break
+            except ValueError:
+                pass
 
-        return False
+        if parsed is None:
+            parsed = dateutil.parser.parse(expires)
+
+        # Naive timestamps are local time as written by authenticate()
+        if parsed.tzinfo is not None:
+            seconds = calendar.timegm(parsed.utctimetuple())
+        else:
+            seconds = time.mktime(parsed.timetuple())
+        seconds += parsed.microsecond / 1000000.0
+
+        self._expires = (expires, seconds)
+        return seconds
 
     def _initialize_uaa_cache(self):
         """
@@ -179,11 +212,9 @@ class UserAccountAuthentication(object):
                 continue
 
             # May have old tokens laying around to be cleaned up
-            if 'expires' in client:
-                expires = dateutil.parser.parse(client['expires'])
-                if expires < datetime.datetime.now():
-                    data[self.uri].remove(client)
-                    continue
+            if 'expires' in client and self.is_expired_token(client):
+                data[self.uri].remove(client)
+                continue
 
         data[self.uri].append(new_item)
 
@@ -259,9 +290,9 @@ class UserAccountAuthentication(object):
             headers = self._get_headers()
 
         logging.debug("URI=" + str(uri))
-        logging.debug("HEADERS=" + str(headers))
 
-        response = self.session.get(uri, headers=headers, params=params)
+        response = predix.transport.request('GET', uri,
+                headers=headers, params=params)
         logging.debug("STATUS=" + str(response.status_code))
         if response.status_code == 200:
             return response.json()
@@ -277,11 +308,10 @@ class UserAccountAuthentication(object):
             headers = self._get_headers()
 
         logging.debug("URI=" + str(uri))
-        logging.debug("HEADERS=" + str(headers))
         logging.debug("BODY=" + str(data))
 
-        response = self.session.post(uri, headers=headers,
-                data=json.dumps(data))
+        response = predix.transport.request('POST', uri,
+                headers=headers, data=json.dumps(data))
 
         logging.debug("STATUS=" + str(response.status_code))
         if response.status_code in [200, 201]:
@@ -392,7 +422,7 @@ class UserAccountAuthentication(object):
 
         uri = self.uri + '/oauth/clients'
         headers = self.get_authorization_headers()
-        response = requests.get(uri, headers=headers)
+        response = predix.transport.request('GET', uri, headers=headers)
         return response.json()['resources']
 
     def get_client(self, client_id):
@@ -403,7 +433,7 @@ class UserAccountAuthentication(object):
 
         uri = self.uri + '/oauth/clients/' + client_id
         headers = self.get_authorization_headers()
-        response = requests.get(uri, headers=headers)
+        response = predix.transport.request('GET', uri, headers=headers)
         if response.status_code == 200:
             return response.json()
         else:
@@ -463,10 +493,11 @@ class UserAccountAuthentication(object):
         }
 
         logging.debug("URI=" + str(uri))
-        logging.debug("HEADERS=" + str(headers))
-        logging.debug("BODY=" + json.dumps(changes))
+        if logging.root.isEnabledFor(logging.DEBUG):
+            logging.debug("BODY=" + json.dumps(changes))
 
-        response = requests.put(uri, headers=headers, data=json.dumps(changes))
+        response = predix.transport.request('PUT', uri,
+                headers=headers, data=json.dumps(changes))
 
         logging.debug("STATUS=" + str(response.status_code))
         if response.status_code == 200:
@@ -578,7 +609,8 @@ class UserAccountAuthentication(object):
         if redirect_uri:
             params.append(redirect_uri)
 
-        response = requests.post(uri, headers=headers, data=json.dumps(params))
+        response = predix.transport.request('POST', uri,
+                headers=headers, data=json.dumps(params))
         if response.status_code == 201:
             if manifest:
                 self.add_client_to_manifest(client_id, client_secret, manifest)
@@ -656,9 +688,8 @@ class UserAccountAuthentication(object):
         headers = self._get_headers()
 
         logging.debug("URI=" + str(uri))
-        logging.debug("HEADERS=" + str(headers))
 
-        response = self.session.delete(uri, headers=headers)
+        response = predix.transport.request('DELETE', uri, headers=headers)
         logging.debug("STATUS=" + str(response.status_code))
         if response.status_code == 200:
             return response
@@ -2,9 +2,11 @@
 import os
 import json
 import logging
-import requests
+import warnings
 
 import predix.app
+import predix.transport
+import predix.resilience
 import predix.security.uaa
 
 
@@ -12,19 +14,42 @@ class Service(object):
     """
     General class for making REST calls to Predix multi-tenant
     services that require a Predix-Zone-Id and Bearer token.
+
+    Connections are pooled per host and shared by every service in the
+    process, see predix.transport to configure them.
+
+    Failed requests are retried according to the retry policy, a
+    predix.resilience.RetryPolicy, and fail immediately while a host has
+    been failing, see predix.resilience.configure_breakers().
+
+    The uri of the service is optional and only picks the shared session
+    returned by the deprecated session attribute.
     """
-    def __init__(self, zone, *args, **kwargs):
+    def __init__(self, zone, retry=None, uri=None, *args, **kwargs):
         super(Service, self).__init__(*args, **kwargs)
 
         self.zone = zone
+        self.uri = uri
+        self.retry = retry or predix.resilience.RetryPolicy()
 
         self.uaa = predix.security.uaa.UserAccountAuthentication()
-        self.session = requests.Session()
+
+        # Token the headers were last built for along with the headers
+        self._headers = (None, None)
 
         self._auto_authenticate()
 
-    def __del__(self):
-        self.session.close()
+    @property
+    def session(self):
+        """
+        Deprecated, requests are made through predix.transport which shares
+        a requests.Session for each host.  Returns the shared session for
+        the uri of the service, which should not be closed.
+        """
+        warnings.warn("Service.session is deprecated, use "
+                "predix.transport.get_session() instead.", DeprecationWarning,
+                stacklevel=2)
+        return predix.transport.get_session(self.uri or self.zone)
 
     def _auto_authenticate(self):
         """
@@ -46,14 +71,29 @@ class Service(object):
     def _get_headers(self):
         """
         Standard Predix service headers.
+
+        The headers are only built again when the token changes, each call
+        returns a copy that can be changed.
+        """
+        token = self.uaa.get_token()
+        (cached, headers) = self._headers
+        if token != cached:
+            headers = {
+                'Accept': 'application/json',
+                'Content-Type': 'application/json',
+                'Predix-Zone-Id': self.zone,
+                'Authorization': 'Bearer ' + token
+            }
+            self._headers = (token, headers)
+
+        return dict(headers)
+
+    def _request(self, method, uri, **kwargs):
+        """
+        Make a request with retries and the circuit breaker of the host.
         """
-        headers = {
-            'Accept': 'application/json',
-            'Content-Type': 'application/json',
-            'Predix-Zone-Id': self.zone,
-            'Authorization': self._get_bearer_token()
-        }
-        return headers
+        return predix.resilience.request(method, uri, retry=self.retry,
+                **kwargs)
 
     def _get(self, uri, params=None, headers=None):
         """
@@ -63,9 +103,8 @@ class Service(object):
             headers = self._get_headers()
 
         logging.debug("URI=" + str(uri))
-        logging.debug("HEADERS=" + str(headers))
 
-        response = self.session.get(uri, headers=headers, params=params)
+        response = self._request('GET', uri, headers=headers, params=params)
         logging.debug("STATUS=" + str(response.status_code))
         if response.status_code == 200:
             return response.json()
@@ -73,6 +112,34 @@ class Service(object):
             logging.error(b"ERROR=" + response.content)
             response.raise_for_status()
 
+    def _stream(self, uri, params=None, data=None, chunk_size=64*1024):
+        """
+        GET request for a given path, or POST when given data, that yields
+        the body in chunks as it arrives rather than reading it all into
+        memory first.
+        """
+        headers = self._get_headers()
+
+        logging.debug("URI=" + str(uri))
+
+        if data is None:
+            response = self._request('GET', uri,
+                    headers=headers, params=params, stream=True)
+        else:
+            response = self._request('POST', uri,
+                    headers=headers, data=json.dumps(data), stream=True)
+
+        try:
+            logging.debug("STATUS=" + str(response.status_code))
+            if response.status_code != 200:
+                logging.error(response.content)
+                response.raise_for_status()
+
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                yield chunk
+        finally:
+            response.close()
+
     def _post(self, uri, data):
         """
         Simple POST request for a given path.
@@ -80,10 +147,11 @@ class Service(object):
         headers = self._get_headers()
 
         logging.debug("URI=" + str(uri))
-        logging.debug("BODY=" + json.dumps(data))
+        if logging.root.isEnabledFor(logging.DEBUG):
+            logging.debug("BODY=" + json.dumps(data))
 
-        response = self.session.post(uri, headers=headers,
-                data=json.dumps(data))
+        response = self._request('POST', uri,
+                headers=headers, data=json.dumps(data))
         if response.status_code in [200, 204]:
             try:
                 return response.json()
@@ -100,10 +168,11 @@ class Service(object):
         headers = self._get_headers()
 
         logging.debug("URI=" + str(uri))
-        logging.debug("BODY=" + json.dumps(data))
+        if logging.root.isEnabledFor(logging.DEBUG):
+            logging.debug("BODY=" + json.dumps(data))
 
-        response = self.session.put(uri, headers=headers,
-                data=json.dumps(data))
+        response = self._request('PUT', uri,
+                headers=headers, data=json.dumps(data))
         if response.status_code in [201, 204]:
             return data
         else:
@@ -116,7 +185,7 @@ class Service(object):
         """
         headers = self._get_headers()
 
-        response = self.session.delete(uri, headers=headers)
+        response = self._request('DELETE', uri, headers=headers)
 
         # Will return a 204 on successful delete
         if response.status_code == 204:
@@ -143,8 +212,8 @@ class Service(object):
         ]
         """
         headers = self._get_headers()
-        response = self.session.patch(uri, headers=headers,
-                data=json.dumps(data))
+        response = self._request('PATCH', uri,
+                headers=headers, data=json.dumps(data))
 
         # Will return a 204 on successful patch
         if response.status_code == 204:
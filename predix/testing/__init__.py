@@ -0,0 +1,673 @@
+"""
+An in-process stand-in for the Predix services, so that the clients can be
+exercised and benchmarked without any cloud services.
+
+It replaces the transport used by every client (see predix.transport) and
+emulates the UAA token, Time Series ingest and query, Asset, Access Control
+and Event Hub gRPC endpoints with data kept in memory.
+
+::
+
+    import predix.testing
+    import predix.data.timeseries
+
+    with predix.testing.FakePredix() as fake:
+        ts = predix.data.timeseries.TimeSeries()
+        ts.queue('TEMP', 70.1)
+        ts.send()
+        ts.get_values('TEMP')
+
+"""
+import io
+import os
+import json
+import time
+import threading
+import uuid
+import collections
+
+import six
+import requests
+import requests.structures
+import websocket
+
+import predix.transport
+import predix.data.timeseries.query
+
+
+class FakeWebSocket(object):
+    """
+    Stands in for a websocket.WebSocket, passing every frame sent to a
+    handler and returning the response of the handler from recv() once the
+    latency has passed, so several messages can be in flight at once.
+
+    :param handler: callable given each payload sent returning the frame to
+        be received in reply, or None for no reply
+
+    :param latency: seconds from sending a frame until the reply arrives
+
+    """
+    def __init__(self, handler, latency=0):
+        self.handler = handler
+        self.latency = latency
+        self.connected = True
+
+        self._frames = six.moves.queue.Queue()
+        self._timeout = None
+
+    def settimeout(self, timeout):
+        self._timeout = timeout
+
+    def gettimeout(self):
+        return self._timeout
+
+    def send(self, payload, opcode=None):
+        if not self.connected:
+            raise websocket.WebSocketConnectionClosedException(
+                    "Connection is already closed.")
+
+        frame = self.handler(payload)
+        if frame is not None:
+            self._frames.put((time.time() + self.latency, frame))
+
+    def recv(self):
+        if not self.connected:
+            raise websocket.WebSocketConnectionClosedException(
+                    "Connection is already closed.")
+
+        try:
+            (arrival, frame) = self._frames.get(timeout=self._timeout)
+        except six.moves.queue.Empty:
+            raise websocket.WebSocketTimeoutException(
+                    "Timed out waiting for a frame.")
+
+        delay = arrival - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        return frame
+
+    def ping(self, payload=''):
+        if not self.connected:
+            raise websocket.WebSocketConnectionClosedException(
+                    "Connection is already closed.")
+
+    def close(self, *args, **kwargs):
+        self.connected = False
+
+
+class FakePredix(predix.transport.Transport):
+    """
+    Emulates Predix services in memory, while started every client created
+    is configured through the environment to use it.
+
+    Each service keeps its data in a dictionary that can be inspected or
+    seeded directly:
+
+    - timeseries: tag name to a list of [timestamp, value, quality,
+      attributes] in the order ingested
+    - assets: collection name to a dictionary of uri to the asset
+    - acs: 'resource', 'subject' and 'policy-set' to a dictionary of
+      identifier to the body
+    - eventhub: topic to a list of published messages, see
+      predix.testing.eventhub
+    - eventhub_nacks: message id to how many times publishing it fails
+      before it is accepted
+
+    Queries return raw datapoints, aggregations are not applied.
+
+    :param latency: seconds added to every request and websocket message,
+        to approximate a round trip to the service
+
+    :param expires_in: seconds the UAA tokens issued are valid for
+
+    """
+    UAA_URI = 'https://uaa.predix.test'
+    QUERY_URI = 'https://time-series-query.predix.test'
+    INGEST_URI = 'wss://time-series-ingest.predix.test/v1/stream/messages'
+    ASSET_URI = 'https://asset.predix.test'
+    ACS_URI = 'https://acs.predix.test'
+    EVENTHUB_HOST = 'event-hub.predix.test'
+    EVENTHUB_PORT = '443'
+    ZONE_ID = 'fake-zone'
+
+    CLIENT_ID = 'fake-client'
+    CLIENT_SECRET = 'fake-secret'
+
+    def __init__(self, latency=0, expires_in=43199):
+        self.latency = latency
+        self.expires_in = expires_in
+
+        self.timeseries = collections.OrderedDict()
+        self.assets = collections.OrderedDict()
+        self.acs = {'resource': {}, 'subject': {}, 'policy-set': {}}
+        self.eventhub = collections.OrderedDict()
+        self.eventhub_nacks = {}
+
+        self._lock = threading.Lock()
+
+        self._routes = {
+            predix.transport.get_host(self.UAA_URI): self._uaa,
+            predix.transport.get_host(self.QUERY_URI): self._query,
+            predix.transport.get_host(self.ASSET_URI): self._asset,
+            predix.transport.get_host(self.ACS_URI): self._acs,
+            }
+
+        self._environ = None
+        self._previous = None
+        self._server = None
+
+    def get_environ(self):
+        """
+        Returns the environment variables that point clients at the fake
+        services.
+        """
+        return {
+            'PREDIX_APP_CLIENT_ID': self.CLIENT_ID,
+            'PREDIX_APP_CLIENT_SECRET': self.CLIENT_SECRET,
+            'PREDIX_SECURITY_UAA_URI': self.UAA_URI,
+            'PREDIX_DATA_TIMESERIES_QUERY_URI': self.QUERY_URI,
+            'PREDIX_DATA_TIMESERIES_QUERY_ZONE_ID': self.ZONE_ID,
+            'PREDIX_DATA_TIMESERIES_INGEST_URI': self.INGEST_URI,
+            'PREDIX_DATA_TIMESERIES_INGEST_ZONE_ID': self.ZONE_ID,
+            'PREDIX_DATA_ASSET_URI': self.ASSET_URI,
+            'PREDIX_DATA_ASSET_ZONE_ID': self.ZONE_ID,
+            'PREDIX_SECURITY_ACS_URI': self.ACS_URI,
+            'PREDIX_SECURITY_ACS_ZONE_ID': self.ZONE_ID,
+            'PREDIX_DATA_EVENTHUB_CLIENT_HOST': self.EVENTHUB_HOST,
+            'PREDIX_DATA_EVENTHUB_CLIENT_PORT': self.EVENTHUB_PORT,
+            'PREDIX_DATA_EVENTHUB_CLIENT_ZONE_ID': self.ZONE_ID,
+            }
+
+    def start(self):
+        """
+        Configure the environment and transport so that clients created
+        from now on use the fake services.
+        """
+        if self._environ is not None:
+            return self
+
+        environ = self.get_environ()
+        self._environ = dict([(key, os.environ.get(key))
+            for key in list(environ.keys()) + ['VCAP_SERVICES']])
+        os.environ.update(environ)
+
+        # Service bindings take precedence over the environment variables
+        os.environ.pop('VCAP_SERVICES', None)
+
+        self._previous = predix.transport.set_transport(self)
+        return self
+
+    def stop(self):
+        """
+        Restore the environment and transport, and stop the Event Hub
+        server when it was started.
+        """
+        if self._environ is None:
+            return
+
+        for (key, value) in self._environ.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        self._environ = None
+
+        predix.transport.set_transport(self._previous)
+        self._previous = None
+
+        if self._server is not None:
+            self._server.stop()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def request(self, method, uri, params=None, data=None, headers=None,
+            json=None, **kwargs):
+        """
+        Handle an HTTP request with the fake service for the host of the
+        uri, returning a requests.Response.
+        """
+        if self.latency:
+            time.sleep(self.latency)
+
+        return self._respond(method, uri, params=params, data=data,
+                headers=headers, json=json)
+
+    def _respond(self, method, uri, params=None, data=None, headers=None,
+            json=None):
+        """
+        Returns the requests.Response of the fake service for the host of
+        the uri, without any latency.
+        """
+        parts = six.moves.urllib.parse.urlparse(uri)
+        query = dict(six.moves.urllib.parse.parse_qsl(parts.query))
+        query.update(params or {})
+
+        if json is not None:
+            body = json
+        elif data:
+            body = _loads(data)
+        else:
+            body = None
+
+        handler = self._routes.get(predix.transport.get_host(uri))
+        if handler is None:
+            (status, payload) = (404, {'error': 'No such host %s' % (uri)})
+        elif handler != self._uaa and \
+                not self._is_authorized(headers or {}):
+            (status, payload) = (401, {'error': 'unauthorized'})
+        else:
+            path = '/' + '/'.join([part for part in parts.path.split('/')
+                if part])
+            (status, payload) = handler(method.upper(), path, query, body)
+
+        return self._get_response(uri, status, payload)
+
+    def _get_response(self, uri, status, payload):
+        response = requests.models.Response()
+        response.url = uri
+        response.status_code = status
+        response.headers = requests.structures.CaseInsensitiveDict()
+        response.encoding = 'utf-8'
+
+        if payload is None:
+            content = b''
+        elif isinstance(payload, six.binary_type):
+            content = payload
+        elif isinstance(payload, six.text_type):
+            content = payload.encode('utf-8')
+        else:
+            content = _dumps(payload).encode('utf-8')
+            response.headers['Content-Type'] = 'application/json'
+
+        response.headers['Content-Length'] = str(len(content))
+        response._content = content
+        response._content_consumed = True
+        response.raw = io.BytesIO(content)
+        return response
+
+    def _is_authorized(self, headers):
+        token = headers.get('Authorization') or \
+                headers.get('authorization') or ''
+        return self.is_token(token.split(' ')[-1])
+
+    def create_websocket(self, uri, header=None):
+        """
+        Returns a fake websocket to the Time Series ingest endpoint.
+        """
+        headers = header or {}
+        if isinstance(headers, list):
+            headers = dict([h.split(': ', 1) for h in headers])
+
+        status = self._get_ingest_status(uri, headers)
+        if status == 404:
+            raise websocket.WebSocketBadStatusException(
+                    "Handshake status 404 Not Found", 404)
+        elif status == 401:
+            raise websocket.WebSocketBadStatusException(
+                    "Handshake status 401 Unauthorized", 401)
+
+        return FakeWebSocket(self._ingest, latency=self.latency)
+
+    def _get_ingest_status(self, uri, headers):
+        """
+        Returns the status of the handshake of an ingest websocket to the
+        uri with the headers.
+        """
+        if predix.transport.get_host(uri) != \
+                predix.transport.get_host(self.INGEST_URI):
+            return 404
+
+        if not self._is_authorized(headers):
+            return 401
+
+        return 101
+
+    def create_aiohttp_session(self):
+        """
+        Returns a session making requests and opening ingest websockets to
+        the fake services from asyncio.
+        """
+        import predix.testing.aio
+        return predix.testing.aio.FakeClientSession(self)
+
+    def create_grpc_channel(self, target, credentials=None):
+        """
+        Returns a channel to a local server emulating Event Hub.
+        """
+        import grpc
+
+        if target != '%s:%s' % (self.EVENTHUB_HOST, self.EVENTHUB_PORT):
+            return super(FakePredix, self).create_grpc_channel(target,
+                    credentials=credentials)
+
+        return grpc.insecure_channel(self._get_eventhub_target())
+
+    def create_grpc_aio_channel(self, target, credentials=None):
+        """
+        Returns an asyncio channel to a local server emulating Event Hub.
+        """
+        import grpc.aio
+
+        if target != '%s:%s' % (self.EVENTHUB_HOST, self.EVENTHUB_PORT):
+            return super(FakePredix, self).create_grpc_aio_channel(target,
+                    credentials=credentials)
+
+        return grpc.aio.insecure_channel(self._get_eventhub_target())
+
+    def _get_eventhub_target(self):
+        """
+        Returns the address of the local Event Hub server, starting it on
+        first use.
+        """
+        with self._lock:
+            if self._server is None:
+                import predix.testing.eventhub
+                self._server = predix.testing.eventhub.FakeEventHub(self)
+                self._server.start()
+
+        return 'localhost:%s' % (self._server.port)
+
+    def issue_token(self):
+        """
+        Returns a new bearer token the fake services will accept.
+        """
+        return 'fake-token-%s' % (uuid.uuid4())
+
+    def is_token(self, token):
+        """
+        Whether the token was issued by a fake UAA, including one cached
+        by an earlier run.
+        """
+        return token.startswith('fake-token-')
+
+    def _uaa(self, method, path, query, body):
+        if path != '/oauth/token' or method != 'POST':
+            return (404, {'error': 'not_found'})
+
+        return (200, {
+            'access_token': self.issue_token(),
+            'token_type': 'bearer',
+            'expires_in': self.expires_in,
+            'scope': 'timeseries.zones.%s.query timeseries.zones.%s.ingest'
+                % (self.ZONE_ID, self.ZONE_ID),
+            'jti': 'fake',
+            })
+
+    def _ingest(self, payload):
+        """
+        Store the datapoints of an ingest message and return its ack.
+        """
+        try:
+            message = _loads(payload)
+            body = message['body']
+            message_id = message.get('messageId')
+        except (TypeError, ValueError, KeyError):
+            return _dumps({'statusCode': 400})
+
+        with self._lock:
+            for tag in body:
+                points = self.timeseries.setdefault(tag['name'], [])
+                attributes = tag.get('attributes') or {}
+                for point in tag.get('datapoints', []):
+                    quality = point[2] if len(point) > 2 else 3
+                    points.append([point[0], point[1], quality, attributes])
+
+        return _dumps({'messageId': message_id, 'statusCode': 202})
+
+    def _query(self, method, path, query, body):
+        if path == '/v1/tags':
+            return (200, {'results': sorted(self.timeseries.keys())})
+
+        if path == '/v1/aggregations':
+            return (200, {'results': [{'name': name, 'type': name}
+                for name in ['avg', 'count', 'max', 'min', 'sum']]})
+
+        if path == '/v1/datapoints':
+            if method == 'GET':
+                body = _loads(query.get('query', '{}'))
+            return (200, self._get_datapoints(body or {}))
+
+        if path == '/v1/datapoints/latest':
+            if method == 'GET':
+                body = query
+            return (200, self._get_latest(body or {}))
+
+        return (404, {'error': 'not_found'})
+
+    def _get_time(self, value, now, default):
+        """
+        Returns epoch milliseconds of an absolute or relative (1w-ago) time.
+        """
+        if value is None:
+            return default
+        if isinstance(value, six.integer_types):
+            return value
+
+        value = str(value)
+        if value.isdigit():
+            return int(value)
+
+        if value.endswith('-ago'):
+            # Units of relative times for queries, such as 15mi-ago
+            for (unit, millis) in predix.data.timeseries.query.UNITS.items():
+                count = value[:-len(unit + '-ago')]
+                if value.endswith(unit + '-ago') and count.isdigit():
+                    return now - int(count) * millis
+
+        return default
+
+    def _is_match(self, point, filters):
+        """
+        Whether the datapoint passes the qualities, attributes and
+        measurement filters of a query.
+        """
+        qualities = filters.get('qualities', {}).get('values')
+        if qualities is not None and str(point[2]) not in \
+                [str(q) for q in qualities]:
+            return False
+
+        for (key, value) in filters.get('attributes', {}).items():
+            values = value if isinstance(value, list) else [value]
+            if point[3].get(key) not in values:
+                return False
+
+        measurement = filters.get('measurements')
+        if measurement:
+            target = float(measurement['values'])
+            value = float(point[1])
+            condition = measurement['condition']
+            if not {'eq': value == target, 'ne': value != target,
+                    'gt': value > target, 'ge': value >= target,
+                    'lt': value < target, 'le': value <= target}[condition]:
+                return False
+
+        return True
+
+    def _get_datapoints(self, body):
+        now = int(time.time() * 1000)
+        start = self._get_time(body.get('start'), now, 0)
+        end = self._get_time(body.get('end'), now, now)
+
+        tags = []
+        for tag in body.get('tags', []):
+            with self._lock:
+                points = list(self.timeseries.get(tag['name'], []))
+
+            filters = tag.get('filters', {})
+            points = [point for point in points if start <= point[0] <= end
+                    and self._is_match(point, filters)]
+            points.sort(key=lambda point: point[0],
+                    reverse=tag.get('order') == 'desc')
+            if tag.get('limit'):
+                points = points[:int(tag['limit'])]
+
+            attributes = {}
+            for point in points:
+                for (key, value) in point[3].items():
+                    attributes.setdefault(key, [])
+                    if value not in attributes[key]:
+                        attributes[key].append(value)
+
+            tags.append({
+                'name': tag['name'],
+                'results': [{
+                    'groups': [{'name': 'type', 'type': 'number'}],
+                    'attributes': attributes,
+                    'values': [point[:3] for point in points],
+                    }],
+                'stats': {'rawCount': len(points)},
+                })
+
+        return {'start': start, 'end': end, 'tags': tags}
+
+    def _get_latest(self, body):
+        names = body.get('tags', [])
+        if isinstance(names, six.string_types):
+            names = names.split(',')
+
+        tags = []
+        for name in names:
+            if isinstance(name, dict):
+                name = name['name']
+
+            with self._lock:
+                points = self.timeseries.get(name, [])
+                values = [max(points, key=lambda p: p[0])[:3]] \
+                        if points else []
+
+            tags.append({
+                'name': name,
+                'results': [{
+                    'groups': [{'name': 'type', 'type': 'number'}],
+                    'attributes': {},
+                    'values': values,
+                    }],
+                'stats': {'rawCount': len(values)},
+                })
+
+        return {'tags': tags}
+
+    def _asset(self, method, path, query, body):
+        # Collections are addressed both with and without the version
+        if path.startswith('/v1/'):
+            path = path[3:]
+
+        if path == '/':
+            return (200, [{'collection': name, 'count': len(assets)}
+                for (name, assets) in self.assets.items()])
+
+        if path.startswith('/system/'):
+            return (200, [])
+
+        parts = path.strip('/').split('/')
+        with self._lock:
+            if method in ['POST', 'PUT']:
+                assets = self.assets.setdefault(parts[0],
+                        collections.OrderedDict())
+            else:
+                assets = self.assets.get(parts[0], {})
+
+            if len(parts) == 1:
+                if method == 'GET':
+                    return (200, list(assets.values()))
+                if method in ['POST', 'PUT']:
+                    if isinstance(body, dict):
+                        body = [body]
+                    for asset in body or []:
+                        assets[asset['uri']] = asset
+                    return (204, None)
+                if method == 'DELETE':
+                    self.assets.pop(parts[0], None)
+                    return (204, None)
+
+            uri = path
+            if method == 'GET':
+                if uri not in assets:
+                    return (404, {'error': 'not_found'})
+                return (200, [assets[uri]])
+            if method in ['POST', 'PUT']:
+                assets[uri] = body
+                return (204, None)
+            if method == 'DELETE':
+                assets.pop(uri, None)
+                return (204, None)
+            if method == 'PATCH':
+                if uri not in assets:
+                    return (404, {'error': 'not_found'})
+                for change in body:
+                    key = change['path'].strip('/')
+                    if change['op'] in ['add', 'replace']:
+                        assets[uri][key] = change['value']
+                    elif change['op'] == 'remove':
+                        assets[uri].pop(key, None)
+                return (204, None)
+
+        return (405, {'error': 'method_not_allowed'})
+
+    def _acs(self, method, path, query, body):
+        if path == '/monitoring/heartbeat':
+            return (200, 'alive')
+
+        if path == '/v1/policy-evaluation':
+            return (200, {'effect': self._evaluate(body)})
+
+        parts = [six.moves.urllib.parse.unquote_plus(part)
+                for part in path.strip('/').split('/')[1:]]
+        if not parts or parts[0] not in self.acs:
+            return (404, {'error': 'not_found'})
+
+        kind = parts[0]
+        key = {'resource': 'resourceIdentifier',
+                'subject': 'subjectIdentifier',
+                'policy-set': 'name'}[kind]
+        items = self.acs[kind]
+
+        with self._lock:
+            if len(parts) == 1:
+                if method == 'GET':
+                    return (200, list(items.values()))
+                if method == 'POST':
+                    for item in body or []:
+                        items[item[key]] = item
+                    return (204, None)
+            else:
+                identifier = '/'.join(parts[1:])
+                if method == 'GET':
+                    if identifier not in items:
+                        return (404, {'error': 'not_found'})
+                    return (200, items[identifier])
+                if method == 'PUT':
+                    items[identifier] = body
+                    return (201, None)
+                if method == 'DELETE':
+                    items.pop(identifier, None)
+                    return (204, None)
+
+        return (405, {'error': 'method_not_allowed'})
+
+    def _evaluate(self, body):
+        """
+        Returns the effect of the first policy whose action matches.
+        """
+        for policy_set in self.acs['policy-set'].values():
+            for policy in policy_set.get('policies', []):
+                actions = policy.get('target', {}).get('action', '')
+                if body['action'] in actions.split(','):
+                    return policy.get('effect', 'PERMIT')
+
+        return 'NOT_APPLICABLE'
+
+
+def _dumps(value):
+    return json.dumps(value)
+
+
+def _loads(value):
+    if isinstance(value, six.binary_type):
+        value = value.decode('utf-8')
+    return json.loads(value)
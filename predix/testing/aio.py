@@ -0,0 +1,119 @@
+"""
+Stand-ins for the aiohttp session and websocket so the asyncio clients
+reach the fake services of predix.testing.FakePredix too.
+"""
+import asyncio
+
+import yarl
+import aiohttp
+import multidict
+
+
+class FakeClientResponse(object):
+    """
+    A response that has already been read, used as the async context
+    manager aiohttp.ClientSession.request() returns.
+    """
+    def __init__(self, response):
+        self.status = response.status_code
+        self.reason = response.reason
+        self.headers = response.headers
+        self._content = response.content
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        pass
+
+    async def read(self):
+        return self._content
+
+
+class FakeClientWebSocket(object):
+    """
+    An ingest websocket that passes each message to the handler and
+    delivers any frame it returns after the latency.
+    """
+    def __init__(self, handler, latency=0):
+        self.handler = handler
+        self.latency = latency
+        self.closed = False
+        self._frames = asyncio.Queue()
+
+    async def send_str(self, data):
+        if self.closed:
+            raise ConnectionResetError("Cannot write to closing transport")
+
+        frame = self.handler(data)
+        if frame is not None:
+            asyncio.get_event_loop().call_later(self.latency,
+                    self._frames.put_nowait, frame)
+
+    async def close(self):
+        if not self.closed:
+            self.closed = True
+            self._frames.put_nowait(None)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        frame = await self._frames.get()
+        if frame is None:
+            raise StopAsyncIteration
+        return aiohttp.WSMessage(aiohttp.WSMsgType.TEXT, frame, None)
+
+
+class FakeClientSession(object):
+    """
+    Makes the requests and opens the websockets of an aiohttp session with
+    the fake services.
+
+    :param backend: the predix.testing.FakePredix to use
+
+    """
+    def __init__(self, backend):
+        self.backend = backend
+        self.closed = False
+
+    def request(self, method, uri, params=None, data=None, headers=None,
+            **kwargs):
+        return _FakeRequest(self.backend, method, uri, params=params,
+                data=data, headers=headers)
+
+    async def ws_connect(self, uri, headers=None, **kwargs):
+        await asyncio.sleep(self.backend.latency)
+
+        status = self.backend._get_ingest_status(uri, headers or {})
+        if status != 101:
+            url = yarl.URL(uri)
+            info = aiohttp.RequestInfo(url, 'GET',
+                    multidict.CIMultiDictProxy(multidict.CIMultiDict()), url)
+            raise aiohttp.WSServerHandshakeError(info, (), status=status,
+                    message="Invalid response status")
+
+        return FakeClientWebSocket(self.backend._ingest,
+                latency=self.backend.latency)
+
+    async def close(self):
+        self.closed = True
+
+
+class _FakeRequest(object):
+    """
+    Makes the request when entered, after the latency of the backend.
+    """
+    def __init__(self, backend, method, uri, **kwargs):
+        self.backend = backend
+        self.method = method
+        self.uri = uri
+        self.kwargs = kwargs
+
+    async def __aenter__(self):
+        await asyncio.sleep(self.backend.latency)
+        return FakeClientResponse(self.backend._respond(self.method,
+            self.uri, **self.kwargs))
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        pass
@@ -0,0 +1,192 @@
+"""
+A local gRPC server emulating the Event Hub publish, subscribe and health
+endpoints for predix.testing.FakePredix.
+"""
+import time
+import threading
+import concurrent.futures
+
+import grpc
+
+from predix.data.eventhub import EventHub_pb2, EventHub_pb2_grpc
+from predix.data.eventhub import Health_pb2, Health_pb2_grpc
+
+
+class FakeEventHub(EventHub_pb2_grpc.PublisherServicer,
+        EventHub_pb2_grpc.SubscriberServicer, Health_pb2_grpc.HealthServicer):
+    """
+    Accepts published messages into the eventhub dictionary of the backend,
+    topic to list of messages, and streams them to subscribers.
+
+    :param backend: the predix.testing.FakePredix the server is part of
+
+    :param max_workers: threads serving calls, each open stream holds one
+
+    """
+    def __init__(self, backend, max_workers=16):
+        self.backend = backend
+        self.max_workers = max_workers
+        self.port = None
+
+        self._server = None
+        self._published = threading.Condition()
+
+    def start(self):
+        self._server = grpc.server(concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.max_workers))
+        EventHub_pb2_grpc.add_PublisherServicer_to_server(self, self._server)
+        EventHub_pb2_grpc.add_SubscriberServicer_to_server(self, self._server)
+        Health_pb2_grpc.add_HealthServicer_to_server(self, self._server)
+
+        self.port = self._server.add_insecure_port('localhost:0')
+        self._server.start()
+
+    def stop(self, grace=None):
+        if self._server is not None:
+            self._server.stop(grace)
+            self._server = None
+
+        # Let subscribers waiting on messages see the server stopped
+        with self._published:
+            self._published.notify_all()
+
+    def _get_metadata(self, context):
+        """
+        Returns the metadata of the call as a dict of lists, checking the
+        token and falling back to the default topic of the zone.
+        """
+        metadata = {}
+        for (key, value) in context.invocation_metadata():
+            metadata.setdefault(key, []).append(value)
+
+        token = metadata.get('authorization', [''])[0]
+        if not self.backend.is_token(token.split(' ')[-1]):
+            context.abort(grpc.StatusCode.UNAUTHENTICATED, 'invalid token')
+
+        zone_id = metadata.get('predix-zone-id', [self.backend.ZONE_ID])[0]
+        metadata.setdefault('topic', [zone_id + '_topic'])
+        return metadata
+
+    def _publish(self, topic, messages):
+        """
+        Store the messages returning an ack for each, failing those the
+        backend has been told to fail.
+        """
+        acks = []
+        with self._published:
+            stored = self.backend.eventhub.setdefault(topic, [])
+            for message in messages:
+                if self.backend.eventhub_nacks.get(message.id, 0) > 0:
+                    self.backend.eventhub_nacks[message.id] -= 1
+                    acks.append(EventHub_pb2.Ack(id=message.id,
+                        status_code=EventHub_pb2.FAILED,
+                        desc='injected failure', body=message.body,
+                        zone_id=message.zone_id, tags=message.tags))
+                    continue
+
+                stored.append(EventHub_pb2.Message(id=message.id,
+                    body=message.body, zone_id=message.zone_id,
+                    tags=message.tags, key=message.key, topic=topic,
+                    partition=0, offset=len(stored)))
+                acks.append(EventHub_pb2.Ack(id=message.id,
+                    status_code=EventHub_pb2.ACCEPTED, topic=topic,
+                    partition=0, offset=len(stored) - 1))
+            self._published.notify_all()
+
+        return acks
+
+    def send(self, request_iterator, context):
+        metadata = self._get_metadata(context)
+        topic = metadata['topic'][0]
+
+        # Asynchronous publishers can ask for only failures or no acks
+        sync = metadata.get('sync-acks', ['true'])[0] == 'true'
+        acks_enabled = sync or metadata.get('acks', ['true'])[0] == 'true'
+        nacks_enabled = acks_enabled or \
+                metadata.get('nacks', ['true'])[0] == 'true'
+
+        for request in request_iterator:
+            acks = self._publish(topic, request.messages.msg)
+            if self.backend.latency:
+                time.sleep(self.backend.latency)
+
+            acks = [ack for ack in acks if nacks_enabled and
+                    (acks_enabled or ack.status_code != EventHub_pb2.ACCEPTED)]
+            if acks:
+                yield EventHub_pb2.PublishResponse(ack=acks)
+
+    def _get_offsets(self, metadata):
+        newest = metadata.get('offset-newest', ['false'])[0] == 'true'
+        with self._published:
+            return dict([(topic, len(self.backend.eventhub.get(topic, []))
+                if newest else 0) for topic in metadata['topic']])
+
+    def _take_messages(self, context, offsets, limit=None):
+        """
+        Block until there are messages past the offsets of the topics,
+        returning them and moving the offsets along.
+        """
+        with self._published:
+            while context.is_active() and self._server is not None:
+                messages = []
+                for (topic, offset) in offsets.items():
+                    stored = self.backend.eventhub.get(topic, [])
+                    messages.extend(stored[offset:])
+                    offsets[topic] = len(stored)
+
+                if limit is not None and len(messages) > limit:
+                    for message in messages[limit:]:
+                        offsets[message.topic] = min(offsets[message.topic],
+                                message.offset)
+                    messages = messages[:limit]
+
+                if messages:
+                    return messages
+
+                self._published.wait(1)
+
+        return []
+
+    def _drain(self, request_iterator):
+        """
+        Read the acks sent by a subscriber, which are not tracked.
+        """
+        def drain():
+            try:
+                for request in request_iterator:
+                    pass
+            except grpc.RpcError:
+                # The subscriber went away
+                pass
+
+        thread = threading.Thread(target=drain)
+        thread.daemon = True
+        thread.start()
+
+    def receive(self, request, context):
+        offsets = self._get_offsets(self._get_metadata(context))
+        while context.is_active():
+            for message in self._take_messages(context, offsets):
+                yield message
+
+    def receiveWithAcks(self, request_iterator, context):
+        offsets = self._get_offsets(self._get_metadata(context))
+        self._drain(request_iterator)
+        while context.is_active():
+            for message in self._take_messages(context, offsets):
+                yield message
+
+    def subscribe(self, request_iterator, context):
+        metadata = self._get_metadata(context)
+        offsets = self._get_offsets(metadata)
+        batch_size = int(metadata.get('batch-size', ['100'])[0])
+        self._drain(request_iterator)
+        while context.is_active():
+            messages = self._take_messages(context, offsets, limit=batch_size)
+            if messages:
+                yield EventHub_pb2.SubscriptionMessage(
+                        messages=EventHub_pb2.Messages(msg=messages))
+
+    def Check(self, request, context):
+        return Health_pb2.HealthCheckResponse(
+                status=Health_pb2.HealthCheckResponse.SERVING)
@@ -0,0 +1,285 @@
+"""
+Process-wide HTTP sessions shared by all of the Predix service clients so
+that connections, and their TLS handshakes, are pooled per host rather than
+per client instance.
+
+::
+
+    import predix.transport
+
+    # Before creating clients, size pools for 64 threads
+    predix.transport.configure(pool_maxsize=64, timeout=(5, 30))
+
+    # Or only for a single host
+    predix.transport.configure(host='https://time-series-store.example.com',
+            pool_maxsize=128)
+
+Every HTTP request, ingest websocket, Event Hub gRPC channel and asyncio
+session is made through the current transport, which can be swapped for
+another such as the in-process backend of predix.testing.
+
+"""
+import logging
+import threading
+
+import six
+import requests
+import requests.adapters
+
+import predix.metrics
+
+
+def get_host(uri):
+    """
+    Returns the scheme and host of a uri that sessions are shared by.
+    """
+    parts = six.moves.urllib.parse.urlparse(uri)
+    if not parts.netloc:
+        return uri.lower()
+
+    return '%s://%s' % (parts.scheme.lower(), parts.netloc.lower())
+
+
+class Transport(object):
+    """
+    How clients reach Predix services.  Subclasses implement request() and
+    can override how websockets and gRPC channels are opened.
+    """
+    def request(self, method, uri, **kwargs):
+        """
+        Make an HTTP request returning a requests.Response.
+        """
+        raise NotImplementedError()
+
+    def create_websocket(self, uri, header=None):
+        """
+        Returns a connected websocket.WebSocket to the uri.
+        """
+        import websocket
+        return websocket.create_connection(uri, header=header)
+
+    def create_grpc_channel(self, target, credentials=None):
+        """
+        Returns a grpc.Channel to the host:port target, secure when given
+        credentials.
+        """
+        import grpc
+        if credentials is None:
+            return grpc.insecure_channel(target)
+        return grpc.secure_channel(target, credentials)
+
+    def create_grpc_aio_channel(self, target, credentials=None):
+        """
+        Returns a grpc.aio.Channel to the host:port target for asyncio,
+        secure when given credentials.
+        """
+        import grpc.aio
+        if credentials is None:
+            return grpc.aio.insecure_channel(target)
+        return grpc.aio.secure_channel(target, credentials)
+
+    def create_aiohttp_session(self):
+        """
+        Returns an aiohttp.ClientSession for asyncio clients to make
+        requests and open websockets with.  It is bound to the running
+        event loop so each client creates its own.
+        """
+        import aiohttp
+        return aiohttp.ClientSession()
+
+    def close(self):
+        pass
+
+
+class TransportRegistry(Transport):
+    """
+    Keeps a requests.Session for each host configured with the size of its
+    connection pool, keep-alive, and timeouts.
+
+    :param pool_connections: number of connection pools each session caches,
+        one per host it is used with
+
+    :param pool_maxsize: connections kept open to a host, which should be
+        at least the number of threads making requests at the same time
+
+    :param pool_block: whether to wait for a connection when all of them are
+        in use rather than opening one that won't be kept
+
+    :param keep_alive: whether connections are kept open between requests
+
+    :param timeout: seconds to wait on connecting and then on reading, either
+        as a single value for both or a (connect, read) tuple
+
+    """
+    def __init__(self, pool_connections=10, pool_maxsize=10,
+            pool_block=False, keep_alive=True, timeout=(10, 60)):
+        self.defaults = {
+            'pool_connections': pool_connections,
+            'pool_maxsize': pool_maxsize,
+            'pool_block': pool_block,
+            'keep_alive': keep_alive,
+            'timeout': timeout,
+            }
+
+        self._hosts = {}
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def configure(self, host=None, **settings):
+        """
+        Change the settings for all hosts, or only the given host.  Sessions
+        already created are replaced with the new settings when next used.
+        """
+        unknown = set(settings.keys()) - set(self.defaults.keys())
+        if unknown:
+            raise ValueError("Unknown transport settings %s." %
+                    (', '.join(sorted(unknown))))
+
+        with self._lock:
+            if host:
+                host = get_host(host)
+                self._hosts.setdefault(host, {}).update(settings)
+                stale = [host]
+            else:
+                self.defaults.update(settings)
+                stale = list(self._sessions.keys())
+
+            for name in stale:
+                session = self._sessions.pop(name, None)
+                if session is not None:
+                    session.close()
+
+    def get_settings(self, uri):
+        """
+        Returns the settings used for the host of the uri.
+        """
+        settings = dict(self.defaults)
+        settings.update(self._hosts.get(get_host(uri), {}))
+        return settings
+
+    def get_session(self, uri):
+        """
+        Returns the session shared by everything making requests to the host
+        of the uri.
+        """
+        host = get_host(uri)
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = self._create_session(self.get_settings(uri))
+                self._sessions[host] = session
+
+        return session
+
+    def _create_session(self, settings):
+        logging.debug("SESSION=" + str(settings))
+
+        adapter = requests.adapters.HTTPAdapter(
+                pool_connections=settings['pool_connections'],
+                pool_maxsize=settings['pool_maxsize'],
+                pool_block=settings['pool_block'])
+
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        if not settings['keep_alive']:
+            session.headers['Connection'] = 'close'
+
+        return session
+
+    def request(self, method, uri, **kwargs):
+        """
+        Make a request with the shared session of the host, using the
+        configured timeout unless one is given.
+        """
+        if 'timeout' not in kwargs:
+            kwargs['timeout'] = self.get_settings(uri)['timeout']
+
+        return self.get_session(uri).request(method, uri, **kwargs)
+
+    def close(self):
+        """
+        Close every session and the connections they hold.
+        """
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+
+# The registry shared by every client in the process
+registry = TransportRegistry()
+
+# The transport every client uses, the registry unless replaced
+_transport = registry
+
+
+def set_transport(transport=None):
+    """
+    Replace the transport used by every client, or go back to the shared
+    registry when given None.  Returns the transport that was replaced.
+    """
+    global _transport
+    previous = _transport
+    _transport = transport or registry
+    return previous
+
+
+def get_transport():
+    """
+    Returns the transport used by every client.
+    """
+    return _transport
+
+
+def configure(host=None, **settings):
+    """
+    Change the settings of the shared registry, see
+    TransportRegistry.configure().
+    """
+    registry.configure(host=host, **settings)
+
+
+def get_session(uri):
+    """
+    Returns the shared session for the host of the uri.
+    """
+    return registry.get_session(uri)
+
+
+def request(method, uri, **kwargs):
+    """
+    Make a request with the current transport, by default the shared
+    session for the host of the uri, recording it in predix.metrics.
+    """
+    return predix.metrics.registry.track(_transport.request, method, uri,
+            **kwargs)
+
+
+def create_websocket(uri, header=None):
+    """
+    Open a websocket to the uri with the current transport.
+    """
+    return _transport.create_websocket(uri, header=header)
+
+
+def create_grpc_channel(target, credentials=None):
+    """
+    Open a gRPC channel to the target with the current transport.
+    """
+    return _transport.create_grpc_channel(target, credentials=credentials)
+
+
+def create_grpc_aio_channel(target, credentials=None):
+    """
+    Open a gRPC channel for asyncio to the target with the current transport.
+    """
+    return _transport.create_grpc_aio_channel(target, credentials=credentials)
+
+
+def create_aiohttp_session():
+    """
+    Create an aiohttp session for asyncio clients with the current
+    transport.
+    """
+    return _transport.create_aiohttp_session()
@@ -13,7 +13,8 @@ install_requires = [
         "future",
         "psycopg2",
         "websocket",
-        "websocket-client"
+        "websocket-client",
+        "futures; python_version < '3.0'"
     ]
 
 setup_requires = [
@@ -27,6 +28,19 @@ docs_require = [
         "recommonmark",
     ]
 
+extras_require = {
+        # asyncio clients, grpc.aio first shipped in grpcio 1.32
+        'aio': [
+            "aiohttp; python_version >= '3.6'",
+            "grpcio>=1.32",
+            ],
+        # query results as arrays and data frames
+        'arrays': [
+            "numpy",
+            "pandas",
+            ],
+    }
+
 tests_require = [
     #    "mock",    # only for Python < 3.3
     ]
@@ -44,6 +58,7 @@ setup(
         long_description=long_description,
         setup_requires=setup_requires,
         install_requires=install_requires,
+        extras_require=extras_require,
         package_data={
             '': ['*.md', '*.rst'],
             },
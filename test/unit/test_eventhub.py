@@ -0,0 +1,413 @@
+import os
+import time
+import logging
+import threading
+import unittest
+
+import six
+
+import predix.testing
+from predix.data.eventhub.buffer import AdaptiveBatchSize, BoundedQueue
+
+
+class TestEventhub(unittest.TestCase):
+    def setUp(self):
+        self.fake = predix.testing.FakePredix()
+        self.fake.start()
+        self.addCleanup(self.fake.stop)
+
+    def get_eventhub(self, **kwargs):
+        import predix.data.eventhub.client
+        from predix.data.eventhub.publisher import PublisherConfig
+        from predix.data.eventhub.subscriber import SubscribeConfig
+
+        eventhub = predix.data.eventhub.client.Eventhub(
+                publish_config=PublisherConfig(**kwargs),
+                subscribe_config=SubscribeConfig())
+        self.addCleanup(eventhub.shutdown)
+        return eventhub
+
+    def test_publish_sync(self):
+        eventhub = self.get_eventhub(publish_type='SYNC', sync_timeout=10)
+
+        start = time.time()
+        eventhub.publisher.add_message('1', b'hello')
+        acks = eventhub.publisher.publish_queue()
+
+        self.assertLess(time.time() - start, 5)
+        self.assertEqual(len(acks), 1)
+        self.assertEqual(len(self.fake.eventhub['fake-zone_topic']), 1)
+
+    def test_generators_wake(self):
+        eventhub = self.get_eventhub(async_auto_send=True,
+                async_auto_send_amount=1)
+
+        received = []
+        done = threading.Event()
+
+        def consume():
+            for message in eventhub.subscriber.subscribe():
+                received.append(message)
+                done.set()
+
+        thread = threading.Thread(target=consume)
+        thread.daemon = True
+        thread.start()
+
+        eventhub.publisher.add_message('1', b'hello')
+        self.assertTrue(done.wait(5))
+        self.assertEqual(received[0].body, b'hello')
+
+        acks = eventhub.publisher.ack_generator()
+        self.assertEqual(next(acks).id, '1')
+
+        eventhub.subscriber.shutdown()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+
+    def test_publish_sync_batch(self):
+        eventhub = self.get_eventhub(publish_type='SYNC', sync_timeout=10)
+
+        eventhub.publisher.add_message('1', b'a')
+        eventhub.publisher.publish_queue()
+
+        eventhub.publisher.add_message('2', b'b')
+        eventhub.publisher.add_message('3', b'c')
+        acks = eventhub.publisher.publish_queue()
+        self.assertEqual([ack.id for ack in acks], ['2', '3'])
+
+    def test_publish_future(self):
+        from predix.data.eventhub import EventHub_pb2
+
+        eventhub = self.get_eventhub()
+        first = eventhub.publisher.publish('1', b'a')
+        second = eventhub.publisher.publish('2', b'b')
+        self.assertRaises(ValueError, eventhub.publisher.publish, '1', b'c')
+        eventhub.publisher.publish_queue()
+
+        self.assertEqual(first.result(5).id, '1')
+        self.assertEqual(second.result(5).status_code, EventHub_pb2.ACCEPTED)
+        self.assertEqual(eventhub.publisher._in_flight, {})
+
+        # Ids can be used again once acknowledged
+        eventhub.publisher.publish('1', b'c')
+
+    def test_publish_retry(self):
+        from predix.data.eventhub.publisher import PublishError
+
+        self.fake.eventhub_nacks = {'1': 2, '2': 5}
+        eventhub = self.get_eventhub(max_retries=2, retry_backoff=0.01)
+        first = eventhub.publisher.publish('1', b'a')
+        second = eventhub.publisher.publish('2', b'b')
+        eventhub.publisher.publish_queue()
+
+        self.assertEqual(first.result(5).id, '1')
+        self.assertRaises(PublishError, second.result, 5)
+        self.assertEqual(second.exception().ack.desc, 'injected failure')
+
+        messages = self.fake.eventhub['fake-zone_topic']
+        self.assertEqual([message.id for message in messages], ['1'])
+
+    def test_publish_nacks_only(self):
+        eventhub = self.get_eventhub(ack_timeout=0.1,
+                async_acknowledgement_options='NACKS_ONLY')
+        self.assertEqual(eventhub.publisher._generate_publish_headers()['nacks'],
+                'true')
+
+        future = eventhub.publisher.publish('1', b'a')
+        eventhub.publisher.publish_queue()
+        self.assertIsNone(future.result(5))
+
+    def test_publish_no_acks_unlocked(self):
+        eventhub = self.get_eventhub(async_acknowledgement_options='NONE')
+        publisher = eventhub.publisher
+
+        # Neither the send nor the callbacks hold up publishing
+        owned = []
+        send = publisher._publish_queue_grpc
+        def publish_queue_grpc(messages):
+            owned.append(publisher._tx_queue_lock._is_owned())
+            send(messages)
+        publisher._publish_queue_grpc = publish_queue_grpc
+
+        future = publisher.publish('1', b'a')
+        future.add_done_callback(lambda future:
+                owned.append(publisher._tx_queue_lock._is_owned()))
+        publisher.publish_queue()
+
+        self.assertIsNone(future.result(5))
+        self.assertEqual(owned, [False, False])
+
+    def test_publish_max_request_bytes(self):
+        from predix.data.eventhub import EventHub_pb2
+
+        eventhub = self.get_eventhub(max_request_bytes=1000)
+        publisher = eventhub.publisher
+        for i in range(10):
+            publisher.add_message(str(i), b'x' * 200)
+
+        message = EventHub_pb2.Messages(msg=publisher._tx_queue.items()[:1])
+        self.assertEqual(publisher._get_message_size(
+            publisher._tx_queue.items()[0]), message.ByteSize())
+        self.assertEqual(publisher._tx_queue.total_size,
+                10 * message.ByteSize())
+
+        sent = []
+        publisher._publish_queue_grpc = sent.append
+        publisher.publish_queue()
+        self.assertEqual([len(batch) for batch in sent], [4, 4, 2])
+        self.assertEqual(publisher._tx_queue.total_size, 0)
+
+    def test_auto_send_linger(self):
+        eventhub = self.get_eventhub(async_auto_send=True,
+                async_auto_send_interval_millis=50)
+
+        start = time.time()
+        future = eventhub.publisher.publish('1', b'a')
+        self.assertEqual(future.result(5).id, '1')
+        self.assertLess(time.time() - start, 1)
+
+    def test_auto_send_adaptive(self):
+        eventhub = self.get_eventhub(async_auto_send=True,
+                async_auto_send_adaptive=True, async_auto_send_amount=50,
+                async_auto_send_interval_millis=10)
+
+        futures = [eventhub.publisher.publish(str(i), b'a')
+                for i in range(200)]
+        for future in futures:
+            future.result(5)
+
+        batch_size = eventhub.publisher._batch_size
+        self.assertIsNotNone(batch_size.latency)
+        self.assertTrue(1 <= batch_size.size <= 50)
+
+    def test_publish_queue_full(self):
+        eventhub = self.get_eventhub(queue_capacity=2)
+
+        eventhub.publisher.add_message('1', b'a')
+        eventhub.publisher.add_message('2', b'b')
+        self.assertRaises(six.moves.queue.Full,
+                eventhub.publisher.add_message, '3', b'c')
+
+        eventhub.publisher.publish_queue()
+        self.assertEqual(len(eventhub.publisher._tx_queue), 0)
+        eventhub.publisher.add_message('3', b'c')
+
+
+@unittest.skipUnless(six.PY3, "asyncio client requires python 3")
+class TestAsyncEventhub(unittest.TestCase):
+    def setUp(self):
+        try:
+            import grpc.aio
+        except ImportError:
+            self.skipTest("grpc.aio is not available")
+
+        import asyncio
+        self.fake = predix.testing.FakePredix()
+        self.fake.start()
+        self.addCleanup(self.fake.stop)
+
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def run_eventhub(self, test, **kwargs):
+        import predix.data.eventhub.aio
+        from predix.data.eventhub.publisher import PublisherConfig
+        from predix.data.eventhub.subscriber import SubscribeConfig
+
+        async def run():
+            async with predix.data.eventhub.aio.AsyncEventhub(
+                    publish_config=PublisherConfig(**kwargs),
+                    subscribe_config=SubscribeConfig(batch_size=2)) as eh:
+                return await test(eh)
+
+        return self.loop.run_until_complete(run())
+
+    def test_publish(self):
+        import asyncio
+
+        async def test(eh):
+            health = await eh.check_health()
+            acks = await asyncio.gather(*[eh.publisher.publish(str(i), b'x')
+                for i in range(50)])
+            return (health, acks)
+
+        (health, acks) = self.run_eventhub(test)
+        self.assertEqual(health.status, 1)
+        self.assertEqual([ack.id for ack in acks],
+                [str(i) for i in range(50)])
+        self.assertEqual(len(self.fake.eventhub['fake-zone_topic']), 50)
+
+    def test_send(self):
+        from predix.data.eventhub import EventHub_pb2
+
+        self.fake.eventhub_nacks = {'1': 1, '2': 5}
+
+        async def test(eh):
+            messages = [EventHub_pb2.Message(id=str(i), body=b'x')
+                    for i in range(3)]
+            return [ack async for ack in eh.publisher.send(messages)]
+
+        acks = self.run_eventhub(test, max_retries=2, retry_backoff=0.01)
+        statuses = dict([(ack.id, ack.status_code) for ack in acks])
+        self.assertEqual(statuses, {'0': EventHub_pb2.ACCEPTED,
+            '1': EventHub_pb2.ACCEPTED, '2': EventHub_pb2.FAILED})
+
+    def test_subscribe(self):
+        async def test(eh):
+            for i in range(3):
+                await eh.publisher.publish(str(i), b'x')
+
+            received = []
+            async for message in eh.subscriber.receive():
+                received.append(message.id)
+                if len(received) == 3:
+                    break
+
+            async for message in eh.subscriber.receiveWithAcks():
+                await eh.subscriber.send_acks(message)
+                break
+
+            async for batch in eh.subscriber.subscribe():
+                await eh.subscriber.send_acks(batch)
+                return (received, len(batch.messages.msg))
+
+        (received, batch) = self.run_eventhub(test)
+        self.assertEqual(received, ['0', '1', '2'])
+        self.assertEqual(batch, 2)
+
+    def test_publish_queue_full(self):
+        import asyncio
+        from predix.data.eventhub import EventHub_pb2
+        from predix.data.eventhub.publisher import PublishError
+
+        async def test(eh):
+            # Nothing is sent until the loop runs so the queue fills up
+            futures = [eh.publisher.publish(str(i), b'x') for i in range(2)]
+            self.assertRaises(six.moves.queue.Full,
+                    eh.publisher.publish, '2', b'x')
+            await asyncio.gather(*futures)
+
+        self.run_eventhub(test, queue_capacity=2)
+
+        async def test(eh):
+            futures = [eh.publisher.publish(str(i), b'x') for i in range(3)]
+            return await asyncio.gather(*futures, return_exceptions=True)
+
+        results = self.run_eventhub(test, queue_capacity=2,
+                queue_overflow=BoundedQueue.DROP_OLDEST)
+        self.assertIsInstance(results[0], PublishError)
+        self.assertEqual([ack.id for ack in results[1:]], ['1', '2'])
+
+        # Sending a stream waits for space instead
+        async def test(eh):
+            messages = [EventHub_pb2.Message(id=str(i), body=b'x')
+                    for i in range(5)]
+            return [ack.id async for ack in eh.publisher.send(messages)]
+
+        acks = self.run_eventhub(test, queue_capacity=2,
+                queue_overflow=BoundedQueue.BLOCK)
+        self.assertEqual(sorted(acks), [str(i) for i in range(5)])
+
+
+class TestBoundedQueue(unittest.TestCase):
+    def test_fifo(self):
+        queue = BoundedQueue(capacity=10)
+        for i in range(5):
+            queue.put(i)
+
+        self.assertEqual(queue.get(), 0)
+        self.assertEqual(queue.drain(2), [1, 2])
+        self.assertEqual(queue.items(), [3, 4])
+        self.assertEqual(queue.drain(), [3, 4])
+        self.assertEqual(len(queue), 0)
+        self.assertRaises(six.moves.queue.Empty, queue.get, timeout=0.01)
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, BoundedQueue, capacity=0)
+        self.assertRaises(ValueError, BoundedQueue, overflow='grow')
+
+    def test_drop_oldest(self):
+        queue = BoundedQueue(capacity=2, overflow=BoundedQueue.DROP_OLDEST)
+        self.assertIsNone(queue.put(1))
+        self.assertIsNone(queue.put(2))
+        self.assertEqual(queue.put(3), 1)
+        self.assertEqual(queue.items(), [2, 3])
+        self.assertEqual(queue.dropped, 1)
+
+    def test_raise(self):
+        queue = BoundedQueue(capacity=1, overflow=BoundedQueue.RAISE)
+        queue.put(1)
+        self.assertRaises(six.moves.queue.Full, queue.put, 2)
+        self.assertEqual(queue.items(), [1])
+
+    def test_block(self):
+        queue = BoundedQueue(capacity=1, overflow=BoundedQueue.BLOCK)
+        queue.put(1)
+        self.assertRaises(six.moves.queue.Full, queue.put, 2, timeout=0.01)
+
+        timer = threading.Timer(0.05, queue.get)
+        timer.start()
+        queue.put(2, timeout=5)
+        timer.join()
+        self.assertEqual(queue.items(), [2])
+
+    def test_close(self):
+        queue = BoundedQueue(capacity=1)
+        queue.put(1)
+
+        timer = threading.Timer(0.05, queue.close)
+        timer.start()
+        self.assertRaises(six.moves.queue.Full, queue.put, 2)
+        timer.join()
+
+        self.assertEqual(queue.get(), 1)
+        self.assertRaises(six.moves.queue.Empty, queue.get)
+
+    def test_drain_size(self):
+        queue = BoundedQueue(capacity=10, get_size=len)
+        for item in ['aaa', 'bb', 'cccc', 'd']:
+            queue.put(item)
+        self.assertEqual(queue.total_size, 10)
+
+        self.assertEqual(queue.drain(max_size=5), ['aaa', 'bb'])
+        self.assertEqual(queue.drain(max_size=2), ['cccc'])
+        self.assertEqual(queue.total_size, 1)
+        self.assertEqual(queue.get(), 'd')
+        self.assertEqual(queue.total_size, 0)
+
+    def test_throughput(self):
+        queue = BoundedQueue(capacity=100000)
+        start = time.time()
+        for i in range(100000):
+            queue.put(i)
+        self.assertEqual(len(queue.drain()), 100000)
+        self.assertLess(time.time() - start, 5)
+
+
+class TestAdaptiveBatchSize(unittest.TestCase):
+    def test_size(self):
+        batch_size = AdaptiveBatchSize(maximum=500, smoothing=1)
+        self.assertEqual(batch_size.size, 500)
+
+        # 1000 messages a second with acks taking 50ms is 50 a round trip
+        batch_size.observe_arrivals(1000, 1)
+        batch_size.observe_latency(0.05)
+        self.assertEqual(batch_size.size, 50)
+
+        batch_size.observe_latency(10)
+        self.assertEqual(batch_size.size, 500)
+
+        batch_size.observe_arrivals(1, 10)
+        self.assertEqual(batch_size.size, 1)
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, AdaptiveBatchSize, 0)
+        self.assertRaises(ValueError, AdaptiveBatchSize, 10, minimum=20)
+
+
+if __name__ == '__main__':
+    if os.getenv('DEBUG'):
+        logging.basicConfig(level=logging.DEBUG)
+
+    unittest.main()
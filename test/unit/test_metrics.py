@@ -0,0 +1,201 @@
+import os
+import logging
+import unittest
+
+import six
+if six.PY3:
+    from unittest.mock import Mock, patch
+else:
+    from mock import Mock, patch
+
+import predix.metrics
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.registry = predix.metrics.MetricsRegistry(buckets=(0.1, 1))
+
+    def get_response(self, status=200, content=b'{}'):
+        response = Mock(status_code=status, content=content,
+                headers={'Content-Length': str(len(content))})
+        return response
+
+    def test_get_endpoint(self):
+        self.assertEqual(predix.metrics.get_endpoint(
+            'https://a.example.com/v1/datapoints/latest?tags=A'),
+            '/v1/datapoints/latest')
+        self.assertEqual(predix.metrics.get_endpoint(
+            'https://a.example.com/v1/resource/%2Fasset%2F12'),
+            '/v1/resource/{id}')
+        self.assertEqual(predix.metrics.get_endpoint(
+            'https://a.example.com/Users/3f1c1a52-5b1e-4f61-9d39-1c2b5d7b4a10'),
+            '/Users/{id}')
+
+    def test_histogram(self):
+        histogram = predix.metrics.Histogram(buckets=(0.1, 1))
+        for value in [0.05, 0.5, 0.7, 3]:
+            histogram.observe(value)
+
+        self.assertEqual(histogram.get_cumulative(),
+                [(0.1, 1), (1, 3), (float('inf'), 4)])
+        self.assertEqual(histogram.count, 4)
+        self.assertAlmostEqual(histogram.sum, 4.25)
+
+    def test_track(self):
+        events = []
+        handle = self.registry.add_hook(before=events.append,
+                after=events.append)
+
+        call = Mock(return_value=self.get_response(content=b'12345'))
+        self.registry.track(call, 'get', 'https://a.example.com/v1/tags',
+                data='abc')
+        call.assert_called_with('get', 'https://a.example.com/v1/tags',
+                data='abc')
+
+        self.assertEqual(len(events), 2)
+        event = events[0]
+        self.assertEqual(event['status'], 200)
+        self.assertEqual(event['bytes_sent'], 3)
+        self.assertEqual(event['bytes_received'], 5)
+
+        labels = {'service': 'a.example.com', 'method': 'GET',
+                'endpoint': '/v1/tags', 'status': '200'}
+        self.assertEqual(self.registry.get_histogram(
+            'predix_request_seconds', **labels).count, 1)
+        self.assertEqual(self.registry.get_counter(
+            'predix_request_bytes_received_total', **labels), 5)
+
+        self.registry.remove_hook(handle)
+        self.registry.track(call, 'GET', 'https://a.example.com/v1/tags')
+        self.assertEqual(len(events), 2)
+
+    def test_track_error(self):
+        call = Mock(side_effect=IOError('down'))
+        self.assertRaises(IOError, self.registry.track, call, 'GET',
+                'https://a.example.com/v1/tags')
+
+        self.assertEqual(self.registry.get_histogram('predix_request_seconds',
+            service='a.example.com', method='GET', endpoint='/v1/tags',
+            status='error').count, 1)
+
+    def test_track_hook_errors(self):
+        def broken(event):
+            raise KeyError('broken')
+        self.registry.add_hook(before=broken, after=broken)
+
+        call = Mock(return_value=self.get_response())
+        response = self.registry.track(call, 'GET',
+                'https://a.example.com/v1/tags')
+        self.assertEqual(response.status_code, 200)
+
+        # Errors recording must not replace the error of the request
+        call = Mock(side_effect=IOError('down'))
+        with patch.object(self.registry, 'observe',
+                side_effect=ValueError('recording')):
+            self.assertRaises(IOError, self.registry.track, call, 'GET',
+                    'https://a.example.com/v1/tags')
+
+        # Nor should a sink that can't be reached
+        sink = Mock()
+        sink.increment.side_effect = IOError('unreachable')
+        sink.observe.side_effect = IOError('unreachable')
+        self.registry.add_sink(sink)
+        self.registry.increment('predix_retries_total', service='a')
+        call = Mock(return_value=self.get_response())
+        response = self.registry.track(call, 'GET',
+                'https://a.example.com/v1/tags')
+        self.assertEqual(response.status_code, 200)
+
+    def test_track_redacts_authorization(self):
+        events = []
+        self.registry.add_hook(before=events.append)
+        call = Mock(return_value=self.get_response())
+        self.registry.track(call, 'GET', 'https://a.example.com/v1/tags',
+                headers={'Authorization': 'Bearer secret', 'Accept': 'x'})
+
+        headers = events[0]['kwargs']['headers']
+        self.assertEqual(headers['Accept'], 'x')
+        self.assertNotIn('secret', headers['Authorization'])
+        self.assertEqual(call.call_args[1]['headers']['Authorization'],
+                'Bearer secret')
+
+    def test_track_stream(self):
+        response = self.get_response(content=b'12345')
+        events = []
+        self.registry.add_hook(after=events.append)
+        self.registry.track(Mock(return_value=response), 'GET',
+                'https://a.example.com/v1/datapoints', stream=True)
+        self.assertEqual(events[0]['bytes_received'], 5)
+
+    def test_to_prometheus(self):
+        self.registry.describe('predix_retries_total', 'Retries.')
+        self.registry.increment('predix_retries_total', service='a')
+        self.registry.increment('predix_retries_total', service='a')
+        self.registry.observe('predix_request_seconds', 0.5, service='a')
+
+        text = self.registry.to_prometheus()
+        self.assertIn('# HELP predix_retries_total Retries.\n', text)
+        self.assertIn('# TYPE predix_retries_total counter\n', text)
+        self.assertIn('predix_retries_total{service="a"} 2\n', text)
+        self.assertIn('# TYPE predix_request_seconds histogram\n', text)
+        self.assertIn('predix_request_seconds_bucket{service="a",le="0.1"} 0\n',
+                text)
+        self.assertIn('predix_request_seconds_bucket{service="a",le="1"} 1\n',
+                text)
+        self.assertIn(
+                'predix_request_seconds_bucket{service="a",le="+Inf"} 1\n',
+                text)
+        self.assertIn('predix_request_seconds_count{service="a"} 1\n', text)
+
+    def test_statsd_sink(self):
+        sink = predix.metrics.StatsdSink(prefix='app')
+        sink._socket = Mock()
+        self.registry.add_sink(sink)
+
+        self.registry.increment('predix_retries_total', 2,
+                service='a.example.com', method='GET')
+        self.registry.observe('predix_request_seconds', 0.25,
+                service='a.example.com', method='GET')
+
+        sent = [c[0][0] for c in sink._socket.sendto.call_args_list]
+        self.assertEqual(sent, [
+            b'app.retries_total.GET.a_example_com:2|c',
+            b'app.request_seconds.GET.a_example_com:250.000|ms',
+            ])
+
+    def test_transport_request(self):
+        transport = Mock()
+        transport.request.return_value = self.get_response()
+
+        import predix.transport
+        previous = predix.transport.set_transport(transport)
+        try:
+            with patch('predix.metrics.registry', self.registry):
+                predix.transport.request('GET', 'https://b.example.com/v1')
+        finally:
+            predix.transport.set_transport(previous)
+
+        self.assertEqual(self.registry.get_counter(
+            'predix_request_bytes_received_total'), 2)
+
+    def test_token_refreshes(self):
+        import predix.testing
+        import predix.security.uaa
+
+        with patch('predix.metrics.registry', self.registry), \
+                patch('predix.security.uaa.UserAccountAuthentication.'
+                    '_write_to_uaa_cache'):
+            with predix.testing.FakePredix() as fake:
+                uaa = predix.security.uaa.UserAccountAuthentication()
+                uaa.authenticate(fake.CLIENT_ID, fake.CLIENT_SECRET,
+                        use_cache=False)
+
+        self.assertEqual(self.registry.get_counter(
+            'predix_token_refreshes_total', service='uaa.predix.test'), 1)
+
+
+if __name__ == '__main__':
+    if os.getenv('DEBUG'):
+        logging.basicConfig(level=logging.DEBUG)
+
+    unittest.main()
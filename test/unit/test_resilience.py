@@ -0,0 +1,113 @@
+import os
+import logging
+import unittest
+
+import requests
+
+import six
+if six.PY3:
+    from unittest.mock import Mock, patch
+else:
+    from mock import Mock, patch
+
+import predix.resilience
+
+
+def get_response(status, headers=None):
+    return Mock(status_code=status, headers=headers or {})
+
+
+class TestResilience(unittest.TestCase):
+    def setUp(self):
+        predix.resilience.configure_breakers(failure_threshold=3,
+                reset_timeout=30)
+        self.addCleanup(predix.resilience.configure_breakers,
+                failure_threshold=5, reset_timeout=30)
+
+        for name in ['predix.transport.request', 'time.sleep']:
+            patcher = patch(name)
+            self.addCleanup(patcher.stop)
+            setattr(self, name.split('.')[-1], patcher.start())
+
+    def test_retry_idempotent(self):
+        self.request.side_effect = [get_response(503, {'Retry-After': '2'}),
+                requests.exceptions.ConnectionError('reset'),
+                get_response(200)]
+
+        response = predix.resilience.request('GET', 'https://a.example.com/x')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.request.call_count, 3)
+        self.assertEqual(self.sleep.call_args_list[0][0][0], 2)
+
+    def test_retry_post(self):
+        # Could have been processed so not sent again
+        self.request.side_effect = [get_response(500), get_response(200)]
+        response = predix.resilience.request('POST', 'https://a.example.com/x')
+        self.assertEqual(response.status_code, 500)
+
+        self.request.side_effect = [get_response(429), get_response(200)]
+        response = predix.resilience.request('POST', 'https://a.example.com/x')
+        self.assertEqual(response.status_code, 200)
+
+        self.request.side_effect = requests.exceptions.ReadTimeout()
+        self.assertRaises(requests.exceptions.ReadTimeout,
+                predix.resilience.request, 'POST', 'https://a.example.com/x')
+        self.assertEqual(self.request.call_count, 4)
+
+    def test_retry_exhausted(self):
+        self.request.return_value = get_response(502)
+        retry = predix.resilience.RetryPolicy(max_retries=2, backoff=1,
+                jitter=False)
+        response = predix.resilience.request('GET', 'https://b.example.com/x',
+                retry=retry)
+        self.assertEqual(response.status_code, 502)
+        self.assertEqual([call[0][0] for call in self.sleep.call_args_list],
+                [1, 2])
+
+    def test_circuit_breaker(self):
+        retry = predix.resilience.RetryPolicy(max_retries=0)
+        self.request.side_effect = requests.exceptions.ConnectionError('down')
+        for i in range(3):
+            self.assertRaises(requests.exceptions.ConnectionError,
+                    predix.resilience.request, 'GET',
+                    'https://c.example.com/x', retry=retry)
+
+        # Fails fast without making the request, other hosts unaffected
+        self.assertRaises(predix.resilience.CircuitOpenError,
+                predix.resilience.request, 'GET', 'https://c.example.com/x',
+                retry=retry)
+        self.assertEqual(self.request.call_count, 3)
+
+        self.request.side_effect = None
+        self.request.return_value = get_response(200)
+        predix.resilience.request('GET', 'https://d.example.com/x')
+
+        # A trial request after the reset timeout closes the circuit
+        breaker = predix.resilience.get_breaker('https://c.example.com')
+        breaker._opened -= 30
+        predix.resilience.request('GET', 'https://c.example.com/x')
+        self.assertEqual(breaker.state, breaker.CLOSED)
+
+    def test_circuit_breaker_trial_error(self):
+        retry = predix.resilience.RetryPolicy(max_retries=0)
+        breaker = predix.resilience.get_breaker('https://e.example.com')
+        breaker.state = breaker.OPEN
+        breaker._opened = 0
+
+        # An error unrelated to the host must not leave the trial outstanding
+        self.request.side_effect = ValueError('bad body')
+        self.assertRaises(ValueError, predix.resilience.request, 'GET',
+                'https://e.example.com/x', retry=retry)
+        self.assertEqual(breaker.state, breaker.HALF_OPEN)
+
+        self.request.side_effect = None
+        self.request.return_value = get_response(200)
+        predix.resilience.request('GET', 'https://e.example.com/x')
+        self.assertEqual(breaker.state, breaker.CLOSED)
+
+
+if __name__ == '__main__':
+    if os.getenv('DEBUG'):
+        logging.basicConfig(level=logging.DEBUG)
+
+    unittest.main()
@@ -0,0 +1,59 @@
+import os
+import logging
+import unittest
+import warnings
+
+import six
+if six.PY3:
+    from unittest.mock import Mock, patch
+else:
+    from mock import Mock, patch
+
+import predix.service
+import predix.transport
+
+
+class TestService(unittest.TestCase):
+    def setUp(self):
+        for name in ['predix.security.uaa.UserAccountAuthentication',
+                'predix.service.Service._auto_authenticate']:
+            patcher = patch(name)
+            self.addCleanup(patcher.stop)
+            patcher.start()
+
+    def test_get_headers(self):
+        service = predix.service.Service('zone')
+        service.uaa.get_token.return_value = 'token1'
+
+        headers = service._get_headers()
+        self.assertEqual(headers['Predix-Zone-Id'], 'zone')
+        self.assertEqual(headers['Authorization'], 'Bearer token1')
+        self.assertEqual(service._get_headers(), headers)
+
+        # Callers can change their copy without changing the cache
+        headers['X-Extra'] = 'value'
+        self.assertNotIn('X-Extra', service._get_headers())
+
+        # Built again once the token rotates
+        service.uaa.get_token.return_value = 'token2'
+        rotated = service._get_headers()
+        self.assertIsNot(rotated, headers)
+        self.assertEqual(rotated['Authorization'], 'Bearer token2')
+
+    def test_session(self):
+        service = predix.service.Service('zone',
+                uri='https://a.example.com/v1')
+
+        # Still available for callers, as the shared session of the host
+        with warnings.catch_warnings(record=True):
+            warnings.simplefilter('always')
+            session = service.session
+        self.assertIs(session,
+                predix.transport.get_session('https://a.example.com'))
+
+
+if __name__ == '__main__':
+    if os.getenv('DEBUG'):
+        logging.basicConfig(level=logging.DEBUG)
+
+    unittest.main()
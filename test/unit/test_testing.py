@@ -0,0 +1,121 @@
+import os
+import time
+import logging
+import unittest
+
+import requests
+
+import predix.metrics
+import predix.testing
+import predix.transport
+import predix.data.asset
+import predix.data.timeseries
+
+
+class TestFakePredix(unittest.TestCase):
+    def setUp(self):
+        self.fake = predix.testing.FakePredix()
+        self.fake.start()
+        self.addCleanup(self.fake.stop)
+
+    def test_start_stop(self):
+        fake = predix.testing.FakePredix()
+        uri = os.environ.get('PREDIX_DATA_ASSET_URI')
+        self.fake.stop()
+
+        with fake:
+            self.assertEqual(predix.transport.get_transport(), fake)
+            self.assertEqual(os.environ['PREDIX_DATA_ASSET_URI'],
+                    fake.ASSET_URI)
+
+        self.assertEqual(predix.transport.get_transport(),
+                predix.transport.registry)
+        self.assertNotEqual(os.environ.get('PREDIX_DATA_ASSET_URI'), uri)
+
+    def test_unauthorized(self):
+        response = predix.transport.request('GET',
+                self.fake.QUERY_URI + '/v1/tags')
+        self.assertEqual(response.status_code, 401)
+        self.assertRaises(requests.exceptions.HTTPError,
+                response.raise_for_status)
+
+    def test_timeseries(self):
+        ts = predix.data.timeseries.TimeSeries()
+        now = int(time.time() * 1000)
+        for i in range(5):
+            ts.queue('TEMP', 70 + i, quality=ts.GOOD, timestamp=now - i,
+                    attributes={'unit': 'F'})
+        ack = ts.send()
+
+        self.assertIn('202', ack)
+        self.assertEqual(len(self.fake.timeseries['TEMP']), 5)
+        self.assertEqual(ts.get_tags(), ['TEMP'])
+
+        results = ts.get_datapoints('TEMP', start='1h-ago', limit=2,
+                order='desc', post=True)
+        values = results['tags'][0]['results'][0]['values']
+        self.assertEqual(values, [[now, 70, 3], [now - 1, 71, 3]])
+
+        columns = ts.get_datapoints('TEMP', start='1h-ago', as_arrays=True,
+                stream=True)
+        self.assertEqual(len(columns[0]['values']), 5)
+
+        latest = ts.get_latest_values(['TEMP', 'MISSING'])
+        self.assertEqual(latest['TEMP'], (now, 70, 3))
+        self.assertEqual(latest['MISSING'], None)
+
+    def test_async_timeseries(self):
+        try:
+            import asyncio
+            import predix.data.timeseries.aio
+        except (ImportError, SyntaxError):
+            self.skipTest("aiohttp is not installed")
+
+        events = []
+        handle = predix.metrics.add_hook(after=events.append)
+        self.addCleanup(predix.metrics.remove_hook, handle)
+
+        async def run():
+            async with predix.data.timeseries.aio.AsyncTimeSeries() as ts:
+                ts.queue('TEMP', 70, quality=ts.GOOD, timestamp=now)
+                ack = await ts.send()
+                tags = await ts.get_tags()
+                results = await ts.get_datapoints('TEMP', start='1h-ago')
+                latest = await ts.get_latest_values(['TEMP', 'MISSING'],
+                        max_tags=1)
+            return (ack, tags, results, latest)
+
+        now = int(time.time() * 1000)
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        (ack, tags, results, latest) = loop.run_until_complete(run())
+
+        # Requests reach the fake services and are measured
+        self.assertIn('202', ack)
+        self.assertEqual(tags, ['TEMP'])
+        values = results['tags'][0]['results'][0]['values']
+        self.assertEqual(values, [[now, 70, 3]])
+        self.assertEqual(list(latest.items()),
+                [('TEMP', (now, 70, 3)), ('MISSING', None)])
+        self.assertEqual([event['status'] for event in events
+            if event['service'] == 'time-series-query.predix.test'],
+            [200] * 4)
+
+    def test_asset(self):
+        asset = predix.data.asset.Asset()
+        asset.post_collection('/volcano',
+                [{'uri': '/volcano/vesuvius', 'name': 'Vesuvius'}])
+
+        self.assertEqual(asset.get_collections(), ['volcano'])
+        self.assertEqual(asset.get_collection('/volcano/vesuvius'),
+                [{'uri': '/volcano/vesuvius', 'name': 'Vesuvius'}])
+
+        asset.delete_collection('/volcano/vesuvius')
+        self.assertEqual(asset.get_collection('/volcano'), [])
+
+
+if __name__ == '__main__':
+    if os.getenv('DEBUG'):
+        logging.basicConfig(level=logging.DEBUG)
+
+    unittest.main()
@@ -0,0 +1,729 @@
+
+import os
+import gc
+import json
+import time
+import logging
+import tempfile
+import collections
+import unittest
+import threading
+import websocket
+import concurrent.futures
+
+import six
+if six.PY3:
+    from unittest.mock import Mock, patch
+else:
+    from mock import Mock, patch
+
+import predix.testing
+import predix.data.timeseries
+
+
+def get_websocket(statuses):
+    """
+    Returns a predix.testing.FakeWebSocket that acks according to a script
+    of statuses for each message id, keeping the ids sent in order.
+    """
+    sent = []
+
+    def ack(payload):
+        message_id = json.loads(payload)['messageId']
+        sent.append(message_id)
+        return json.dumps({'messageId': message_id,
+            'statusCode': statuses[message_id].pop(0)})
+
+    ws = predix.testing.FakeWebSocket(ack)
+    ws.sent = sent
+    return ws
+
+
+class TestTimeSeries(unittest.TestCase):
+    def setUp(self):
+        patcher = patch('predix.service.Service')
+        self.addCleanup(patcher.stop)
+        patcher.start()
+
+    def _get_timeseries(self, **kwargs):
+        return predix.data.timeseries.TimeSeries(
+                query_uri='https://query.example.com',
+                ingest_uri='wss://ingest.example.com',
+                query_zone_id='query-zone', ingest_zone_id='ingest-zone',
+                **kwargs)
+
+    def test_send(self):
+        ts = self._get_timeseries()
+        ts._send_to_timeseries = Mock(return_value='{"statusCode": 202}')
+
+        ts.queue('TAG1', 10, timestamp=1000)
+        ts.queue('TAG1', 11, timestamp=2000)
+        ts.queue('TAG2', 20, quality=ts.GOOD, timestamp=1000,
+                attributes={'unit': 'F'})
+        ts.send()
+
+        msg = ts._send_to_timeseries.call_args[0][0]
+        self.assertEqual(msg['body'], [
+            {'name': 'TAG1', 'datapoints': [[1000, 10, 1], [2000, 11, 1]]},
+            {'name': 'TAG2', 'datapoints': [[1000, 20, 3]],
+                'attributes': {'unit': 'F'}},
+            ])
+        self.assertEqual(len(ts._queue), 0)
+
+    def test_queue_keeps_attributes_apart(self):
+        ts = self._get_timeseries()
+        ts._send_to_timeseries = Mock()
+
+        ts.queue('TAG1', 1, timestamp=1000, attributes={'unit': 'F'})
+        ts.queue('TAG1', 2, timestamp=1000, attributes={'unit': 'C'})
+        ts.queue('TAG1', 3, timestamp=2000, attributes={'unit': 'F'})
+        ts.send()
+
+        msg = ts._send_to_timeseries.call_args[0][0]
+        self.assertEqual(msg['body'], [
+            {'name': 'TAG1', 'datapoints': [[1000, 1, 1], [2000, 3, 1]],
+                'attributes': {'unit': 'F'}},
+            {'name': 'TAG1', 'datapoints': [[1000, 2, 1]],
+                'attributes': {'unit': 'C'}},
+            ])
+
+    def test_queue_many(self):
+        import numpy
+        ts = self._get_timeseries()
+        ts._send_to_timeseries = Mock()
+
+        timestamps = numpy.array(['2017-05-05T20:26:12.386'],
+                dtype='datetime64[ms]').repeat(2)
+        ts.queue_many('TAG1', timestamps, numpy.array([1.5, 2.5]),
+                qualities=[ts.GOOD, 7])
+        ts.send()
+
+        msg = ts._send_to_timeseries.call_args[0][0]
+        self.assertEqual(msg['body'], [
+            {'name': 'TAG1', 'datapoints': [[1494015972386, 1.5, 3],
+                [1494015972386, 2.5, 1]]},
+            ])
+
+    def test_queue_many_frame(self):
+        import numpy
+        import pandas
+        ts = self._get_timeseries()
+        ts._send_to_timeseries = Mock()
+
+        index = pandas.date_range('2017-05-05 20:26:12', periods=2,
+                freq='s', tz='US/Pacific')
+        frame = pandas.DataFrame({'TAG1': [1.0, numpy.nan],
+            'TAG2': [3.0, 4.0]}, index=index)
+        ts.queue_many(frame, qualities=ts.GOOD)
+        ts.send()
+
+        msg = ts._send_to_timeseries.call_args[0][0]
+        self.assertEqual(msg['body'], [
+            {'name': 'TAG1', 'datapoints': [[1494041172000, 1.0, 3]]},
+            {'name': 'TAG2', 'datapoints': [[1494041172000, 3.0, 3],
+                [1494041173000, 4.0, 3]]},
+            ])
+
+    def test_get_datapoints_as_arrays(self):
+        ts = self._get_timeseries()
+        ts._get_datapoints = Mock(return_value={'tags': [
+            {'name': 'TAG1', 'results': [{'attributes': {},
+                'values': [[1000, 1.5, 3], [2000, 2.5, 1]]}]},
+            {'name': 'TAG2', 'results': [{'attributes': {},
+                'values': [[2000, 7, 3]]}]},
+            ]})
+
+        columns = ts.get_datapoints(['TAG1', 'TAG2'], as_arrays=True)
+        self.assertEqual(columns[0]['name'], 'TAG1')
+        self.assertEqual(columns[0]['timestamps'].dtype.name, 'int64')
+        self.assertEqual(columns[0]['timestamps'].tolist(), [1000, 2000])
+        self.assertEqual(columns[0]['values'].tolist(), [1.5, 2.5])
+        self.assertEqual(columns[0]['qualities'].dtype.name, 'int8')
+        self.assertEqual(columns[0]['qualities'].tolist(), [3, 1])
+
+        frame = ts.get_frame(['TAG1', 'TAG2'])
+        self.assertEqual(list(frame.columns), ['TAG1', 'TAG2'])
+        self.assertEqual(len(frame), 2)
+        self.assertEqual(frame['TAG2'].iloc[1], 7)
+
+    def test_decode_values(self):
+        import predix.data.timeseries.columnar as columnar
+
+        # Integers stay exact rather than rounding through a float64
+        values = columnar.decode_values([[1, 2**62 + 1, 3], [2, 5, 3]])[1]
+        self.assertEqual(values.dtype.name, 'int64')
+        self.assertEqual(values.tolist(), [2**62 + 1, 5])
+
+        values = columnar.decode_values([[1, 1, 3], [2, 2.5, 3]])[1]
+        self.assertEqual(values.dtype.name, 'float64')
+
+        # Numeric strings are not converted to numbers
+        values = columnar.decode_values([[1, '1.5', 3], [2, 2, 3]])[1]
+        self.assertEqual(values.dtype.name, 'object')
+        self.assertEqual(values.tolist(), ['1.5', 2])
+
+    def test_get_datapoints_stream(self):
+        ts = self._get_timeseries()
+        response = {'tags': [
+            {'name': 'TAG1', 'stats': {'rawCount': 3}, 'results': [
+                {'groups': [{'name': 'attribute', 'attributes': ['unit']}],
+                    'attributes': {'unit': ['mph']},
+                    'values': [[1, 1.5, 3], [2, 2.5, 3], [3, 1e3, 1]]},
+                {'groups': [], 'attributes': {}, 'values': []}]},
+            {'name': u'TAG\u00e92', 'results': [
+                {'values': [[4, 'on', 3]]}]}]}
+        body = json.dumps(response, indent=1).encode('utf-8')
+
+        # Arbitrary boundaries split numbers, strings, and characters
+        ts._stream_datapoints = Mock(side_effect=lambda params, post: iter(
+            [body[i:i + 7] for i in range(0, len(body), 7)]))
+
+        columns = ts.get_datapoints(['TAG1', 'TAG2'], as_arrays=True,
+                stream=True)
+        self.assertEqual(len(columns), 3)
+        self.assertEqual(columns[0]['name'], 'TAG1')
+        self.assertEqual(columns[0]['attributes'], {'unit': ['mph']})
+        self.assertEqual(columns[0]['timestamps'].tolist(), [1, 2, 3])
+        self.assertEqual(columns[0]['values'].tolist(), [1.5, 2.5, 1000.0])
+        self.assertEqual(len(columns[1]['timestamps']), 0)
+        self.assertEqual(columns[2]['name'], u'TAG\u00e92')
+        self.assertEqual(columns[2]['values'].tolist(), ['on'])
+
+        chunks = list(ts.iter_datapoints('TAG1', chunk_size=2))
+        self.assertEqual([chunk['values'] for chunk in chunks],
+                [[[1, 1.5, 3], [2, 2.5, 3]], [[3, 1e3, 1]], [], [[4, 'on', 3]]])
+        self.assertEqual(chunks[1]['groups'][0]['name'], 'attribute')
+
+        self.assertRaises(ValueError, ts.get_datapoints, 'TAG1', stream=True)
+
+    def test_aggregate(self):
+        import numpy
+        import predix.data.timeseries.aggregate as aggregate
+
+        column = {'name': 'TAG1',
+            'timestamps': numpy.array([0, 500, 1000, 3500, 3000]),
+            'values': numpy.array([1.0, 3.0, 5.0, 9.0, 7.0]),
+            'qualities': numpy.array([3, 1, 3, 3, 3], dtype='int8')}
+
+        avg = aggregate.resample(column, 1000, 'avg')
+        self.assertEqual(avg['name'], 'TAG1')
+        self.assertEqual(avg['timestamps'].tolist(), [0, 1000, 3000])
+        self.assertEqual(avg['values'].tolist(), [2.0, 5.0, 8.0])
+        self.assertEqual(avg['qualities'].tolist(), [1, 3, 3])
+        self.assertEqual(aggregate.resample(column, '1s', 'last')[
+            'values'].tolist(), [3.0, 5.0, 9.0])
+        self.assertEqual(aggregate.resample(column, 1000, 'count')[
+            'values'].tolist(), [2, 1, 2])
+
+        filled = aggregate.fill_gaps(avg, 1000)
+        self.assertEqual(filled['timestamps'].tolist(), [0, 1000, 2000, 3000])
+        self.assertEqual(filled['values'].tolist(), [2.0, 5.0, 6.5, 8.0])
+        self.assertEqual(filled['qualities'].tolist(), [1, 3, 1, 3])
+        self.assertEqual(aggregate.fill_gaps(avg, 1000, 'previous')[
+            'values'].tolist(), [2.0, 5.0, 5.0, 8.0])
+
+        # Peaks survive downsampling along with the end points
+        values = numpy.zeros(100)
+        values[37] = 10
+        values[71] = -10
+        series = {'timestamps': numpy.arange(100), 'values': values,
+            'qualities': numpy.full(100, 3, dtype='int8')}
+        sampled = aggregate.downsample(series, 10)
+        self.assertEqual(len(sampled['timestamps']), 10)
+        for timestamp in [0, 37, 71, 99]:
+            self.assertIn(timestamp, sampled['timestamps'].tolist())
+
+        ts = self._get_timeseries()
+        query = ts._build_datapoints_query('TAG1', aggregations='avg',
+                sampling='15mi')
+        self.assertEqual(query['tags'][0]['aggregations'], [{'type': 'avg',
+            'sampling': {'unit': 'mi', 'value': '15'}}])
+
+    def test_coalesce(self):
+        ts = self._get_timeseries(coalesce=True)
+
+        started = threading.Event()
+        release = threading.Event()
+        def get_datapoints(params):
+            started.set()
+            release.wait(5)
+            return {'tags': []}
+        ts._get_datapoints = Mock(side_effect=get_datapoints)
+
+        responses = []
+        def query():
+            responses.append(ts.get_datapoints('TAG1', start=1000))
+        threads = [threading.Thread(target=query) for i in range(4)]
+        threads[0].start()
+        self.assertTrue(started.wait(5))
+        for thread in threads[1:]:
+            thread.start()
+
+        # Give the followers time to join the query in flight
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(ts._get_datapoints.call_count, 1)
+        self.assertEqual(len(responses), 4)
+        self.assertTrue(all(response is responses[0]
+            for response in responses))
+        ts.get_datapoints('TAG1', start=1000)
+        self.assertEqual(ts._single_flight._calls, {})
+
+    def test_get_datapoints_window(self):
+        ts = self._get_timeseries()
+
+        def get_datapoints(params):
+            query = json.loads(params['query'])
+            start, end = query['start'], query['end']
+            return {'tags': [{'name': 'TAG1', 'stats': {'rawCount': 2},
+                'results': [{'groups': [], 'attributes': {},
+                    'values': [[start, 1, 3], [end, 2, 3]]}]}]}
+        ts._get_datapoints = Mock(side_effect=get_datapoints)
+
+        response = ts.get_datapoints('TAG1', start=1000, end=3999,
+                window=1000)
+        values = response['tags'][0]['results'][0]['values']
+        self.assertEqual(ts._get_datapoints.call_count, 3)
+        self.assertEqual([value[0] for value in values],
+                [1000, 1999, 2000, 2999, 3000, 3999])
+        self.assertEqual(response['tags'][0]['stats']['rawCount'], 6)
+
+        response = ts.get_datapoints('TAG1', start=1000, end=3999,
+                window=1000, order='desc', limit=3, max_workers=1)
+        values = response['tags'][0]['results'][0]['values']
+        self.assertEqual([value[0] for value in values], [3000, 3999, 2000])
+
+    def test_get_latest_values(self):
+        ts = self._get_timeseries()
+
+        def latest(names):
+            return {'tags': [{'name': name, 'results': [{'groups': [],
+                'values': [[int(name[3:]), 1.0, 3]] if name != 'TAG5' else []}]}
+                for name in names]}
+        ts._get_latest = Mock(side_effect=lambda params: latest(
+            params['tags'].split(',')))
+        ts._post_latest = Mock(side_effect=lambda body: latest(
+            [tag['name'] for tag in body['tags']]))
+
+        tags = ['TAG%s' % (i) for i in range(1, 11)]
+        values = ts.get_latest_values(tags + ['TAG1'], max_tags=4,
+                max_url_length=20)
+        self.assertEqual(list(values.keys()), tags)
+        self.assertEqual(values['TAG3'], (3, 1.0, 3))
+        self.assertEqual(values['TAG5'], None)
+
+        # Batches of 4 are too long for a GET but the final batch of 2 isn't
+        self.assertEqual(ts._post_latest.call_count, 2)
+        self.assertEqual(ts._get_latest.call_count, 1)
+
+    def test_tail(self):
+        ts = self._get_timeseries()
+        polls = [
+            {'tags': [
+                {'name': 'TAG1', 'results': [{'values': [[10, 1, 3], [20, 2, 3]]}]},
+                {'name': 'TAG2', 'results': [{'values': [[15, 5, 3]]}]}]},
+            # Boundary datapoints are returned again along with new ones
+            {'tags': [
+                {'name': 'TAG1', 'results': [{'values': [[20, 2, 3], [20, 9, 3]]}]},
+                {'name': 'TAG2', 'results': [{'values': [[15, 5, 3], [30, 6, 3]]}]}]},
+            ]
+        ts._query_datapoints = Mock(side_effect=lambda params, post: polls.pop(0))
+
+        with patch('time.sleep'):
+            tail = ts.tail(['TAG1', 'TAG2'], interval=1, start=5)
+            datapoints = [next(tail) for i in range(5)]
+
+        self.assertEqual(datapoints, [('TAG1', 10, 1, 3), ('TAG2', 15, 5, 3),
+            ('TAG1', 20, 2, 3), ('TAG1', 20, 9, 3), ('TAG2', 30, 6, 3)])
+
+        calls = ts._query_datapoints.call_args_list
+        self.assertEqual(calls[0][0][0]['start'], 5)
+        self.assertEqual(calls[1][0][0]['start'], 15)
+
+    def test_query_planner(self):
+        import predix.data.timeseries.query as planner
+        self.assertEqual(planner.parse_duration('15mi'), 900000)
+        self.assertEqual(planner.to_epoch_millis('1d-ago', 86400000), 0)
+        self.assertEqual(planner.to_epoch_millis('1000', 0), 1000)
+        self.assertEqual(planner.split_range(0, 2500, 1000),
+                [(0, 999), (1000, 1999), (2000, 2500)])
+        self.assertEqual(planner.get_window_for_count(0, 999, 1500,
+            max_datapoints=500), 334)
+
+    def test_cache(self):
+        import predix.data.timeseries.cache
+        cache = predix.data.timeseries.cache.QueryCache(
+                path=tempfile.mkdtemp())
+        ts = self._get_timeseries(cache=cache)
+
+        def get_datapoints(params):
+            query = json.loads(params['query'])
+            values = [[t, t / 1000, 3] for t in range(1000, 10000, 1000)
+                    if query['start'] <= t <= query['end']]
+            return {'tags': [{'name': 'TAG1', 'results': [
+                {'groups': [], 'attributes': {}, 'values': values}]}]}
+        ts._get_datapoints = Mock(side_effect=get_datapoints)
+
+        response = ts.get_datapoints('TAG1', start=2000, end=4000)
+        values = response['tags'][0]['results'][0]['values']
+        self.assertEqual(values, [[2000, 2, 3], [3000, 3, 3], [4000, 4, 3]])
+
+        # Only the ranges on either side should need to be fetched
+        response = ts.get_datapoints('TAG1', start=1000, end=6000,
+                order='desc')
+        values = response['tags'][0]['results'][0]['values']
+        self.assertEqual([value[0] for value in values],
+                [6000, 5000, 4000, 3000, 2000, 1000])
+        queries = [json.loads(call[0][0]['query'])
+                for call in ts._get_datapoints.call_args_list]
+        self.assertEqual([(q['start'], q['end']) for q in queries],
+                [(2000, 4000), (1000, 1999), (4001, 6000)])
+
+        # Fully cached now
+        ts.get_datapoints('TAG1', start=1500, end=5500)
+        self.assertEqual(ts._get_datapoints.call_count, 3)
+
+    def test_cache_aggregations(self):
+        import predix.data.timeseries.cache
+        cache = predix.data.timeseries.cache.QueryCache()
+        ts = self._get_timeseries(cache=cache)
+
+        # One value per interval of how many milliseconds it covers
+        def get_datapoints(params):
+            query = json.loads(params['query'])
+            values = [[t, min(t + 999, query['end']) - t + 1, 3]
+                    for t in range(query['start'], query['end'] + 1, 1000)]
+            return {'tags': [{'name': 'TAG1', 'results': [
+                {'groups': [], 'attributes': {}, 'values': values}]}]}
+        ts._get_datapoints = Mock(side_effect=get_datapoints)
+
+        def get_values(start, end):
+            response = ts.get_datapoints('TAG1', start=start, end=end,
+                    aggregations='avg', sampling=1000)
+            return response['tags'][0]['results'][0]['values']
+
+        def get_fetched():
+            queries = [json.loads(call[0][0]['query'])
+                    for call in ts._get_datapoints.call_args_list]
+            ts._get_datapoints.reset_mock()
+            return [(q['start'], q['end']) for q in queries]
+
+        self.assertEqual([v[1] for v in get_values(1000, 3999)],
+                [1000, 1000, 1000])
+        self.assertEqual(get_fetched(), [(1000, 3999)])
+
+        # Missing ranges are fetched in whole intervals and a last interval
+        # cut short is fetched rather than served from a whole one
+        self.assertEqual([v[1] for v in get_values(1000, 5500)],
+                [1000, 1000, 1000, 1000, 501])
+        self.assertEqual(get_fetched(), [(4000, 5500)])
+        self.assertEqual([v[1] for v in get_values(1000, 2500)],
+                [1000, 501])
+        self.assertEqual(get_fetched(), [(2000, 2500)])
+        get_values(1000, 1999)
+        self.assertEqual(get_fetched(), [])
+
+        # Intervals from another origin are cached separately
+        get_values(1500, 2499)
+        self.assertEqual(get_fetched(), [(1500, 2499)])
+
+        # A summary of the whole range is never cached
+        ts.get_datapoints('TAG1', start=1000, end=1999, aggregations='avg')
+        self.assertFalse(cache.is_cacheable(json.loads(
+            ts._get_datapoints.call_args[0][0]['query'])))
+
+    def test_pipeline(self):
+        import predix.data.timeseries.pipeline as pipeline
+        ws = get_websocket({1: [503, 202], 2: [202], 3: [400]})
+        ingest = pipeline.IngestPipeline(lambda: ws, max_in_flight=3,
+                backoff=0)
+
+        futures = [ingest.send({'messageId': i, 'body': []})
+                for i in (1, 2, 3)]
+        ingest.close()
+
+        self.assertEqual(futures[0].result()['statusCode'], 202)
+        self.assertEqual(futures[1].result()['statusCode'], 202)
+        self.assertRaises(pipeline.IngestError, futures[2].result)
+
+        # Only the message that failed with a retryable status is resent
+        self.assertEqual(sorted(ws.sent), [1, 1, 2, 3])
+
+    def test_pipeline_connect_error(self):
+        import predix.data.timeseries.pipeline as pipeline
+        connect = Mock(side_effect=IOError('unreachable'))
+        ingest = pipeline.IngestPipeline(connect, max_in_flight=2)
+
+        # Failed sends must not use up the messages allowed in flight
+        for i in range(3):
+            self.assertRaises(IOError, ingest.send,
+                    {'messageId': i, 'body': []})
+        self.assertEqual(ingest._in_flight, {})
+
+        ws = get_websocket({3: [202]})
+        connect.side_effect = None
+        connect.return_value = ws
+        future = ingest.send({'messageId': 3, 'body': []})
+        ingest.close()
+        self.assertEqual(future.result()['statusCode'], 202)
+
+    def test_pipeline_reconnect_error(self):
+        import predix.data.timeseries.pipeline as pipeline
+        stale = Mock()
+        stale.send.side_effect = websocket.WebSocketConnectionClosedException()
+        stale.recv.side_effect = websocket.WebSocketConnectionClosedException()
+        ws = get_websocket({1: [202]})
+        connect = Mock(side_effect=[stale, IOError('unreachable'), ws])
+        ingest = pipeline.IngestPipeline(connect, backoff=0)
+
+        # Failing to reconnect is reported by the future, not raised, as
+        # the message is still sent once the connection is back
+        future = ingest.send({'messageId': 1, 'body': []})
+        self.assertEqual(future.result(5)['statusCode'], 202)
+        ingest.close()
+        self.assertEqual(ws.sent, [1])
+
+    def test_pool(self):
+        import predix.data.timeseries.pool as pool
+        sockets = []
+
+        def connect():
+            sockets.append(get_websocket(collections.defaultdict(
+                lambda: [202])))
+            return sockets[-1]
+
+        members = [pool.IngestConnection(connect) for i in range(2)]
+        ingest = pool.IngestPool(members, strategy='round_robin')
+        for i in range(4):
+            ack = json.loads(ingest.send({'messageId': i, 'body': []}))
+            self.assertEqual(ack['messageId'], i)
+
+        self.assertEqual([ws.sent for ws in sockets], [[0, 2], [1, 3]])
+        self.assertEqual(ingest.get_load(), [0, 0])
+
+        # Stale connections are replaced transparently
+        sockets[0].connected = False
+        ingest.send({'messageId': 4, 'body': []})
+        self.assertEqual(len(sockets), 3)
+        self.assertEqual(sockets[2].sent, [4])
+        ingest.close()
+
+    def test_spool(self):
+        import predix.data.timeseries.spool
+        path = tempfile.mkdtemp()
+        spool = predix.data.timeseries.spool.IngestSpool(path,
+                segment_bytes=64, fsync='always')
+        ts = self._get_timeseries(spool=spool)
+
+        # Service is unreachable so messages stay on disk
+        ts._send_to_timeseries = Mock(side_effect=IOError('offline'))
+        for i in range(1, 4):
+            ts.send('TAG1', i, timestamp=i)
+        self.assertEqual(spool.get_metrics()['messages'], 3)
+        self.assertTrue(spool.get_metrics()['segments'] > 1)
+        spool.close()
+
+        # A new spool on the same path replays in order once back online
+        spool = predix.data.timeseries.spool.IngestSpool(path)
+        ts = self._get_timeseries(spool=spool)
+        ts._send_to_timeseries = Mock(return_value='{"statusCode": 202}')
+        ts.replay_spool()
+
+        sent = [call[0][0]['body'][0]['datapoints'][0][1]
+                for call in ts._send_to_timeseries.call_args_list]
+        self.assertEqual(sent, [1, 2, 3])
+        self.assertEqual(spool.get_metrics()['messages'], 0)
+
+    def test_spool_max_bytes(self):
+        import predix.data.timeseries.spool
+        spool = predix.data.timeseries.spool.IngestSpool(tempfile.mkdtemp(),
+                segment_bytes=1, max_bytes=1, fsync='never')
+        for i in range(5):
+            spool.append({'messageId': i, 'body': []})
+
+        # Oldest dropped first leaving only the newest segment
+        metrics = spool.get_metrics()
+        self.assertEqual(metrics['dropped'], 4)
+        self.assertEqual([message['messageId']
+            for (position, message) in spool.peek()], [4])
+
+    def test_auto_flush_datapoints(self):
+        ts = self._get_timeseries(auto_flush=True, auto_flush_datapoints=3,
+                auto_flush_linger_millis=60000)
+        sent = threading.Event()
+        ts._send_to_timeseries = Mock(side_effect=lambda msg: sent.set())
+
+        for i in range(1, 4):
+            ts.queue('TAG1', i, timestamp=i)
+
+        # Threshold reached so worker sends without waiting on linger
+        self.assertTrue(sent.wait(5))
+        ts.queue('TAG1', 4, timestamp=4)
+        ts.close()
+
+        calls = ts._send_to_timeseries.call_args_list
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(calls[0][0][0]['body'][0]['datapoints'],
+                [[1, 1, 1], [2, 2, 1], [3, 3, 1]])
+        self.assertEqual(calls[1][0][0]['body'][0]['datapoints'],
+                [[4, 4, 1]])
+
+    def test_auto_flush_linger(self):
+        ts = self._get_timeseries(auto_flush=True,
+                auto_flush_linger_millis=10)
+        ts._send_to_timeseries = Mock()
+
+        ts.queue('TAG1', 1)
+        ts.flush()
+        self.assertEqual(ts._send_to_timeseries.call_count, 1)
+        self.assertEqual(len(ts._queue), 0)
+        ts.close()
+
+    def test_auto_flush_error(self):
+        ts = self._get_timeseries(auto_flush=True)
+        ts._send_to_timeseries = Mock(side_effect=IOError('closed'))
+
+        ts.queue('TAG1', 1)
+        self.assertRaises(IOError, ts.flush)
+
+        # Failed message is kept rather than dropped
+        self.assertEqual(ts._queue_datapoints, 1)
+        self.assertRaises(IOError, ts.close)
+        self.assertEqual(len(ts._queue), 0)
+
+    def test_auto_flush_ack_error(self):
+        ts = self._get_timeseries(auto_flush=True)
+        future = concurrent.futures.Future()
+        future.set_exception(IOError('rejected'))
+
+        # Failed pipelined message is raised by the next flush
+        ts._on_auto_flush_ack(future)
+        self.assertRaises(IOError, ts.flush)
+        ts.flush()
+        ts.close()
+
+    def test_auto_flush_requeue(self):
+        ts = self._get_timeseries(auto_flush=True,
+                auto_flush_linger_millis=60000)
+        ts._send_to_timeseries = Mock(side_effect=IOError('closed'))
+
+        ts.queue('TAG1', 1, timestamp=1)
+        self.assertRaises(IOError, ts.flush)
+        ts.queue('TAG1', 2, timestamp=2)
+        ts.queue('TAG2', 3, timestamp=3)
+
+        # Retried in order ahead of what was queued after the failure
+        ts._send_to_timeseries = Mock()
+        ts.flush()
+        body = ts._send_to_timeseries.call_args[0][0]['body']
+        self.assertEqual([tag['name'] for tag in body], ['TAG1', 'TAG2'])
+        self.assertEqual(body[0]['datapoints'], [[1, 1, 1], [2, 2, 1]])
+        ts.close()
+
+    def test_auto_flush_spool_error(self):
+        import predix.data.timeseries.spool
+        spool = predix.data.timeseries.spool.IngestSpool(tempfile.mkdtemp(),
+                fsync='never')
+        ts = self._get_timeseries(auto_flush=True, spool=spool)
+        ts._send_to_timeseries = Mock(side_effect=IOError('offline'))
+        ts.queue('TAG1', 1)
+        ts.flush()
+
+        # Spool keeps the message so nothing is requeued, and a replay
+        # error is reported rather than failing on the missing message
+        self.assertEqual(spool.get_metrics()['messages'], 1)
+        self.assertEqual(len(ts._queue), 0)
+        ts.replay_spool = Mock(side_effect=IOError('offline'))
+        ts._spool_retry = 1
+        self.assertTrue(ts._auto_flush_once())
+        self.assertRaises(IOError, ts.flush)
+        ts.close()
+
+    def test_auto_flush_collected(self):
+        ts = self._get_timeseries(auto_flush=True)
+        thread = ts._auto_flush_thread
+
+        # Worker does not keep an unclosed client alive
+        del ts
+        gc.collect()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+
+    @unittest.skipUnless(six.PY3, "asyncio client requires python 3")
+    def test_async_timeseries(self):
+        import asyncio
+        from unittest.mock import AsyncMock
+        try:
+            import predix.data.timeseries.aio
+        except ImportError:
+            self.skipTest("aiohttp is not installed")
+
+        ts = predix.data.timeseries.aio.AsyncTimeSeries(
+                query_uri='https://query.example.com',
+                ingest_uri='wss://ingest.example.com',
+                query_zone_id='query-zone', ingest_zone_id='ingest-zone')
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+
+        def get_datapoints(params):
+            query = json.loads(params['query'])
+            start, end = query['start'], query['end']
+            return {'tags': [{'name': 'TAG1', 'stats': {'rawCount': 2},
+                'results': [{'groups': [], 'attributes': {},
+                    'values': [[start, 1, 3], [end, 2, 3]]}]}]}
+        ts._get_datapoints = AsyncMock(side_effect=get_datapoints)
+
+        response = loop.run_until_complete(ts.get_datapoints('TAG1',
+            start=1000, end=3999, window=1000, max_workers=2))
+        values = response['tags'][0]['results'][0]['values']
+        self.assertEqual(ts._get_datapoints.call_count, 3)
+        self.assertEqual([value[0] for value in values],
+                [1000, 1999, 2000, 2999, 3000, 3999])
+
+        # Acks are matched to the pending send by messageId
+        def send_str(payload):
+            message_id = str(json.loads(payload)['messageId'])
+            ts._acks[message_id].set_result(json.dumps({
+                'messageId': message_id, 'statusCode': 202}))
+        ws = Mock(closed=False)
+        ws.send_str = AsyncMock(side_effect=send_str)
+        ts._get_websocket = AsyncMock(return_value=ws)
+
+        ts.queue('TAG1', 1, timestamp=1)
+        ack = loop.run_until_complete(ts.send())
+        self.assertEqual(json.loads(ack)['statusCode'], 202)
+        self.assertEqual(len(ts._client._queue), 0)
+        self.assertEqual(ts._acks, {})
+
+        # Refreshing an expired token blocks so is kept off the loop
+        threads = []
+        ts.service.uaa.authenticated = True
+        ts.service.uaa.is_expired_token.return_value = True
+        ts.service.uaa.get_token.side_effect = \
+                lambda: threads.append(threading.current_thread())
+        loop.run_until_complete(ts._refresh_token())
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], threading.current_thread())
+
+        # Options that would do nothing from asyncio are rejected
+        for option in ['auto_flush', 'pool_size', 'spool', 'cache',
+                'coalesce']:
+            self.assertRaises(TypeError,
+                    predix.data.timeseries.aio.AsyncTimeSeries,
+                    query_uri='https://query.example.com',
+                    query_zone_id='query-zone', write=False,
+                    **{option: True})
+
+        # Blocking calls of TimeSeries are not inherited
+        self.assertFalse(hasattr(ts, 'iter_datapoints'))
+        self.assertFalse(hasattr(ts, 'replay_spool'))
+
+
+if __name__ == '__main__':
+    if os.getenv('DEBUG'):
+        logging.basicConfig(level=logging.DEBUG)
+
+    unittest.main()
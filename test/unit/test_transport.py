@@ -0,0 +1,87 @@
+import os
+import logging
+import unittest
+
+import six
+if six.PY3:
+    from unittest.mock import Mock, patch
+else:
+    from mock import Mock, patch
+
+import predix.transport
+
+
+class TestTransport(unittest.TestCase):
+    def setUp(self):
+        self.registry = predix.transport.TransportRegistry(pool_maxsize=32,
+                timeout=5)
+        self.addCleanup(self.registry.close)
+
+    def test_get_host(self):
+        self.assertEqual(predix.transport.get_host(
+            'HTTPS://Example.com:443/v1/datapoints?query=1'),
+            'https://example.com:443')
+
+    def test_get_session(self):
+        session = self.registry.get_session('https://a.example.com/v1/tags')
+        self.assertIs(session,
+                self.registry.get_session('https://a.example.com/v1/assets'))
+        self.assertIsNot(session,
+                self.registry.get_session('https://b.example.com/v1/tags'))
+
+        adapter = session.get_adapter('https://a.example.com')
+        self.assertEqual(adapter._pool_maxsize, 32)
+
+        # Sessions are replaced once the settings for the host change
+        self.registry.configure(host='https://a.example.com', pool_maxsize=64,
+                keep_alive=False)
+        replaced = self.registry.get_session('https://a.example.com/v1/tags')
+        self.assertIsNot(session, replaced)
+        self.assertEqual(replaced.get_adapter(
+            'https://a.example.com')._pool_maxsize, 64)
+        self.assertEqual(replaced.headers['Connection'], 'close')
+        self.assertEqual(self.registry.get_settings(
+            'https://b.example.com')['pool_maxsize'], 32)
+
+        self.assertRaises(ValueError, self.registry.configure, pool_size=1)
+
+    def test_request(self):
+        session = self.registry.get_session('https://a.example.com')
+        session.request = Mock()
+
+        self.registry.request('GET', 'https://a.example.com/v1/tags',
+                params={'a': 1})
+        session.request.assert_called_with('GET',
+                'https://a.example.com/v1/tags', params={'a': 1}, timeout=5)
+
+        self.registry.request('GET', 'https://a.example.com/v1/tags',
+                timeout=1)
+        session.request.assert_called_with('GET',
+                'https://a.example.com/v1/tags', timeout=1)
+
+    def test_set_transport(self):
+        transport = Mock()
+        previous = predix.transport.set_transport(transport)
+        try:
+            self.assertEqual(predix.transport.get_transport(), transport)
+
+            predix.transport.request('GET', 'https://a.example.com/v1/tags')
+            transport.request.assert_called_with('GET',
+                    'https://a.example.com/v1/tags')
+
+            predix.transport.create_websocket('wss://a.example.com',
+                    header={'a': 1})
+            transport.create_websocket.assert_called_with(
+                    'wss://a.example.com', header={'a': 1})
+        finally:
+            predix.transport.set_transport(previous)
+
+        self.assertEqual(predix.transport.get_transport(),
+                predix.transport.registry)
+
+
+if __name__ == '__main__':
+    if os.getenv('DEBUG'):
+        logging.basicConfig(level=logging.DEBUG)
+
+    unittest.main()
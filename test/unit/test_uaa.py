@@ -26,7 +26,23 @@ class TestUAA(unittest.TestCase):
         uaa = predix.security.uaa.UserAccountAuthentication()
         self.assertTrue(uaa.is_expired_token(uaa.client))
 
-    @patch('predix.security.uaa.requests.post')
+    def test_is_expired_token_cached(self):
+        import datetime
+        uaa = predix.security.uaa.UserAccountAuthentication()
+
+        expires = datetime.datetime.now() + datetime.timedelta(seconds=60)
+        client = {'expires': expires.isoformat()}
+        self.assertFalse(uaa.is_expired_token(client))
+
+        with patch('datetime.datetime') as mock_datetime:
+            self.assertFalse(uaa.is_expired_token(client))
+            self.assertFalse(mock_datetime.strptime.called)
+
+        client['expires'] = (expires - datetime.timedelta(seconds=120)
+                ).isoformat()
+        self.assertTrue(uaa.is_expired_token(client))
+
+    @patch('predix.transport.request')
     def test_authenticate(self, mock_post):
 
         # mock repsonse
@@ -52,7 +68,7 @@ class TestUAA(unittest.TestCase):
                 'grant_type': 'client_credentials',
                 'client_id': 'masaya'
                 }
-        mock_post.assert_called_with(uri,
+        mock_post.assert_called_with('POST', uri,
                 headers=expected_headers,
                 params=expected_params,
                 )